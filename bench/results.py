@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+
+# Usage: python3 bench/results.py [FILES]
+# Compare the memory held by the former model of the results, one `File`
+# object per file in lists of `Type` objects, with `results.Results`.
+
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from codelines.results import Results
+
+
+ROOTDIR = '/home/user/projects/example'
+LANGS = [('Python', 'py'), ('C', 'c'), ('C', 'h'), ('JavaScript', 'js'),
+         ('JSON', 'json'), ('Markdown', 'md')]
+
+
+class File:
+    __slots__ = ['path', 'size', 'lines']
+
+    def __init__(self, path, size, lines):
+        self.path = path
+        self.size = size
+        self.lines = lines
+
+
+class Type:
+    __slots__ = ['size', 'files', 'lines', 'entries']
+
+    def __init__(self, size, files, lines, entries):
+        self.size = size
+        self.files = files
+        self.lines = lines
+        self.entries = entries
+
+    def insert(self, file):
+        self.entries.append(file)
+        self.size += file.size
+        self.files += 1
+        self.lines += file.lines
+
+
+class Languages(Type):
+    __slots__ = []
+
+    def __init__(self):
+        super().__init__(0, 0, 0, {})
+
+    def insert(self, lang, type, file):
+        types = self.entries.get(lang)
+        if types is None:
+            types = self.entries[lang] = Type(0, 0, 0, {})
+        if type not in types.entries:
+            types.entries[type] = Type(0, 0, 0, [])
+        types.entries[type].insert(file)
+        for totals in (types, self):
+            totals.size += file.size
+            totals.files += 1
+            totals.lines += file.lines
+
+
+def generate(n):
+    for i in range(n):
+        lang, type = LANGS[i % len(LANGS)]
+        path = (f'{ROOTDIR}/src/module{i % 97}/package{i % 13}/'
+                f'file{i}.{type}')
+        yield lang, type, path, 1000 + i % 5000, 30 + i % 300
+
+
+def build_objects(n):
+    languages = Languages()
+    for lang, type, path, size, lines in generate(n):
+        languages.insert(lang, type, File(path, size, lines))
+    return languages
+
+
+def build_columns(n):
+    results = Results(ROOTDIR)
+    for lang, type, path, size, lines in generate(n):
+        results.insert(lang, type, path, size, lines)
+    return results
+
+
+def measure(function, n):
+    gc.collect()
+    objects = len(gc.get_objects())
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(n)
+    elapsed = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    objects = len(gc.get_objects()) - objects
+    del result
+    return size, objects, elapsed
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    print(f'{n} files')
+    print(f'{"":8} {"memory":>10} {"bytes/file":>11} {"gc objects":>11} '
+          f'{"insert":>9}')
+    for name, function in (('objects', build_objects),
+                           ('columns', build_columns)):
+        size, objects, elapsed = measure(function, n)
+        print(f'{name:8} {size / (1 << 20):8.1f}MB {size / n:11.1f} '
+              f'{objects:11} {elapsed * 1000:7.0f}ms')
+
+
+if __name__ == '__main__':
+    main()
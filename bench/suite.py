@@ -0,0 +1,307 @@
+#!/usr/bin/python3
+
+# Usage: python3 bench/suite.py [--scale S] [--rounds N] [--output FILE]
+#                               [--baseline FILE] [--tolerance T] [--keep]
+# Generate synthetic trees, then measure each line counter on their files,
+# and the whole count of each tree, from the walk to the report. The best
+# time of each measure, its throughput and its peak of Python memory are
+# written to a JSON file. With `--baseline`, the times are compared with
+# those of a former output, and the exit status is 1 if one of them is
+# slower by more than the tolerance.
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from codelines import lc
+from codelines.__main__ import package_dir, platform as so_platform
+from codelines.engine import Engine, Task, load_settings
+from codelines.utils import Profiler, Walker
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+SEED = 20240601
+LINE = b'    value = compute(value, index) + 1  # a line of code\n'
+
+
+def write(path, data):
+    with open(path, 'wb') as fd:
+        fd.write(data)
+
+
+def text(rng, lines, final_newline=True):
+    data = b''.join(LINE[:rng.randrange(1, len(LINE))] + b'\n'
+                    for _ in range(lines))
+    return data if final_newline else data.rstrip(b'\n')
+
+
+# Many files of a few lines, 64 per directory
+def make_tiny(top, rng, scale):
+    for i in range(int(20000 * scale)):
+        directory = os.path.join(top, f'd{i // 64}')
+        if not i % 64:
+            os.mkdir(directory)
+        ext = ('py', 'c', 'js', 'md', 'json')[i % 5]
+        write(os.path.join(directory, f'f{i}.{ext}'),
+              text(rng, rng.randrange(0, 4)))
+
+
+# A few files above the size from which the counters map them
+def make_huge(top, rng, scale):
+    block = text(rng, 1 << 14)
+    size = max(int((lc.MMAP_THRESHOLD + (8 << 20)) * scale), 1 << 20)
+    for i in range(3):
+        with open(os.path.join(top, f'huge{i}.c'), 'wb') as fd:
+            for _ in range(size // len(block) + 1):
+                fd.write(block)
+
+
+# Long chains of directories, with a file at each level
+def make_deep(top, rng, scale):
+    for chain in range(max(int(20 * scale), 1)):
+        directory = os.path.join(top, f'chain{chain}')
+        for level in range(64):
+            os.mkdir(directory)
+            write(os.path.join(directory, f'level{level}.py'),
+                  text(rng, rng.randrange(1, 50)))
+            directory = os.path.join(directory, 'sub')
+
+
+# Files whose last line has no newline, down to files of one byte
+def make_no_newline(top, rng, scale):
+    for i in range(int(5000 * scale)):
+        data = text(rng, i % 40 + 1, final_newline=False)
+        write(os.path.join(top, f'f{i}.txt'), data[:1] if i % 10 else data)
+
+
+# Random bytes, the counters count their newlines like any other byte
+def make_binary(top, rng, scale):
+    for i in range(int(200 * scale)):
+        size = rng.randrange(1 << 10, 1 << 20)
+        write(os.path.join(top, f'blob{i}.bin'),
+              rng.getrandbits(size * 8).to_bytes(size, 'little'))
+
+
+TREES = {
+    'tiny': make_tiny,
+    'huge': make_huge,
+    'deep': make_deep,
+    'no_newline': make_no_newline,
+    'binary': make_binary,
+}
+
+
+def make_trees(top, scale):
+    trees = {}
+    for name, make in TREES.items():
+        tree = os.path.join(top, name)
+        os.mkdir(tree)
+        make(tree, random.Random(f'{SEED}-{name}'), scale)
+        entries = list(Walker(tree))
+        trees[name] = {
+            'path': tree,
+            'paths': [entry.path for entry in entries],
+            'files': len(entries),
+            'bytes': sum(entry.size for entry in entries),
+        }
+    return trees
+
+
+# The counters measured, each counts a list of paths into a list of
+# `(lines, size, nanoseconds)`. Any other counter of `lc` is measured once
+# added here
+def counters():
+    engines = {}
+    lc.load_shared_object(os.path.join(package_dir, 'so',
+                                       f'lc.{so_platform}.so'))
+    lc.set_encoding('utf-8')
+    if lc.module is not None:
+        engines['native'] = lc.count_many
+    engines['python'] = lc.py_count_many
+    # The code, comment and blank lines, with the comment syntax of C
+    syntax = lc.CommentSyntax(['//'], [['/*', '*/']], '"\'')
+    if hasattr(lc.module, 'lines_classify_many'):
+        engines['native-sloc'] = lambda paths: lc.classify_many(
+            paths, [syntax] * len(paths))
+    engines['python-sloc'] = lambda paths: lc.py_classify_many(
+        paths, [syntax] * len(paths))
+    return engines
+
+
+# Return the best time of `function` over `rounds`, its result, and the
+# peak of the Python memory allocated by one more traced round
+def measure(function, rounds):
+    best, result = float('inf'), None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, result, peak
+
+
+def throughput(seconds, files, size):
+    seconds = max(seconds, 1e-9)
+    return {
+        'seconds': round(seconds, 6),
+        'files_per_second': round(files / seconds, 1),
+        'mb_per_second': round(size / seconds / (1 << 20), 2),
+    }
+
+
+def bench_counters(trees, rounds):
+    measures = {}
+    for engine, count_many in counters().items():
+        measures[engine] = {}
+        for name, tree in trees.items():
+            seconds, results, peak = measure(
+                lambda: count_many(tree['paths']), rounds)
+            measures[engine][name] = dict(
+                throughput(seconds, tree['files'], tree['bytes']),
+                lines=sum(max(result[0], 0) for result in results),
+                peak_python_bytes=peak)
+    return measures
+
+
+def count_tree(engine, tree):
+    profiler = Profiler()
+    results = engine.count_lines(Task(), tree, engine.walk(tree), profiler)
+    with profiler.measure('render', results.files):
+        report = [results.report()]
+        report.extend(results.report_language(lang)
+                      for lang in results.langs)
+    return results, profiler
+
+
+def bench_pipeline(trees, rounds, processes):
+    settings = load_settings(
+        os.path.join(package_dir, 'CodeLines.sublime-settings'))
+    # Every file is counted, and none is cached
+    settings.update(exclude_hidden_files=False, use_ignore_files=False,
+                    ignored_syntaxes=[], syntaxes=[], skip_binary_files=False)
+    engine = Engine(settings, processes=processes)
+    measures = {}
+    for name, tree in trees.items():
+        seconds, (results, profiler), peak = measure(
+            lambda: count_tree(engine, tree['path']), rounds)
+        measures[name] = dict(
+            throughput(seconds, tree['files'], tree['bytes']),
+            lines=results.lines,
+            peak_python_bytes=peak,
+            stages=profiler.summary()['stages'])
+    return measures
+
+
+# Yield `(name, baseline seconds, seconds)` of the measures slower than
+# the `baseline` by more than `tolerance`
+def regressions(output, baseline, tolerance):
+    def seconds(measures, prefix=()):
+        for key, value in measures.items():
+            if isinstance(value, dict) and 'seconds' in value:
+                yield prefix + (key,), value['seconds']
+            elif isinstance(value, dict) and key != 'stages':
+                yield from seconds(value, prefix + (key,))
+
+    former = dict(seconds({k: baseline.get(k, {})
+                           for k in ('counters', 'pipeline')}))
+    for name, new in seconds({k: output[k]
+                              for k in ('counters', 'pipeline')}):
+        old = former.get(name)
+        if old and new > old * (1 + tolerance):
+            yield '/'.join(name), old, new
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=float, default=1.0)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--jobs', type=int, default=0)
+    parser.add_argument('--output', default='bench.json')
+    parser.add_argument('--baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--keep', action='store_true')
+    args = parser.parse_args()
+
+    top = tempfile.mkdtemp(prefix='codelines-suite-')
+    try:
+        start = time.perf_counter()
+        trees = make_trees(top, args.scale)
+        print(f'trees generated in {time.perf_counter() - start:.1f}s')
+        output = {
+            'machine': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+            },
+            'options': {'scale': args.scale, 'rounds': args.rounds,
+                        'jobs': args.jobs},
+            'trees': {name: {'files': tree['files'], 'bytes': tree['bytes']}
+                      for name, tree in trees.items()},
+            'counters': bench_counters(trees, args.rounds),
+            'pipeline': bench_pipeline(trees, args.rounds, args.jobs),
+        }
+        if resource is not None:
+            # Kilobytes on Linux, bytes on macOS
+            output['machine']['max_rss'] = resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss
+    finally:
+        if args.keep:
+            print(f'trees kept in {top}')
+        else:
+            shutil.rmtree(top)
+
+    print(f'{"":20} {"files":>7} {"MB":>8} {"seconds":>9} {"files/s":>10} '
+          f'{"MB/s":>8} {"peak KB":>8}')
+    rows = [(f'{engine}/{name}', measure)
+            for engine, trees_ in output['counters'].items()
+            for name, measure in trees_.items()]
+    rows += [(f'pipeline/{name}', measure)
+             for name, measure in output['pipeline'].items()]
+    for label, measure in rows:
+        tree = output['trees'][label.split('/')[1]]
+        print(f'{label:20} {tree["files"]:7} '
+              f'{tree["bytes"] / (1 << 20):8.1f} {measure["seconds"]:9.4f} '
+              f'{measure["files_per_second"]:10.0f} '
+              f'{measure["mb_per_second"]:8.1f} '
+              f'{measure["peak_python_bytes"] >> 10:8}')
+    # The counters must agree on every tree
+    for name in output['trees']:
+        lines = {engine: output['counters'][engine][name]['lines']
+                 for engine in output['counters']}
+        lines['pipeline'] = output['pipeline'][name]['lines']
+        if len(set(lines.values())) != 1:
+            print(f'{name}: the counters disagree: {lines}')
+
+    with open(args.output, 'w') as fd:
+        json.dump(output, fd, indent=2)
+    print(f'written to {args.output}')
+
+    if args.baseline:
+        with open(args.baseline) as fd:
+            baseline = json.load(fd)
+        slower = list(regressions(output, baseline, args.tolerance))
+        for name, old, new in slower:
+            print(f'regression: {name} {old:.4f}s -> {new:.4f}s '
+                  f'({new / old:.2f}x)')
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+
+# Usage: python3 bench/walk.py [DEPTH] [FANOUT] [FILES_PER_DIR]
+# Compare the former `os.walk` walking followed by one `os.stat` per file
+# with `utils.Walker` on a deep synthetic tree.
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from codelines.utils import Walker
+
+
+def make_tree(top, depth, fanout, files_per_dir):
+    for i in range(files_per_dir):
+        with open(os.path.join(top, f'f{i}.py'), 'w') as fd:
+            fd.write('pass\n' * i)
+    if depth:
+        for i in range(fanout):
+            sub = os.path.join(top, f'd{i}')
+            os.mkdir(sub)
+            make_tree(sub, depth - 1, fanout, files_per_dir)
+
+
+def walk_with_os_walk(top):
+    sizes = []
+    for root, dirs, files in os.walk(top):
+        for file in files:
+            if not file[0] == '.':
+                path = os.path.join(root, file)
+                sizes.append(os.stat(path).st_size)
+        dirs[:] = [d for d in dirs if not d[0] == '.']
+    return sizes
+
+
+def walk_with_walker(top):
+    return [entry.size for entry in Walker(top, exclude_hidden=True)]
+
+
+def measure(function, top, rounds=5):
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = function(top)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    depth, fanout, files_per_dir = (list(map(int, sys.argv[1:4]))
+                                    or [6, 3, 8])
+    top = tempfile.mkdtemp(prefix='codelines-bench-')
+    try:
+        make_tree(top, depth, fanout, files_per_dir)
+        old, old_sizes = measure(walk_with_os_walk, top)
+        new, new_sizes = measure(walk_with_walker, top)
+        assert old_sizes == new_sizes
+        print(f'{len(new_sizes)} files, depth {depth}, fanout {fanout}')
+        print(f'os.walk + os.stat: {old * 1000:8.1f}ms')
+        print(f'Walker:            {new * 1000:8.1f}ms ({old / new:.2f}x)')
+    finally:
+        shutil.rmtree(top)
+
+
+if __name__ == '__main__':
+    main()
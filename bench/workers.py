@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+
+# Usage: python3 bench/workers.py [FILES] [LINES] [WORKERS...]
+# Compare the whole count of a synthetic tree, files cached by the OS,
+# with one worker thread and with more, by `max_workers`, and with as many
+# worker processes. The speedup is that over one worker thread, it can
+# only show on a machine with several CPUs.
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from codelines import lc
+from codelines.__main__ import package_dir, platform
+from codelines.engine import Engine, Task, load_settings
+from codelines.utils import Profiler
+
+LINE = b'    value = compute(value, index) + 1  # a line of code\n'
+
+
+def make_tree(top, files, lines):
+    for i in range(files):
+        directory = os.path.join(top, f'd{i // 100}')
+        if not i % 100:
+            os.mkdir(directory)
+        with open(os.path.join(directory, f'f{i}.py'), 'wb') as fd:
+            fd.write(LINE * lines)
+
+
+def measure(settings, top, processes=0, rounds=3):
+    engine = Engine(settings, processes=processes)
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        results = engine.count_lines(Task(), top, engine.walk(top),
+                                     Profiler())
+        best = min(best, time.perf_counter() - start)
+    return best, results.lines
+
+
+def main():
+    files, lines, *workers = (list(map(int, sys.argv[1:]))
+                              or [20000, 200])
+    workers = workers or sorted({1, 2, 4, os.cpu_count() or 1})
+    lc.load_shared_object(os.path.join(package_dir, 'so',
+                                       f'lc.{platform}.so'))
+    settings = load_settings(
+        os.path.join(package_dir, 'CodeLines.sublime-settings'))
+    settings.update(cache=False)
+    top = tempfile.mkdtemp(prefix='codelines-bench-')
+    try:
+        make_tree(top, files, lines)
+        print(f'{files} files of {lines} lines, {os.cpu_count()} CPUs, '
+              f'native counter: {lc.module is not None}')
+        base, expected = measure(dict(settings, max_workers=1), top)
+        for n in workers:
+            for kind, processes in (('threads', 0), ('processes', n)):
+                if kind == 'processes' and n == 1:
+                    continue
+                seconds, counted = measure(dict(settings, max_workers=n),
+                                           top, processes)
+                assert counted == expected
+                print(f'{n:3} {kind:9}: {seconds * 1000:8.1f}ms '
+                      f'({base / seconds:.2f}x)')
+    finally:
+        shutil.rmtree(top)
+
+
+if __name__ == '__main__':
+    main()
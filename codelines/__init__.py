@@ -0,0 +1,10 @@
+# The core of CodeLines, it does not depend on Sublime Text, the plugin is
+# a user interface over it, and so is the command line of `__main__.py`
+from .engine import CountProgress, Engine, Task, load_settings
+from .languages import LanguageDecider, find_syntax
+from .results import Pages, Results
+from .utils import Profiler, Walker, strsize
+
+__all__ = ['CountProgress', 'Engine', 'LanguageDecider', 'Pages', 'Profiler',
+           'Results', 'Task', 'Walker', 'find_syntax', 'load_settings',
+           'strsize']
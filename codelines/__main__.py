@@ -0,0 +1,195 @@
+import os
+import re
+import sys
+import time
+import argparse
+from os.path import relpath
+
+from . import lc
+from .engine import Engine, Task, load_settings
+from .export import exporters
+from .snapshots import Snapshot, SnapshotDiff
+from .utils import Profiler
+
+
+package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+platform = {
+    'darwin': 'osx',
+    'linux': 'linux',
+    'win32': 'windows'
+}.get(sys.platform, None)
+
+
+def cache_dir():
+    if platform == 'windows':
+        base = os.environ.get('LOCALAPPDATA', os.path.expanduser('~'))
+    elif platform == 'osx':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME',
+                              os.path.expanduser('~/.cache'))
+    return os.path.join(base, 'CodeLines')
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog='python -m codelines',
+        description='Count the lines of the files in directories, by '
+                    'language and by file type.')
+    parser.add_argument('paths', nargs='*', metavar='PATH',
+                        help='the directories or files to count')
+    parser.add_argument('--settings', metavar='FILE',
+                        help='a settings file, its keys override those of '
+                             'CodeLines.sublime-settings')
+    parser.add_argument('--pattern', metavar='REGEX',
+                        help='only count the paths matching REGEX')
+    parser.add_argument('--jobs', '-j', type=int, default=0, metavar='N',
+                        help='count with N processes, instead of threads')
+    parser.add_argument('--sloc', action='store_true',
+                        help='count the code, comment and blank lines')
+    parser.add_argument('--merge', action='store_true',
+                        help='count the directories into a single report, '
+                             'with a column of lines for each of them')
+    parser.add_argument('--sizes', action='store_true',
+                        help='print the sizes of the subfolders and the '
+                             'largest files instead of counting the lines')
+    parser.add_argument('--export', choices=list(exporters),
+                        help='also write the files and the languages counted '
+                             'as they are counted, in this format')
+    parser.add_argument('--output', metavar='FILE',
+                        help='the file exported, by default a new file of '
+                             'the export directory')
+    parser.add_argument('--snapshots', action='store_true',
+                        help='list the snapshots of the former counts')
+    parser.add_argument('--diff', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two snapshots, without counting')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='neither read nor write the cached results')
+    parser.add_argument('--types', action='store_true',
+                        help='also print the files of each language')
+    parser.add_argument('--profile', action='store_true',
+                        help='also print the time spent in each stage')
+    args = parser.parse_args(argv)
+    if not (args.paths or args.snapshots or args.diff):
+        parser.error('the following arguments are required: PATH')
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    settings = load_settings(
+        os.path.join(package_dir, 'CodeLines.sublime-settings'))
+    if args.settings:
+        settings.update(load_settings(args.settings))
+    if args.sloc:
+        settings['sloc'] = True
+    lc.load_shared_object(
+        os.path.join(package_dir, 'so', f'lc.{platform}.so'))
+    engine = Engine(settings,
+                    cache_dir=None if args.no_cache else cache_dir(),
+                    processes=args.jobs,
+                    log=lambda *args: print('CodeLines:', *args,
+                                            file=sys.stderr)
+                    if settings.get('debug') else None)
+    if platform == 'windows' and settings.get('use_unix_style_path', True):
+        normalize = lambda path: path.replace('\\', '/')
+    else:
+        normalize = lambda path: path
+    match = args.pattern and re.compile(args.pattern).match
+    if args.snapshots:
+        for snapshot in Snapshot.list(os.path.join(cache_dir(), 'snapshots')):
+            print(f'{snapshot.path}\t{snapshot.strftime()}\t'
+                  f'{snapshot.files} files\t{snapshot.lines} lines\t'
+                  f'{snapshot.rootdir}')
+    if args.diff:
+        old, new = map(Snapshot.open, args.diff)
+        if old is None or new is None:
+            print('CodeLines: The snapshot can not be read', file=sys.stderr)
+            return 1
+        print(f'ROOTDIR: {normalize(new.rootdir)}')
+        print(SnapshotDiff(old.load(), new.load()).report(
+            settings.get('page_size', 1000) or len(old.paths) + len(new.paths)))
+
+    # Return 130 if interrupted, 1 if the export can not be written, None
+    # otherwise
+    # Only the counts of all the files of a single directory are saved as
+    # snapshots, those of a pattern or of several directories are not
+    def count(rootdir, filepaths, roots=(), snapshot=False):
+        cl_time = time.strftime("%Y/%m/%d/%H:%M")
+        task, profiler = Task(), Profiler()
+        try:
+            exporter = args.export and engine.open_exporter(
+                rootdir, args.export, args.output)
+        except OSError as e:
+            print(f'CodeLines: Can not export the count: {e}',
+                  file=sys.stderr)
+            return 1
+        try:
+            results = engine.count_lines(task, rootdir, filepaths, profiler,
+                                         roots=roots, exporter=exporter)
+        except KeyboardInterrupt:
+            task.cancel()
+            return 130
+        print(f'ROOTDIR: {rootdir}\nTime: {cl_time}\n\n')
+        if not results:
+            message = 'No matching files'
+            if task.stopped is not None:
+                message = f'Stopped: {task.stopped}, no file counted'
+            print(message)
+            return None
+        if task.stopped is not None:
+            print(f'Stopped: {task.stopped}, the results are partial')
+        elif snapshot:
+            engine.save_snapshot(results)
+        with profiler.measure('render', results.files):
+            print(results.report())
+        if args.types:
+            for lang in results.langs:
+                print(f'\n{lang}\n')
+                with profiler.measure('render'):
+                    print(results.report_language(lang, normalize))
+        if args.profile:
+            print()
+            print(profiler.report(
+                lambda path: normalize(relpath(path, rootdir)
+                                       if rootdir else path)))
+        return None
+
+    status = 0
+    folders = []
+    for path in args.paths:
+        path = os.path.abspath(path)
+        if os.path.isfile(path):
+            print(f'The file {path} has {lc.count(path)} lines')
+            continue
+        if not os.path.isdir(path):
+            print(f'CodeLines: No such file or directory: {path}',
+                  file=sys.stderr)
+            status = 1
+            continue
+        rootdir = normalize(path)
+        if args.sizes:
+            task = Task()
+            try:
+                sizes = engine.measure_sizes(task, path)
+            except KeyboardInterrupt:
+                task.cancel()
+                return 130
+            print(f'ROOTDIR: {rootdir}\n{sizes.report()}')
+            continue
+        if args.merge:
+            folders.append(rootdir)
+            continue
+        status = count(rootdir, engine.walk(rootdir, match),
+                       snapshot=not match) or status
+        if status == 130:
+            return status
+    if folders:
+        rootdir, roots, walker = engine.walk_roots(folders, match)
+        status = count(normalize(rootdir), walker, roots,
+                       snapshot=len(roots) == 1 and not match) or status
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
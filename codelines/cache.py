@@ -0,0 +1,127 @@
+import os
+import glob
+import pickle
+import tempfile
+import hashlib
+
+
+# Per root directory store of the results of previous counts.
+#
+# Each path maps to `[mtime_ns, size, inode, lang, type, lines,
+# generation, kinds]`. An entry is valid only while the first three fields
+# still match the stat of the file, as recorded by its `utils.FileEntry`.
+# `generation` is the number of the last count that used the entry, it
+# serves to evict the least recently used entries. `kinds` is the
+# `(code, comments, blanks)` of the file, or None if they were not counted.
+# The lines of a binary file skipped are `lc.BINARY`.
+class ResultCache:
+    __slots__ = ['path', 'fingerprint', 'max_entries',
+                 'entries', 'generation', 'hits', 'misses']
+
+    version = 2
+    suffix = '.cache'
+    # Index of the generation in an entry
+    generation_field = 6
+    # Number of root directories whose results are kept
+    max_stores = 16
+
+    def __init__(self, directory, rootdir, fingerprint, max_entries):
+        name = hashlib.sha1(rootdir.encode('utf-8', 'surrogateescape'))
+        self.path = os.path.join(directory, name.hexdigest() + self.suffix)
+        self.fingerprint = fingerprint
+        self.max_entries = max_entries
+        self.entries, self.generation = self.load()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as fd:
+                header, generation, entries = pickle.load(fd)
+            if header == (self.version, self.fingerprint):
+                return entries, generation + 1
+        except Exception:
+            # Missing, truncated or written by another version
+            pass
+        return {}, 1
+
+    # Return `(lang, type, lines, kinds)` if `path` is unchanged, None
+    # otherwise
+    def get(self, path, file):
+        entry = self.entries.get(path)
+        if (entry is not None and entry[0] == file.mtime_ns
+                and entry[1] == file.size and entry[2] == file.inode):
+            entry[self.generation_field] = self.generation
+            self.hits += 1
+            return entry[3], entry[4], entry[5], entry[7]
+        self.misses += 1
+        return None
+
+    def put(self, path, file, lang, type, lines, kinds=None):
+        self.entries[path] = [file.mtime_ns, file.size, file.inode,
+                              lang, type, lines, self.generation, kinds]
+
+    def save(self):
+        entries = self.entries
+        if len(entries) > self.max_entries:
+            field = self.generation_field
+            recent = sorted(entries.items(), key=lambda item: item[1][field])
+            entries = dict(recent[-self.max_entries:])
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        # Write a temporary file first, so that an interrupted write
+        # never leaves a truncated store behind. Its name is unique, for
+        # two counts of the same directory, in the threads of the same
+        # process, not to write the same file
+        fd, temp = tempfile.mkstemp(
+            suffix='.tmp', prefix=os.path.basename(self.path) + '.',
+            dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as fd:
+                header = (self.version, self.fingerprint)
+                pickle.dump((header, self.generation, entries), fd,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp, self.path)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+        self.evict(directory)
+
+    @classmethod
+    def evict(cls, directory):
+        stores = glob.glob(os.path.join(directory, '*' + cls.suffix))
+        stores.sort(key=os.path.getmtime, reverse=True)
+        for store in stores[cls.max_stores:]:
+            os.remove(store)
+
+    @classmethod
+    def clear(cls, directory):
+        stores = glob.glob(os.path.join(directory, '*' + cls.suffix))
+        for store in stores:
+            os.remove(store)
+        return len(stores)
+
+
+# Per root directory store of the listings of the directories measured by
+# `sizes.measure`. Each directory maps to `[mtime_ns, listing, generation]`,
+# and its listing is valid while its mtime is unchanged. The mtime of a
+# directory only changes when entries are added, removed or renamed in it,
+# so a file rewritten in place keeps its former size until then.
+class SizeCache(ResultCache):
+    __slots__ = []
+
+    version = 1
+    suffix = '.sizes'
+    generation_field = 2
+
+    # Return the `(mtime_ns, listing)` of `path`, if it is known
+    def get(self, path):
+        entry = self.entries.get(path)
+        return entry and (entry[0], entry[1])
+
+    def hit(self, path):
+        self.entries[path][2] = self.generation
+        self.hits += 1
+
+    def put(self, path, mtime_ns, listing):
+        self.entries[path] = [mtime_ns, listing, self.generation]
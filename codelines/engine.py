@@ -0,0 +1,530 @@
+import os
+import re
+import json
+import time
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from . import lc
+from .cache import ResultCache, SizeCache
+from .gitindex import IndexWalker, find_repository
+from .ignore import Ignore
+from .languages import LanguageDecider, find_syntax
+from .results import Results
+from .export import open_exporter
+from .sizes import measure
+from .snapshots import Snapshot
+from .watch import WatchIndex
+from .utils import (RootsWalker, ThreadedBatches, Walker, distinct_roots,
+                    strsize)
+
+
+# Read a settings file of Sublime Text, that is JSON with comments and
+# trailing commas
+def load_settings(path):
+    with open(path, encoding='utf-8') as fd:
+        text = fd.read()
+    tokens = re.compile(r'''("(?:\\.|[^"\\])*")|//[^\n]*|/\*.*?\*/|,(\s*[]}])''',
+                        re.S)
+    return json.loads(tokens.sub(
+        lambda m: m.group(1) or m.group(2) or '', text))
+
+
+# The state of a count, shared by the thread running it and those that may
+# stop it. `progress` is the `CountProgress` of the count once started
+class Task:
+    def __init__(self):
+        # Why the task stopped before the end, if it did
+        self.stopped = None
+        self.cancelled = lc.CancelFlag()
+        self.progress = None
+
+    # Ask the task to stop, `interrupt` also stops the files being counted
+    def stop(self, reason, interrupt=False):
+        if self.stopped is None:
+            self.stopped = reason
+        if interrupt:
+            self.cancelled.set()
+
+    def cancel(self):
+        self.stop('cancelled', interrupt=True)
+
+
+# Counters of a count in progress, they are written by the thread running
+# the count and only read, at a fixed rate, by the one showing progress
+class CountProgress:
+    __slots__ = ['discovered', 'processed', 'counted', 'bytes', 'start']
+
+    def __init__(self, discovered):
+        self.discovered = discovered
+        self.processed = 0
+        self.counted = 0
+        self.bytes = 0
+        self.start = time.perf_counter()
+
+    def report(self):
+        elapsed = max(time.perf_counter() - self.start, 1e-3)
+        discovered = self.discovered.produced
+        processed = self.processed
+        report = (f'{self.counted}/{discovered} files, '
+                  f'{processed / elapsed:.0f} files/s, '
+                  f'{self.bytes / elapsed / (1 << 20):.1f} MB/s')
+        # All the files are known only once the walk is over
+        if self.discovered.done and processed:
+            eta = int((discovered - processed) * elapsed / processed)
+            report += f', ETA {eta // 60}:{eta % 60:02}'
+        return report
+
+
+# Classify the `files`, a list of `(path, name, size)`, and count the lines
+# of those in a language. Return a `[lang, type, lines, kinds]` row for
+# each file, lang is None if the file is ignored, and lines is None if the
+# file was interrupted by `cancel`. With `syntaxes`, the `CommentSyntax` of
+# each language, kinds is the `(code, comments, blanks)` of the file, and
+# None otherwise. With `sniff`, the lines of the files that look binary
+# are `lc.BINARY`. The rows come with the time spent classifying and
+# counting, the paths counted and the results of the counter.
+def classify_and_count(decider, files, cancel=None, syntaxes=None,
+                       sniff=False):
+    start = time.perf_counter()
+    rows, counted, paths = [], [], []
+    kinds = None if syntaxes is None else (0, 0, 0)
+    for path, name, size in files:
+        lang = decider.from_name(path)
+        head = None
+        if lang is decider.unknown:
+            # The first block tells the language, and whether the file is
+            # binary, it is read once for both
+            head = lc.read_head(path) if size else b''
+            lang = decider.from_first_line(path, decider.first_line(head))
+        if not lang:
+            rows.append([None, None, 0, None])
+            continue
+        ext = os.path.splitext(name)[1].lstrip('.')
+        row = [lang, ext if ext else name, 0, kinds]
+        rows.append(row)
+        # Empty files are not opened, nor are special files such as fifos
+        if not size:
+            continue
+        if head is not None and sniff and lc.is_binary(head):
+            row[2] = lc.BINARY
+        elif head is None or len(head) == lc.SNIFF_SIZE:
+            counted.append(row)
+            paths.append(path)
+        # The whole file is in its first block
+        elif syntaxes is None:
+            row[2] = lc.py_count_bytes(head)
+        else:
+            row[2], row[3] = lc.py_classify_chunks([head],
+                                                   syntaxes.get(lang))
+    classified = time.perf_counter()
+    if syntaxes is None:
+        results = lc.count_many(paths, cancel, sniff)
+    else:
+        results = lc.classify_many(
+            paths, [syntaxes.get(row[0]) for row in counted], cancel, sniff)
+    for row, result in zip(counted, results):
+        lines = result[0]
+        if lines == lc.BINARY:
+            row[2] = lines
+        elif lines < 0 and cancel is not None and cancel.is_set():
+            row[2] = None
+        else:
+            row[2] = max(lines, 0)
+            if syntaxes is not None:
+                row[3] = result[3]
+    profile = (classified - start, time.perf_counter() - classified,
+               paths, results)
+    return rows, profile
+
+
+# The language decider, the comment syntaxes and whether binary files are
+# skipped, of a worker process
+worker_decider = None
+worker_syntaxes = None
+worker_sniff = False
+
+
+def init_worker(syntaxes, ignored_syntaxes, aliases, comment_syntaxes,
+                sniff, encoding, so):
+    global worker_decider, worker_syntaxes, worker_sniff
+    worker_decider = LanguageDecider.create(syntaxes, ignored_syntaxes,
+                                            aliases)
+    worker_syntaxes = None
+    worker_sniff = sniff
+    if comment_syntaxes is not None:
+        worker_syntaxes = load_comment_syntaxes(comment_syntaxes)
+    # Without the shared object of the parent, this falls back to Python
+    lc.load_shared_object(so or '')
+    lc.set_encoding(encoding)
+
+
+def classify_and_count_in_worker(files):
+    return classify_and_count(worker_decider, files,
+                              syntaxes=worker_syntaxes, sniff=worker_sniff)
+
+
+# From the "comment_syntaxes" setting to the `CommentSyntax` of each
+# language
+def load_comment_syntaxes(settings):
+    return {lang: lc.CommentSyntax.from_settings(syntax)
+            for lang, syntax in settings.items()}
+
+
+# The walk and the count of directories, as configured by `settings`, a
+# mapping with the keys of `CodeLines.sublime-settings`. The syntaxes are
+# found by `find_syntax(file, first_line)`. With `processes` above 1, the
+# files are classified and counted by that many processes, which requires
+# the default `find_syntax`, otherwise by threads.
+class Engine:
+    # Number of files counted by one call of the native counter
+    batch_size = 256
+    # Max number of batches waiting between two stages of a count
+    max_batches = 64
+    # Max seconds between two checks of a cancel while walking
+    poll_interval = 0.1
+
+    def __init__(self, settings, find_syntax=find_syntax, cache_dir=None,
+                 processes=0, log=None):
+        lc.set_encoding(settings.get('encoding', 'utf-8'))
+        self.exclude_hidden_files = settings.get('exclude_hidden_files', True)
+        self.follow_symlinks = settings.get('follow_symlinks', False)
+        self.use_ignore_files = settings.get('use_ignore_files', True)
+        self.exclude_globs = settings.get('exclude_globs', [])
+        self.use_git_index = settings.get('use_git_index', False)
+        self.max_files = settings.get('max_files', 0)
+        self.max_bytes = settings.get('max_bytes', 0)
+        self.max_seconds = settings.get('max_seconds', 0)
+        self.max_workers = (settings.get('max_workers', 0)
+                            or os.cpu_count() or 1)
+        self.processes = processes
+        self.use_cache = settings.get('cache', True) and cache_dir is not None
+        self.cache_max_entries = settings.get('cache_max_entries', 500000)
+        self.cache_dir = cache_dir
+        # Format of the files written along each count, if any
+        self.export_format = settings.get('export_format', '')
+        self.export_directory = settings.get('export_directory', '')
+        # Number of snapshots kept for each root directory
+        self.snapshots = settings.get('snapshots', 10)
+        # Number of largest folders and files reported by `measure_sizes`
+        self.size_top = settings.get('size_top', 10)
+        # Listing directories mostly waits for the file system, the default
+        # of `ThreadPoolExecutor` is used unless `max_workers` is set
+        self.size_workers = settings.get('max_workers', 0) or None
+        self.log = log or (lambda *args: None)
+        syntaxes = settings.get('syntaxes', [])
+        ignored_syntaxes = settings.get('ignored_syntaxes', [])
+        aliases_ = settings.get('aliases', {})
+        aliases = {}
+        for syntax in aliases_:
+            for aliase in aliases_[syntax]:
+                aliases[aliase] = syntax
+        self.language_decider = LanguageDecider.create(
+            syntaxes, ignored_syntaxes, aliases, find_syntax)
+        # Count the code, comment and blank lines instead of the lines only
+        self.sloc = settings.get('sloc', False)
+        comment_syntaxes = (settings.get('comment_syntaxes', {})
+                            if self.sloc else None)
+        self.comment_syntaxes = None
+        if self.sloc:
+            self.comment_syntaxes = load_comment_syntaxes(comment_syntaxes)
+        # Skip the files whose first block looks binary
+        self.skip_binary_files = settings.get('skip_binary_files', True)
+        self.worker_args = (syntaxes, ignored_syntaxes, aliases,
+                            comment_syntaxes, self.skip_binary_files,
+                            settings.get('encoding', 'utf-8'))
+        # Cached results are only valid for the same language settings
+        self.fingerprint = hashlib.sha1(json.dumps(
+            [syntaxes, ignored_syntaxes, aliases_, comment_syntaxes,
+             self.skip_binary_files],
+            sort_keys=True).encode()).hexdigest()
+
+    def walk(self, top, match=None, exclude_hidden=None, ignore=True):
+        # The paths walked start with `top` as the rules of the ignore
+        # files see it, whatever its separators
+        top = os.path.normpath(top)
+        if exclude_hidden is None:
+            exclude_hidden = self.exclude_hidden_files
+        if ignore and self.use_git_index:
+            # The files tracked are listed whatever the ignore files say
+            globs = self.exclude_globs and Ignore.for_top(
+                top, self.exclude_globs, use_ignore_files=False)
+            walker = IndexWalker.open(top, exclude_hidden, match,
+                                      globs or None)
+            if walker is not None:
+                self.log(f'list the files of {top} from the git index')
+                return walker
+        if ignore and (self.use_ignore_files or self.exclude_globs):
+            ignore = Ignore.for_top(top, self.exclude_globs,
+                                    self.use_ignore_files)
+        else:
+            ignore = None
+        return Walker(top, exclude_hidden, match, self.follow_symlinks,
+                      ignore)
+
+    # Return whether the walk of `top` yields `path`, a file under it, at a
+    # cost that depends on the depth of `path` only. A file of the git
+    # index walked is never told to be, as it is only yielded once tracked
+    def walks(self, top, path):
+        if self.use_git_index and find_repository(top) is not None:
+            return False
+        return self.walk(top).walks(path)
+
+    # Return the directory holding all the `roots`, or '' if there is none,
+    # and a walker of the files of the roots that do not overlap
+    def walk_roots(self, roots, match=None):
+        roots = distinct_roots(roots)
+        try:
+            rootdir = os.path.commonpath(roots)
+        except ValueError:
+            # On different drives
+            rootdir = ''
+        walkers = [self.walk(root, match) for root in roots]
+        return rootdir, roots, RootsWalker(walkers, self.batch_size,
+                                           self.max_batches)
+
+    def open_cache(self, rootdir):
+        if not self.use_cache:
+            return None
+        return ResultCache(self.cache_dir, rootdir, self.fingerprint,
+                           self.cache_max_entries)
+
+    # Return an `export.Exporter` of `format`, by default that of the
+    # settings, or None if there is none. Without `path`, the file is
+    # written into the export directory, by default `exports` in the cache
+    # directory. Raise ValueError if the format is unknown, and OSError if
+    # the file can not be created.
+    def open_exporter(self, rootdir, format=None, path=None):
+        format = format or self.export_format
+        if not format:
+            return None
+        directory = self.export_directory or (
+            self.cache_dir and os.path.join(self.cache_dir, 'exports')
+            or os.getcwd())
+        return open_exporter(format, rootdir, path,
+                             os.path.expanduser(directory))
+
+    @property
+    def snapshots_dir(self):
+        return self.cache_dir and os.path.join(self.cache_dir, 'snapshots')
+
+    # Save `results` as the latest snapshot of their root directory, and
+    # return its path, or None if the snapshots are off or can not be saved
+    def save_snapshot(self, results):
+        if not self.snapshots or self.cache_dir is None:
+            return None
+        try:
+            return Snapshot.save(self.snapshots_dir, results, self.snapshots)
+        except OSError as e:
+            self.log(f'can not save the snapshot: {e}')
+            return None
+
+    # Measure the sizes of the subtrees of `rootdir`, see `sizes.measure`
+    def measure_sizes(self, task, rootdir, on_update=None):
+        cache = None
+        if self.use_cache:
+            cache = SizeCache(self.cache_dir, rootdir, self.size_top,
+                              self.cache_max_entries)
+        with ThreadPoolExecutor(self.size_workers) as executor:
+            sizes = measure(task, rootdir, executor, cache, self.size_top,
+                            on_update)
+        if cache:
+            self.log(f'size cache hits: {cache.hits}, misses: {cache.misses}')
+            try:
+                cache.save()
+            except OSError as e:
+                self.log(f'can not save the size cache: {e}')
+        return sizes
+
+    # Classify and count `entries`, a few `utils.FileEntry`, in the calling
+    # thread, see `classify_and_count`
+    def count_entries(self, entries):
+        rows, _ = classify_and_count(
+            self.language_decider,
+            [(entry.path, entry.name, entry.size) for entry in entries],
+            syntaxes=self.comment_syntaxes, sniff=self.skip_binary_files)
+        return rows
+
+    # Count the `roots` into a new `watch.WatchIndex`, to be kept up to
+    # date as their files change. The index holds all their files, so the
+    # budgets do not apply, and the count only stops if `task` is cancelled
+    def watch(self, task, roots, profiler):
+        rootdir, roots, walker = self.walk_roots(roots)
+        index = WatchIndex(roots, self.sloc)
+        self.count_lines(task, rootdir, walker, profiler, roots=roots,
+                         index=index, budgets=False)
+        index.baseline = index.totals[2]
+        return index
+
+    # Return an executor, and the function classifying and counting a list
+    # of `(path, name, size)` with it
+    def executor(self, task):
+        if self.processes > 1:
+            executor = ProcessPoolExecutor(
+                self.processes, initializer=init_worker,
+                initargs=self.worker_args + (lc.shared_object,))
+            return executor, classify_and_count_in_worker
+        return (ThreadPoolExecutor(self.max_workers),
+                partial(classify_and_count, self.language_decider,
+                        cancel=task.cancelled,
+                        syntaxes=self.comment_syntaxes,
+                        sniff=self.skip_binary_files))
+
+    # Stream the files from `filepaths` through three stages: the walk, in
+    # a thread of its own, the cache lookups, in the calling thread, and
+    # the classification and the counting, in the workers. Each stage
+    # starts on the first files given by the previous one, and the queues
+    # between them are bounded. The results are merged in walking order,
+    # so that they are the same as those of counting the files one by one.
+    # The count stops early when `task` is cancelled or out of budget.
+    # The time spent in each stage is recorded into `profiler`.
+    # With the `roots` of a `walk_roots`, the lines are also summed by root.
+    # With an `exporter`, the files are written as they are merged, and the
+    # languages once the count is over.
+    # With a `watch.WatchIndex`, all the files counted are also indexed,
+    # including those merged after a files or bytes budget is spent.
+    # Without `budgets`, `max_files`, `max_bytes` and `max_seconds` do not
+    # apply.
+    def count_lines(self, task, rootdir, filepaths, profiler, on_update=None,
+                    roots=(), exporter=None, index=None, budgets=True):
+        cache = self.open_cache(rootdir)
+        results = Results(rootdir, self.sloc, roots)
+        # The walkers stop on a cancel by themselves, even while they give
+        # no file, and the batches come at least every `poll_interval`
+        # seconds, empty if need be, for the cancel to be noticed here
+        if isinstance(filepaths, (Walker, IndexWalker, RootsWalker)):
+            filepaths.cancel = task.cancelled
+        discovered = ThreadedBatches(filepaths, self.batch_size,
+                                     self.max_batches, task.cancelled,
+                                     self.poll_interval)
+        # Only integers are updated here, the progress is sampled
+        progress = task.progress = CountProgress(discovered)
+        pending = deque()
+        max_files, max_bytes = self.max_files, self.max_bytes
+        deadline = self.max_seconds and time.perf_counter() + self.max_seconds
+        if not budgets:
+            max_files = max_bytes = deadline = 0
+        accepted = accepted_bytes = 0
+        # Whether the files or bytes budget is spent, the files merged after
+        # are dropped, as if they had never been discovered
+        over_budget = False
+        # Time spent in `merge`, which is not part of the cache lookups
+        merging = 0.0
+
+        def merge():
+            nonlocal merging, accepted, accepted_bytes, over_budget
+            start = time.perf_counter()
+            entries, known, future = pending.popleft()
+            rows = ()
+            if future is not None:
+                rows, (classify, count, paths, counts) = future.result()
+                profiler.add('classify', classify, 0)
+                profiler.add('count', count, len(paths))
+                profiler.add_files(paths, counts)
+            merged = time.perf_counter()
+            rows = iter(rows)
+            for entry, cached in zip(entries, known):
+                lang, type, lines, kinds = cached or next(rows)
+                stated = cache is not None and entry.mtime_ns is not None
+                if not cached and stated and lines is not None:
+                    cache.put(entry.path, entry, lang, type, lines, kinds)
+                if index is not None and lines is not None:
+                    index.put(entry, lang, lines, kinds)
+                # Interrupted before the end of the file
+                if not lang or lines is None or over_budget:
+                    continue
+                # Skipped without counting, nor spending the budgets
+                if lines == lc.BINARY:
+                    results.insert_binary(entry.size)
+                    continue
+                if max_files and accepted >= max_files:
+                    task.stop(f'{max_files} files counted')
+                    over_budget = True
+                    continue
+                if max_bytes and accepted_bytes >= max_bytes:
+                    task.stop(f'{strsize(max_bytes)} read')
+                    over_budget = True
+                    continue
+                accepted += 1
+                if not cached:
+                    accepted_bytes += entry.size
+                results.insert(lang, type, entry.path, entry.size, lines,
+                               kinds)
+                progress.bytes += entry.size
+            progress.counted += len(entries)
+            profiler.add('summarize', time.perf_counter() - merged,
+                         len(entries))
+            if exporter:
+                with profiler.measure('export', len(entries)):
+                    exporter.update(results)
+            if on_update:
+                on_update(results)
+            merging += time.perf_counter() - start
+
+        executor, job = self.executor(task)
+        try:
+            with executor:
+                for entries in discovered:
+                    if not entries:
+                        if deadline and time.perf_counter() >= deadline:
+                            task.stop(f'{self.max_seconds}s elapsed',
+                                      interrupt=True)
+                        if task.stopped is not None:
+                            discovered.stop()
+                            break
+                        continue
+                    start, merged = time.perf_counter(), merging
+                    known, files = [], []
+                    for i, entry in enumerate(entries):
+                        if deadline and time.perf_counter() >= deadline:
+                            task.stop(f'{self.max_seconds}s elapsed',
+                                      interrupt=True)
+                            del entries[i:]
+                            break
+                        progress.processed += 1
+                        # Files that can not be stat'ed are never cached
+                        cached = (cache is not None
+                                  and entry.mtime_ns is not None
+                                  and cache.get(entry.path, entry))
+                        known.append(cached or None)
+                        if not cached:
+                            files.append((entry.path, entry.name, entry.size))
+                    future = files and executor.submit(job, files) or None
+                    pending.append((entries, known, future))
+                    # Merge the batches done, and wait for the oldest one if
+                    # there are too many batches pending
+                    while pending and (len(pending) > self.max_batches
+                                       or pending[0][2] is None
+                                       or pending[0][2].done()):
+                        merge()
+                    profiler.add('classify', time.perf_counter() - start
+                                 - (merging - merged), len(entries))
+                    if task.stopped is not None:
+                        discovered.stop()
+                        break
+                while pending:
+                    merge()
+            stat_seconds = getattr(filepaths, 'stat_seconds', 0.0)
+            profiler.add('walk', discovered.busy_seconds - stat_seconds,
+                         discovered.produced)
+            profiler.add('stat', stat_seconds, discovered.produced)
+            if exporter:
+                with profiler.measure('export'):
+                    exporter.close(results, task.stopped)
+        finally:
+            # An error of the count leaves neither the file exported open,
+            # nor its SQLite database locked
+            if exporter:
+                exporter.release()
+        decider = self.language_decider
+        self.log(f'language decider hits: {decider.hits}, '
+                 f'misses: {decider.misses}')
+        if cache:
+            self.log(f'cache hits: {cache.hits}, misses: {cache.misses}')
+            try:
+                cache.save()
+            except OSError as e:
+                self.log(f'can not save the cache: {e}')
+        return results
@@ -0,0 +1,228 @@
+import os
+import csv
+import json
+import time
+from abc import ABC, abstractmethod
+
+try:
+    import sqlite3
+except ImportError:
+    # Not shipped with the Python of Sublime Text on every platform
+    sqlite3 = None
+
+
+def number(value):
+    return 'null' if value is None else value
+
+
+# Write the files of a count as they are merged into its `results.Results`,
+# one record for each file, then one for each language once the count is
+# over, and the totals. The files already written are remembered by their
+# number, as the results only grow, so that each file is written once.
+# The code, comment and blank lines are null unless counted with `sloc`.
+# The file is released by `close`, or by `release` alone if the count
+# fails.
+class Exporter(ABC):
+    __slots__ = ['path', 'rootdir', 'written']
+
+    suffix = ''
+    file_columns = ('language', 'type', 'path', 'size', 'lines', 'code',
+                    'comment', 'blank')
+    language_columns = ('language', 'files', 'size', 'lines', 'code',
+                        'comment', 'blank')
+
+    def __init__(self, path, rootdir):
+        self.path = path
+        self.rootdir = rootdir
+        self.written = 0
+
+    # Write the files inserted into `results` since the last update
+    def update(self, results):
+        end = results.files
+        if end > self.written:
+            self.write_files(self.file_rows(results, self.written, end))
+            self.written = end
+
+    def close(self, results, stopped=None):
+        try:
+            self.update(results)
+            self.write_languages(self.language_rows(results), stopped)
+        finally:
+            self.release()
+
+    @staticmethod
+    def file_rows(results, begin, end):
+        langs, types, kinds = results.langs, results.types, results.file_kinds
+        file_langs, file_types = results.file_langs, results.file_types
+        sizes, lines = results.file_sizes, results.file_lines
+        for i in range(begin, end):
+            yield (langs[file_langs[i]], types[file_types[i]],
+                   results.path(i), sizes[i], lines[i],
+                   *(kinds[3 * i:3 * i + 3] if results.sloc else (None,) * 3))
+
+    # The rows of the languages, followed by that of the total, of
+    # language None
+    @staticmethod
+    def language_rows(results):
+        rows = []
+        for lang, (size, files, lines, *kinds) in zip(results.langs,
+                                                      results.lang_totals):
+            rows.append((lang, files, size, lines, *(kinds or (None,) * 3)))
+        kinds = results.kinds if results.sloc else (None,) * 3
+        rows.append((None, results.files, results.size, results.lines,
+                     *kinds))
+        return rows
+
+    @abstractmethod
+    def write_files(self, rows):
+        pass
+
+    @abstractmethod
+    def write_languages(self, rows, stopped):
+        pass
+
+    # Close the file, it may be called again
+    @abstractmethod
+    def release(self):
+        pass
+
+
+# A JSON object by line, whose `record` is 'file', 'language' or 'total'.
+# The total also has the root directory, and tells whether the count was
+# `stopped` before the end.
+class JsonLinesExporter(Exporter):
+    __slots__ = ['fd']
+
+    suffix = '.jsonl'
+
+    def __init__(self, path, rootdir):
+        super().__init__(path, rootdir)
+        self.fd = open(path, 'w', encoding='utf-8')
+
+    # The records of the files are formatted without building a dict each
+    def write_files(self, rows):
+        string = json.encoder.encode_basestring_ascii
+        self.fd.writelines(
+            f'{{"record": "file", "language": {string(lang)}, '
+            f'"type": {string(type)}, "path": {string(path)}, '
+            f'"size": {size}, "lines": {lines}, "code": {number(code)}, '
+            f'"comment": {number(comment)}, "blank": {number(blank)}}}\n'
+            for lang, type, path, size, lines, code, comment, blank in rows)
+
+    def write_languages(self, rows, stopped):
+        *rows, total = rows
+        columns, dumps = self.language_columns, json.dumps
+        self.fd.writelines(
+            dumps({'record': 'language', **dict(zip(columns, row))}) + '\n'
+            for row in rows)
+        total = {'record': 'total', **dict(zip(columns[1:], total[1:])),
+                 'rootdir': self.rootdir, 'stopped': stopped}
+        self.fd.write(dumps(total) + '\n')
+
+    def release(self):
+        self.fd.close()
+
+
+# A table whose `record` column is 'file', 'language' or 'total', with the
+# columns of the files, and `files` for the languages and the total
+class CsvExporter(Exporter):
+    __slots__ = ['fd', 'writer']
+
+    suffix = '.csv'
+    columns = ('record', 'language', 'type', 'path', 'files', 'size',
+               'lines', 'code', 'comment', 'blank')
+
+    def __init__(self, path, rootdir):
+        super().__init__(path, rootdir)
+        self.fd = open(path, 'w', encoding='utf-8', newline='',
+                       errors='surrogateescape')
+        self.writer = csv.writer(self.fd)
+        self.writer.writerow(self.columns)
+
+    def write_files(self, rows):
+        self.writer.writerows(('file', lang, type, path, 1, *counts)
+                              for lang, type, path, *counts in rows)
+
+    def write_languages(self, rows, stopped):
+        *rows, total = rows
+        self.writer.writerows(('language', lang, None, None, *counts)
+                              for lang, *counts in rows)
+        self.writer.writerow(('total', None, None, None, *total[1:]))
+
+    def release(self):
+        self.fd.close()
+
+
+# The tables `files`, `languages`, where the total has a null language,
+# and `count`, which holds the root directory, the time and the reason why
+# the count stopped, if it did.
+# The files are committed along the count, so that they can be read while
+# it runs.
+class SqliteExporter(Exporter):
+    __slots__ = ['connection']
+
+    suffix = '.sqlite'
+
+    def __init__(self, path, rootdir):
+        if sqlite3 is None:
+            raise ValueError('sqlite3 is not available in this Python')
+        super().__init__(path, rootdir)
+        if os.path.exists(path):
+            os.remove(path)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        # The file is written anew by each export, it does not need to
+        # survive a crash in the middle of one
+        self.connection.executescript('''
+            PRAGMA synchronous = OFF;
+            PRAGMA journal_mode = MEMORY;
+            CREATE TABLE files (language TEXT, type TEXT, path TEXT,
+                size INTEGER, lines INTEGER, code INTEGER, comment INTEGER,
+                blank INTEGER);
+            CREATE TABLE languages (language TEXT, files INTEGER,
+                size INTEGER, lines INTEGER, code INTEGER, comment INTEGER,
+                blank INTEGER);
+            CREATE TABLE count (rootdir TEXT, time TEXT, stopped TEXT);
+        ''')
+
+    def write_files(self, rows):
+        # The paths that are not utf-8 can not be stored as text
+        rows = ((lang, type, path.encode('utf-8', 'surrogateescape').decode(
+                    'utf-8', 'replace'), *counts)
+                for lang, type, path, *counts in rows)
+        with self.connection:
+            self.connection.executemany(
+                'INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def write_languages(self, rows, stopped):
+        with self.connection:
+            self.connection.executemany(
+                'INSERT INTO languages VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            self.connection.execute(
+                'INSERT INTO count VALUES (?, ?, ?)',
+                (self.rootdir, time.strftime('%Y-%m-%d %H:%M:%S'), stopped))
+
+    # The files of an unfinished batch are rolled back
+    def release(self):
+        self.connection.close()
+
+
+exporters = {
+    'jsonl': JsonLinesExporter,
+    'csv': CsvExporter,
+    'sqlite': SqliteExporter,
+}
+
+
+# Return an `Exporter` of `format` writing into `path`, or into a new file
+# of `directory` named after `rootdir` and the current time
+def open_exporter(format, rootdir, path=None, directory=None):
+    cls = exporters.get(format)
+    if cls is None:
+        raise ValueError(f'unknown export format: {format!r}, expected one '
+                         f'of {", ".join(exporters)}')
+    if path is None:
+        os.makedirs(directory, exist_ok=True)
+        name = os.path.basename(rootdir.rstrip('/\\')) or 'root'
+        path = os.path.join(directory, f'{name}-'
+                            f'{time.strftime("%Y%m%d-%H%M%S")}{cls.suffix}')
+    return cls(path, rootdir)
@@ -0,0 +1,189 @@
+import os
+import re
+import stat
+import time
+import struct
+
+from .utils import FileEntry
+
+
+# Return the git directory of the repository holding `path`, and the root
+# of its working tree, or None if `path` is not in a repository
+def find_repository(path):
+    directory = os.path.abspath(path)
+    while True:
+        dotgit = os.path.join(directory, '.git')
+        if os.path.isdir(dotgit):
+            return dotgit, directory
+        if os.path.isfile(dotgit):
+            # Worktrees and submodules, ".git" is "gitdir: <path>"
+            try:
+                with open(dotgit, encoding='utf-8') as fd:
+                    line = fd.readline().strip()
+            except OSError:
+                return None
+            if not line.startswith('gitdir:'):
+                return None
+            gitdir = os.path.join(directory, line[len('gitdir:'):].strip())
+            return os.path.normpath(gitdir), directory
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+
+def hash_size(gitdir):
+    try:
+        with open(os.path.join(gitdir, 'config'), encoding='utf-8') as fd:
+            config = fd.read()
+    except OSError:
+        return 20
+    if re.search(r'(?im)^\s*objectformat\s*=\s*sha256\s*$', config):
+        return 32
+    return 20
+
+
+# Yield the paths, as bytes relative to the root of the working tree, of
+# the regular files and symbolic links recorded in the index `data`.
+# Versions 2, 3 and 4 of the format are supported, see
+# `git help index-format`. Raise ValueError if `data` is not an index.
+def read_index(data, hash_size=20):
+    if data[:4] != b'DIRC':
+        raise ValueError('not a git index')
+    version, count = struct.unpack_from('>II', data, 4)
+    if version not in (2, 3, 4):
+        raise ValueError(f'unsupported git index version {version}')
+    offset, name = 12, b''
+    # ctime, mtime, dev, ino, mode, uid, gid, size, then the object name
+    fixed = 40 + hash_size
+    for _ in range(count):
+        start = offset
+        mode = struct.unpack_from('>I', data, offset + 24)[0]
+        flags = struct.unpack_from('>H', data, offset + fixed)[0]
+        offset += fixed + 2
+        extended = 0
+        if flags & 0x4000 and version >= 3:
+            extended = struct.unpack_from('>H', data, offset)[0]
+            offset += 2
+        if version == 4:
+            # The name is stored as the number of bytes to remove from the
+            # end of the previous name, then the bytes to append to it
+            byte = data[offset]
+            offset += 1
+            strip = byte & 0x7f
+            while byte & 0x80:
+                byte = data[offset]
+                offset += 1
+                strip = ((strip + 1) << 7) | (byte & 0x7f)
+            end = data.index(b'\0', offset)
+            name = name[:len(name) - strip] + data[offset:end]
+            offset = end + 1
+        else:
+            # Entries are padded with 1 to 8 NUL bytes to a multiple of 8
+            end = data.index(b'\0', offset)
+            name = data[offset:end]
+            offset = start + (end - start + 8) // 8 * 8
+        # Unmerged entries have a stage, and skip-worktree entries are not
+        # in the working tree
+        if flags & 0x3000 or extended & 0x4000:
+            continue
+        if stat.S_ISREG(mode) or stat.S_ISLNK(mode):
+            yield name
+
+
+# Iterate the files of `top` tracked by the git repository holding it, in
+# the order of its index, yielding a `utils.FileEntry` for each of them,
+# with the data of a fresh stat call: the stat data of the index is only
+# as recent as the last git command, so it can not tell whether a file was
+# modified since. The counters and `cancel` are the same as those of
+# `utils.Walker`.
+class IndexWalker:
+    __slots__ = ['top', 'root', 'paths', 'exclude_hidden', 'match',
+                 'ignore', 'cancel', 'files', 'folders', 'errors',
+                 'stat_seconds']
+
+    def __init__(self, top, root, paths, exclude_hidden=False, match=None,
+                 ignore=None):
+        self.top = top
+        self.root = root
+        self.paths = paths
+        self.exclude_hidden = exclude_hidden
+        self.match = match
+        self.ignore = ignore
+        self.cancel = None
+        self.files = 0
+        self.folders = 0
+        self.errors = 0
+        self.stat_seconds = 0.0
+
+    # Return an `IndexWalker` for `top`, or None if it is not in a git
+    # repository, or if its index can not be read
+    @classmethod
+    def open(cls, top, exclude_hidden=False, match=None, ignore=None):
+        repository = find_repository(top)
+        if repository is None:
+            return None
+        gitdir, root = repository
+        try:
+            with open(os.path.join(gitdir, 'index'), 'rb') as fd:
+                data = fd.read()
+            paths = list(read_index(data, hash_size(gitdir)))
+        except (OSError, ValueError, struct.error):
+            return None
+        return cls(top, root, paths, exclude_hidden, match, ignore)
+
+    def __iter__(self):
+        top, exclude_hidden = self.top, self.exclude_hidden
+        match, ignore = self.match, self.ignore
+        prefix = os.path.relpath(os.path.abspath(top), self.root)
+        prefix = b'' if prefix == '.' else os.fsencode(prefix).replace(
+            os.sep.encode(), b'/') + b'/'
+        # Whether each directory is ignored by `ignore`
+        ignored_dirs = {}
+
+        def ignored_dir(directory):
+            if not directory:
+                return False
+            result = ignored_dirs.get(directory)
+            if result is None:
+                parent = os.path.dirname(directory)
+                result = ignored_dirs[directory] = (
+                    ignored_dir(parent)
+                    or ignore.ignored(os.path.join(top, directory), True))
+            return result
+
+        base = os.path.join(top, '')
+        cancel = self.cancel
+        for i, name in enumerate(self.paths):
+            # As often as a `Walker` lists a directory of average size
+            if i % 256 == 0 and cancel is not None and cancel.is_set():
+                return
+            if not name.startswith(prefix):
+                continue
+            relpath = os.fsdecode(name[len(prefix):])
+            if exclude_hidden and (relpath[0] == '.' or '/.' in relpath):
+                continue
+            if os.sep != '/':
+                relpath = relpath.replace('/', os.sep)
+            path = base + relpath
+            if ignore is not None and (
+                    ignored_dir(os.path.dirname(relpath))
+                    or ignore.ignored(path, False)):
+                continue
+            self.files += 1
+            if match and not match(path):
+                continue
+            start = time.perf_counter()
+            try:
+                st = os.stat(path)
+            except OSError:
+                # Deleted since it was added to the index
+                self.errors += 1
+                continue
+            finally:
+                self.stat_seconds += time.perf_counter() - start
+            # A link to a directory
+            if stat.S_ISDIR(st.st_mode):
+                continue
+            yield FileEntry(path, relpath.rpartition(os.sep)[2], st.st_size,
+                            st.st_mtime_ns, st.st_ino, st.st_dev)
@@ -0,0 +1,214 @@
+import os
+import re
+
+
+# Translate a line of an ignore file into `(regex, negate, dir_only)`, the
+# regex matches the paths relative to the directory of the ignore file,
+# with '/' separators, as described in `git help gitignore`.
+# Return None for blank lines and comments.
+def translate(line):
+    pattern = line.rstrip('\r\n')
+    # Trailing spaces are ignored, unless they are escaped
+    while pattern.endswith(' ') and not pattern.endswith('\\ '):
+        pattern = pattern[:-1]
+    if not pattern or pattern[0] == '#':
+        return None
+    negate = pattern[0] == '!'
+    if negate:
+        pattern = pattern[1:]
+    elif pattern[:2] in ('\\!', '\\#'):
+        pattern = pattern[1:]
+    dir_only = pattern.endswith('/')
+    pattern = pattern.rstrip('/')
+    if not pattern:
+        return None
+    # A slash at the beginning or in the middle anchors the pattern to the
+    # directory of the ignore file, otherwise it matches at any depth
+    anchored = '/' in pattern
+    if pattern[0] == '/':
+        pattern = pattern[1:]
+    regex, i, n = [], 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            if (pattern.startswith('**', i)
+                    and (i == 0 or pattern[i - 1] == '/')):
+                if pattern.startswith('**/', i):
+                    regex.append('(?:.*/)?')
+                    i += 3
+                    continue
+                if i + 2 == n:
+                    regex.append('.*')
+                    i += 2
+                    continue
+            while i + 1 < n and pattern[i + 1] == '*':
+                i += 1
+            regex.append('[^/]*')
+        elif c == '?':
+            regex.append('[^/]')
+        elif c == '[':
+            # A ']' right after '[' or '[!' is part of the set
+            first = i + 2 if pattern[i + 1:i + 2] in ('!', '^') else i + 1
+            end = pattern.find(']', first + 1)
+            if end < 0:
+                regex.append('\\[')
+            else:
+                chars = pattern[i + 1:end].replace('\\', '\\\\')
+                if chars[0] in '!^':
+                    chars = '^' + chars[1:]
+                regex.append(f'[{chars}]')
+                i = end
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            regex.append(re.escape(pattern[i]))
+        else:
+            regex.append(re.escape(c))
+        i += 1
+    regex = ''.join(regex)
+    if not anchored:
+        regex = '(?:.*/)?' + regex
+    return regex, negate, dir_only
+
+
+# The rules of one ignore file, for the paths under `base`.
+# Without negations, all the rules are checked by one combined regex.
+class Rules:
+    __slots__ = ['base', 'rules', 'files', 'dirs']
+
+    # Compiled rules, by path of ignore file, reused while it is unchanged
+    cache = {}
+
+    def __init__(self, base, lines):
+        self.base = os.path.join(base, '')
+        self.rules = []
+        for line in lines:
+            rule = translate(line)
+            if rule is not None:
+                regex, negate, dir_only = rule
+                self.rules.append((re.compile(regex), negate, dir_only))
+        self.files = self.dirs = None
+        if not any(negate for _, negate, _ in self.rules):
+            self.files = self.combine(
+                [regex for regex, _, dir_only in self.rules if not dir_only])
+            self.dirs = self.combine([regex for regex, _, _ in self.rules])
+
+    @staticmethod
+    def combine(regexes):
+        if not regexes:
+            return None
+        return re.compile('|'.join(f'(?:{regex.pattern})'
+                                   for regex in regexes))
+
+    @classmethod
+    def load(cls, base, path):
+        try:
+            stat = os.stat(path)
+            key = (stat.st_mtime_ns, stat.st_size)
+            cached = cls.cache.get(path)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+            with open(path, encoding='utf-8', errors='surrogateescape') as fd:
+                rules = cls(base, fd.readlines())
+        except OSError:
+            return None
+        cls.cache[path] = (key, rules)
+        return rules
+
+    # Return True if `path` is ignored, False if it is explicitly not
+    # ignored, and None if no rule matches it, or if `path` is not under
+    # the base of the rules
+    def match(self, path, is_dir):
+        if not path.startswith(self.base):
+            return None
+        path = path[len(self.base):]
+        if os.sep != '/':
+            path = path.replace(os.sep, '/')
+        if not self.rules:
+            return None
+        if self.dirs is not None:
+            combined = self.dirs if is_dir else self.files
+            if combined is not None and combined.fullmatch(path):
+                return True
+            return None
+        # The last rule matching the path decides
+        for regex, negate, dir_only in reversed(self.rules):
+            if dir_only and not is_dir:
+                continue
+            if regex.fullmatch(path):
+                return not negate
+        return None
+
+
+# The rules that apply to the files of a directory: the `globs` given by
+# the settings, checked first, then the ignore files of the directory and
+# of its parents, the innermost first. A `.ignore` file takes precedence
+# over the `.gitignore` file of the same directory, which takes precedence
+# over the `.git/info/exclude` file of a repository.
+class Ignore:
+    __slots__ = ['globs', 'rules', 'use_ignore_files']
+
+    # The names of a directory that `enter` looks for
+    names = ('.git', '.gitignore', '.ignore')
+
+    def __init__(self, globs, rules=(), use_ignore_files=True):
+        self.globs = globs
+        self.rules = rules
+        self.use_ignore_files = use_ignore_files
+
+    # Return the rules for the walk of `top`, which start with the ignore
+    # files of its parents, up to the root of its repository if any.
+    # The paths walked must start with `top` normalized by
+    # `os.path.normpath`, as `engine.Engine.walk` does, and the parents are
+    # only looked at if `top` is absolute.
+    @classmethod
+    def for_top(cls, top, globs=(), use_ignore_files=True):
+        top = os.path.normpath(top)
+        ignore = cls(Rules(top, globs) if globs else None,
+                     use_ignore_files=use_ignore_files)
+        if not use_ignore_files or not os.path.isabs(top):
+            return ignore
+        parents, directory = [], top
+        while not os.path.exists(os.path.join(directory, '.git')):
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                # Not in a repository
+                return ignore
+            directory = parent
+            parents.append(directory)
+        for directory in reversed(parents):
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                continue
+            ignore = ignore.enter(directory, names)
+        return ignore
+
+    # Return the rules for the files of `directory`, given its `names`
+    def enter(self, directory, names):
+        if not self.use_ignore_files:
+            return self
+        rules = []
+        if '.git' in names:
+            rules.append(Rules.load(
+                directory, os.path.join(directory, '.git', 'info', 'exclude')))
+        for name in ('.gitignore', '.ignore'):
+            if name in names:
+                rules.append(Rules.load(directory,
+                                        os.path.join(directory, name)))
+        rules = [rule for rule in rules if rule is not None and rule.rules]
+        if not rules:
+            return self
+        return Ignore(self.globs, tuple(reversed(rules)) + self.rules)
+
+    def ignored(self, path, is_dir):
+        # The repository itself is never counted
+        if (is_dir and self.use_ignore_files
+                and os.path.basename(path) == '.git'):
+            return True
+        if self.globs is not None and self.globs.match(path, is_dir):
+            return True
+        for rules in self.rules:
+            result = rules.match(path, is_dir)
+            if result is not None:
+                return result
+        return False
@@ -0,0 +1,252 @@
+import os
+import re
+
+
+# The syntax of the files that can not be recognized by name
+UNDECIDED = 'Plain Text'
+
+# From file extensions to the names of the syntaxes of Sublime Text, for
+# the counts made outside of it. The names are those of the syntaxes
+# shipped with Sublime Text, or of the usual packages for the others, so
+# that the settings of CodeLines apply the same way to both
+EXTENSIONS = {
+    'Batch File': ['bat', 'cmd'],
+    'Binary': [
+        '7z', 'a', 'avi', 'bin', 'bmp', 'bz2', 'class', 'dll', 'dylib',
+        'eot', 'exe', 'flac', 'gif', 'gz', 'ico', 'jar', 'jpeg', 'jpg',
+        'lib', 'mkv', 'mov', 'mp3', 'mp4', 'o', 'obj', 'ogg', 'otf', 'pdf',
+        'png', 'psd', 'pyc', 'pyd', 'pyo', 'rar', 'so', 'tar', 'tgz', 'ttf',
+        'wav', 'webm', 'webp', 'whl', 'woff', 'woff2', 'xz', 'zip', 'zst',
+    ],
+    'C': ['c'],
+    'C#': ['cs', 'csx'],
+    'C++': ['cc', 'cp', 'cpp', 'cxx', 'c++', 'h', 'hh', 'hpp', 'hxx', 'h++',
+            'inl', 'ipp', 'tcc'],
+    'Clojure': ['clj', 'cljc', 'cljs', 'edn'],
+    'CMake': ['cmake'],
+    'CSS': ['css'],
+    'D': ['d', 'di'],
+    'Dart': ['dart'],
+    'Diff': ['diff', 'patch'],
+    'Dockerfile': ['dockerfile'],
+    'Elixir': ['ex', 'exs'],
+    'Erlang': ['erl', 'hrl'],
+    'Go': ['go'],
+    'Graphviz (DOT)': ['dot', 'gv'],
+    'Groovy': ['groovy', 'gradle', 'gvy'],
+    'Haskell': ['hs', 'lhs'],
+    'HTML': ['htm', 'html', 'shtml', 'xhtml'],
+    'INI': ['cfg', 'conf', 'ini'],
+    'Java': ['java'],
+    'JavaScript': ['cjs', 'js', 'mjs'],
+    'JSON': ['json', 'jsonc', 'sublime-build', 'sublime-commands',
+             'sublime-keymap', 'sublime-menu', 'sublime-project',
+             'sublime-settings'],
+    'JSX': ['jsx'],
+    'Julia': ['jl'],
+    'Kotlin': ['kt', 'kts'],
+    'LaTeX': ['ltx', 'sty', 'tex'],
+    'Less': ['less'],
+    'Lisp': ['el', 'lisp', 'lsp', 'scm', 'ss'],
+    'Lua': ['lua'],
+    'Makefile': ['mak', 'mk'],
+    'Markdown': ['markdown', 'md', 'mdown'],
+    'MATLAB': ['matlab'],
+    'Nim': ['nim', 'nims'],
+    'Objective-C': ['m'],
+    'Objective-C++': ['mm'],
+    'OCaml': ['ml', 'mli'],
+    'Pascal': ['dpr', 'p', 'pas'],
+    'Perl': ['perl', 'pl', 'pm', 'pod', 't'],
+    'PHP': ['php', 'php3', 'php4', 'php5', 'phpt', 'phtml'],
+    'PowerShell': ['ps1', 'psd1', 'psm1'],
+    'Protocol Buffer': ['proto'],
+    'Python': ['py', 'pyi', 'pyw', 'pyx', 'rpy'],
+    'R': ['r', 'rprofile'],
+    'reStructuredText': ['rest', 'rst'],
+    'Ruby': ['gemspec', 'rake', 'rb', 'rbx', 'ru'],
+    'Rust': ['rs'],
+    'Sass': ['sass'],
+    'Scala': ['sbt', 'sc', 'scala'],
+    'SCSS': ['scss'],
+    'Shell-Unix-Generic': ['bash', 'ksh', 'sh', 'zsh'],
+    'SQL': ['sql'],
+    'Svelte': ['svelte'],
+    'Swift': ['swift'],
+    'TCL': ['tcl'],
+    'Textile': ['textile'],
+    'TOML': ['toml'],
+    'TSX': ['tsx'],
+    'TypeScript': ['cts', 'mts', 'ts'],
+    'Vue Component': ['vue'],
+    'XML': ['csproj', 'plist', 'rss', 'svg', 'tld', 'tmLanguage',
+            'tmPreferences', 'tmTheme', 'xaml', 'xml', 'xsd', 'xsl',
+            'xslt'],
+    'YAML': ['sublime-syntax', 'yaml', 'yml'],
+    'Zig': ['zig'],
+}
+EXTENSIONS = {ext: syntax
+              for syntax, exts in EXTENSIONS.items() for ext in exts}
+
+# Files recognized by their whole name
+NAMES = {
+    '.bash_profile': 'Shell-Unix-Generic',
+    '.bashrc': 'Shell-Unix-Generic',
+    '.profile': 'Shell-Unix-Generic',
+    '.zshrc': 'Shell-Unix-Generic',
+    'CMakeLists.txt': 'CMake',
+    'Dockerfile': 'Dockerfile',
+    'Gemfile': 'Ruby',
+    'GNUmakefile': 'Makefile',
+    'Makefile': 'Makefile',
+    'makefile': 'Makefile',
+    'Rakefile': 'Ruby',
+    'SConscript': 'Python',
+    'SConstruct': 'Python',
+}
+
+# Interpreters of the shebang lines
+INTERPRETERS = {
+    'bash': 'Shell-Unix-Generic',
+    'sh': 'Shell-Unix-Generic',
+    'zsh': 'Shell-Unix-Generic',
+    'node': 'JavaScript',
+    'perl': 'Perl',
+    'php': 'PHP',
+    'python': 'Python',
+    'ruby': 'Ruby',
+    'lua': 'Lua',
+}
+
+shebang = re.compile(
+    r'#!\s*(?:\S*/)?(?:env\s+(?:-\S+\s+)*)?([a-z]+)')
+
+
+# Return the name of the syntax of `file`, from its name or from its
+# `first_line`, the same way as `sublime.find_syntax_for_file`
+def find_syntax(file, first_line=''):
+    name = os.path.basename(file)
+    syntax = NAMES.get(name)
+    if syntax is not None:
+        return syntax
+    # From the longest suffix to the last extension
+    parts = name.split('.')
+    for i in range(1, len(parts)):
+        suffix = '.'.join(parts[i:])
+        syntax = EXTENSIONS.get(suffix) or EXTENSIONS.get(suffix.lower())
+        if syntax is not None:
+            return syntax
+    if first_line.startswith('#!'):
+        match = shebang.match(first_line)
+        if match:
+            interpreter = match.group(1).rstrip('0123456789')
+            return INTERPRETERS.get(interpreter, UNDECIDED)
+    if first_line.startswith('<?xml'):
+        return 'XML'
+    if first_line.startswith('<?php'):
+        return 'PHP'
+    return UNDECIDED
+
+
+class LanguageDecider:
+    __slots__ = ['decide', 'find_syntax', 'by_suffix', 'by_name',
+                 'decisions', 'hits', 'misses']
+
+    undecided = UNDECIDED
+    # Returned by `from_name` when only the first line can tell
+    unknown = object()
+
+    def __init__(self, decide, find_syntax=find_syntax):
+        self.decide = decide
+        self.find_syntax = find_syntax
+        # Memo tables, from the suffix of a file name (everything after its
+        # first dot) or from a whole file name, to the syntax name. They map
+        # to `undecided` when the name is not enough to decide the syntax
+        self.by_suffix = {}
+        self.by_name = {}
+        # From a syntax name to the language, after aliases and ignores
+        self.decisions = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, path):
+        lang = self.from_name(path)
+        if lang is self.unknown:
+            lang = self.from_first_line(path, self.get_first_line(path))
+        return lang
+
+    # Return the language of `path` as decided from its name, or `unknown`
+    def from_name(self, path):
+        file = os.path.basename(path)
+        # Files like main.py or jquery.min.js
+        suffix = file.partition('.')[2] if file[0] != '.' else ''
+        if suffix:
+            syntax = self.by_suffix.get(suffix)
+            if syntax is None:
+                syntax = self.by_suffix[suffix] = self.lookup('_.' + suffix)
+            else:
+                self.hits += 1
+            if syntax != self.undecided:
+                return self.decisions[syntax]
+        # Files like Makefile, CMakeLists.txt or .bashrc, a name is only
+        # looked up on its own once it has been seen more than once
+        syntax = self.by_name.get(file)
+        if syntax is None:
+            self.by_name[file] = ''
+        elif not syntax:
+            syntax = self.by_name[file] = self.lookup(file)
+        else:
+            self.hits += 1
+        if syntax and syntax != self.undecided:
+            return self.decisions[syntax]
+        # Only the first line can tell, for instance with a shebang
+        return self.unknown
+
+    def from_first_line(self, path, first_line):
+        return self.decisions[self.lookup(path, first_line)]
+
+    def lookup(self, file, first_line=''):
+        self.misses += 1
+        syntax = self.find_syntax(file, first_line)
+        if syntax not in self.decisions:
+            self.decisions[syntax] = self.decide(syntax)
+        return syntax
+
+    @staticmethod
+    def get_first_line(file):
+        try:
+            # We use UTF-8 encoding to read the first line
+            with open(file, 'r', encoding='UTF-8') as fd:
+                return fd.readline(1024)
+        except:
+            return ''
+
+    # The first line of a file from `head`, its first bytes
+    @staticmethod
+    def first_line(head):
+        line = head[:head.find(b'\n') + 1] or head
+        return line.decode('utf-8', 'replace')[:1024]
+
+    # Return a decider for the settings `syntaxes`, `ignored_syntaxes` and
+    # `aliases`, the latter mapping each alias to its syntax
+    @classmethod
+    def create(cls, syntaxes, ignored_syntaxes, aliases,
+               find_syntax=find_syntax):
+        if syntaxes:
+            def decide_with_syntaxes(lang):
+                if lang in aliases:
+                    lang = aliases[lang]
+                if lang in syntaxes:
+                    return lang
+                return None
+            return cls(decide_with_syntaxes, find_syntax)
+        else:
+            def decide_with_ignored_syntaxes(lang):
+                if lang in ignored_syntaxes:
+                    return None
+                if lang in aliases:
+                    lang = aliases[lang]
+                    if lang in ignored_syntaxes:
+                        return None
+                return lang
+            return cls(decide_with_ignored_syntaxes, find_syntax)
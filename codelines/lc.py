@@ -0,0 +1,452 @@
+import os
+import re
+import mmap
+import time
+import ctypes
+import threading
+
+if os.name == "nt":
+    from _ctypes import FreeLibrary as _dlclose
+elif os.name == "posix":
+    from _ctypes import dlclose as _dlclose
+
+
+# Same as `IO_BUF_SIZE` in lc.c
+CHUNK_SIZE = 1 << 18
+# Files at least this large are mapped instead of read
+MMAP_THRESHOLD = 1 << 24
+# Length of each mapping, a multiple of `mmap.ALLOCATIONGRANULARITY`
+MMAP_WINDOW = 1 << 24
+# Same as `LC_SNIFF_SIZE` and `LC_BINARY` in lc.c
+SNIFF_SIZE = 8192
+BINARY = -2
+
+_local = threading.local()
+
+
+# A flag shared with the counters, setting it stops them within one chunk
+class CancelFlag(ctypes.c_int):
+    def set(self):
+        self.value = 1
+
+    def is_set(self):
+        return self.value != 0
+
+
+def _check(cancel):
+    if cancel is not None and cancel.value:
+        raise InterruptedError('counting cancelled')
+
+
+def _count_read(file, cancel):
+    # Each counting thread reuses its own buffer
+    buffer = getattr(_local, 'buffer', None)
+    if buffer is None:
+        buffer = _local.buffer = bytearray(CHUNK_SIZE)
+    lines = size = 0
+    last = ord('\n')
+    while True:
+        _check(cancel)
+        n = file.readinto(buffer)
+        if not n:
+            break
+        lines += buffer.count(b'\n', 0, n)
+        size += n
+        last = buffer[n - 1]
+    return lines + (last != ord('\n')), size
+
+
+def _count_mapped(file, size, cancel):
+    # Map the file window by window, so that only one window of pages is
+    # mapped into the process at a time
+    lines = 0
+    fileno = file.fileno()
+    for offset in range(0, size, MMAP_WINDOW):
+        length = min(MMAP_WINDOW, size - offset)
+        with mmap.mmap(fileno, length, access=mmap.ACCESS_READ,
+                       offset=offset) as window:
+            for start in range(0, length, CHUNK_SIZE):
+                _check(cancel)
+                lines += window[start:start + CHUNK_SIZE].count(b'\n')
+            last = window[length - 1]
+    return lines + (last != ord('\n')), size
+
+
+# Whether `head`, the first block of a file, looks binary: it has a NUL
+# byte, or more than one byte in eight is invalid UTF-8, as `is_binary`
+# in lc.c. Each invalid sequence is decoded as one replacement character.
+def is_binary(head):
+    head = head[:SNIFF_SIZE]
+    if b'\0' in head:
+        return True
+    invalid = (head.decode('utf-8', 'replace').count('\ufffd')
+               - head.count('\ufffd'.encode('utf-8')))
+    return invalid * 8 > len(head)
+
+
+# Return the first block of the file at `path`, or b'' if it can not be
+# read
+def read_head(path):
+    try:
+        with open(path, 'rb') as file:
+            return file.read(SNIFF_SIZE)
+    except OSError:
+        return b''
+
+
+# Return the lines of a whole file read into `data`
+def py_count_bytes(data):
+    return data.count(b'\n') + (data[-1:] not in (b'', b'\n'))
+
+
+# Return the `(lines, size)` of the file at `path`, in bounded memory.
+# A last line without newline counts, just like `lines_count` in lc.c.
+# With `sniff`, a file whose first chunk looks binary is not read further
+# and its lines are `BINARY`, as with `lines_count_text_many`.
+# Raise `InterruptedError` once the `cancel` flag is set.
+def py_count_file(path, cancel=None, sniff=False):
+    with open(path, 'rb', buffering=0) as file:
+        if sniff:
+            head = file.read(CHUNK_SIZE)
+            if is_binary(head):
+                return BINARY, len(head)
+            file.seek(0)
+        size = os.fstat(file.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            try:
+                return _count_mapped(file, size, cancel)
+            except InterruptedError:
+                raise
+            except (OSError, ValueError):
+                file.seek(0)
+        return _count_read(file, cancel)
+
+
+def py_count_many(paths, cancel=None, sniff=False):
+    results = []
+    start = time.perf_counter_ns()
+    for path in paths:
+        try:
+            lines, size = py_count_file(path, cancel, sniff)
+        except OSError:
+            lines, size = -1, -1
+        end = time.perf_counter_ns()
+        results.append((lines, size, end - start))
+        start = end
+    return results
+
+
+# Same as `LC_MAX_MARKERS` and `LC_MAX_MARKER` in lc.c
+MAX_MARKERS = 4
+MAX_MARKER = 16
+
+
+class NativeSyntax(ctypes.Structure):
+    _fields_ = [
+        ('line_comments', ctypes.c_char_p * MAX_MARKERS),
+        ('block_starts', ctypes.c_char_p * MAX_MARKERS),
+        ('block_ends', ctypes.c_char_p * MAX_MARKERS),
+        ('quotes', ctypes.c_char_p),
+    ]
+
+
+# The comment syntax of a language: its `line` comment markers, its
+# `block` comments as `[start, end]` pairs, and its string `quotes`, each
+# character opening a string closed by the same character or by the end
+# of the line. There are at most `MAX_MARKERS` markers of each kind, each
+# shorter than `MAX_MARKER` bytes, the others are ignored.
+class CommentSyntax:
+    __slots__ = ['line_comments', 'block_starts', 'block_ends', 'quotes',
+                 'tokens', 'native']
+
+    def __init__(self, line=(), block=(), quotes=''):
+        def valid(marker):
+            return 0 < len(marker) < MAX_MARKER
+
+        line = [marker.encode('utf-8') for marker in line]
+        block = [(start.encode('utf-8'), end.encode('utf-8'))
+                 for start, end in block]
+        self.line_comments = [m for m in line if valid(m)][:MAX_MARKERS]
+        block = [(start, end) for start, end in block
+                 if valid(start) and valid(end)][:MAX_MARKERS]
+        self.block_starts = [start for start, _ in block]
+        self.block_ends = [end for _, end in block]
+        self.quotes = quotes.encode('utf-8')
+        # The longest marker first, as lc.c does, then the quotes
+        markers = sorted(self.line_comments + self.block_starts,
+                         key=len, reverse=True)
+        self.tokens = re.compile(b'|'.join(
+            [re.escape(marker) for marker in markers]
+            + [re.escape(self.quotes[i:i + 1])
+               for i in range(len(self.quotes))]) or b'(?!)')
+        self.native = None
+
+    @classmethod
+    def from_settings(cls, syntax):
+        return cls(syntax.get('line', ()), syntax.get('block', ()),
+                   syntax.get('quotes', ''))
+
+    def to_native(self):
+        if self.native is None:
+            def markers(values):
+                return (ctypes.c_char_p * MAX_MARKERS)(*values)
+            self.native = NativeSyntax(
+                markers(self.line_comments), markers(self.block_starts),
+                markers(self.block_ends), self.quotes)
+        return self.native
+
+    # Return the kind of `line`, without its newline, and the block comment
+    # open after it, from the block comment `block` open before it, or -1.
+    # As in lc.c, the spaces are the bytes up to 0x20, control bytes included
+    def classify(self, line, block):
+        code = comment = False
+        i, n = 0, len(line)
+        while i < n:
+            if block >= 0:
+                end = self.block_ends[block]
+                j = line.find(end, i)
+                if j < 0:
+                    comment = comment or bool(_solid(line, i))
+                    break
+                comment, i, block = True, j + len(end), -1
+                continue
+            match = self.tokens.search(line, i)
+            if match is None:
+                code = code or bool(_solid(line, i))
+                break
+            code = code or bool(_solid(line, i, match.start()))
+            token, i = match.group(), match.end()
+            if token in self.line_comments:
+                comment = True
+                break
+            if token in self.block_starts:
+                comment, block = True, self.block_starts.index(token)
+                continue
+            # A string, to its closing quote, or to the end of the line
+            code = True
+            while i < n and line[i] != token[0]:
+                i += 2 if line[i] == 0x5c and i + 1 < n else 1
+            i += 1
+        return (CODE if code else COMMENT if comment else BLANK), block
+
+
+CODE, COMMENT, BLANK = range(3)
+_solid = re.compile(rb'[^\x00-\x20]').search
+
+
+# Return the `(lines, (code, comments, blanks))` of the consecutive
+# `chunks` of a file, with the comment `syntax`, or with neither comments
+# nor strings if `syntax` is None
+def py_classify_chunks(chunks, syntax=None):
+    syntax = syntax or CommentSyntax()
+    kinds = [0, 0, 0]
+    block, rest = -1, b''
+    for chunk in chunks:
+        lines = (rest + chunk).split(b'\n')
+        rest = lines.pop()
+        for line in lines:
+            kind, block = syntax.classify(line, block)
+            kinds[kind] += 1
+    if rest:
+        kind, block = syntax.classify(rest, block)
+        kinds[kind] += 1
+    return sum(kinds), tuple(kinds)
+
+
+# Return the `(lines, size, (code, comments, blanks))` of the file at
+# `path`, the same as `lines_classify_many` in lc.c
+def py_classify_file(path, syntax=None, cancel=None, sniff=False):
+    size = 0
+
+    def chunks(chunk):
+        nonlocal size
+        while chunk:
+            size += len(chunk)
+            yield chunk
+            _check(cancel)
+            chunk = file.read(CHUNK_SIZE)
+
+    with open(path, 'rb') as file:
+        _check(cancel)
+        head = file.read(CHUNK_SIZE)
+        if sniff and is_binary(head):
+            return BINARY, len(head), (0, 0, 0)
+        lines, kinds = py_classify_chunks(chunks(head), syntax)
+    return lines, size, kinds
+
+
+def py_classify_many(paths, syntaxes, cancel=None, sniff=False):
+    results = []
+    start = time.perf_counter_ns()
+    for path, syntax in zip(paths, syntaxes):
+        try:
+            lines, size, kinds = py_classify_file(path, syntax, cancel,
+                                                  sniff)
+        except OSError:
+            lines, size, kinds = -1, -1, (0, 0, 0)
+        end = time.perf_counter_ns()
+        results.append((lines, size, end - start, kinds))
+        start = end
+    return results
+
+
+def make_counter(function=None, batch=None, encoding=None, classify=None):
+    global count, count_many, classify_many
+    encoding = encoding or getattr(make_counter, 'encoding', None)
+    function = function or getattr(make_counter, 'function', None)
+    batch = batch or getattr(make_counter, 'batch', None)
+    classify = classify or getattr(make_counter, 'classify', None)
+    make_counter.encoding = encoding
+    make_counter.function = function
+    make_counter.batch = batch
+    make_counter.classify = classify
+
+    if (function is None or batch is None or classify is None
+            or encoding is None):
+        return
+
+    count = lambda path: function(bytes(path, encoding=encoding))
+    # Return a list of `(lines, size, nanoseconds)`, lines and size are -1
+    # if the file can not be read, or if it was not counted to the end
+    # because `cancel` was set. With `sniff`, the lines of the files that
+    # look binary are `BINARY`, and size is the number of bytes sniffed
+    count_many = lambda paths, cancel=None, sniff=False: batch(
+        [bytes(path, encoding=encoding) for path in paths], cancel, sniff)
+    # Same as `count_many`, with the `(code, comments, blanks)` of each
+    # file in the same pass, from the `CommentSyntax` of each file or None
+    classify_many = lambda paths, syntaxes, cancel=None, sniff=False: \
+        classify([bytes(path, encoding=encoding) for path in paths],
+                 syntaxes, cancel, sniff)
+
+
+def set_encoding(encoding):
+    make_counter(encoding=encoding)
+
+
+# The path of the shared object loaded, if any, for the worker processes
+# to load it too
+shared_object = None
+
+
+def load_shared_object(so):
+    global module, shared_object
+    try:
+        module = ctypes.cdll.LoadLibrary(so)
+        shared_object = so
+
+        c_count = module.lines_count
+        c_count.argtypes = (ctypes.POINTER(ctypes.c_char),)
+        c_count.restype = ctypes.c_int
+
+        count_many_argtypes = (
+            ctypes.POINTER(ctypes.c_char_p),
+            ctypes.c_int,
+            ctypes.POINTER(ctypes.c_longlong),
+            ctypes.POINTER(ctypes.c_longlong),
+            ctypes.POINTER(ctypes.c_int),
+            ctypes.POINTER(ctypes.c_longlong))
+        # Shared objects built before `lines_count_many`, such as that of
+        # Windows, only have a `lines_count` that keeps its state in static
+        # buffers, and opens files it can not read as empty ones: it counts
+        # one file at a time, after a stat of the file
+        c_count_many = getattr(module, 'lines_count_many', None)
+        if c_count_many is not None:
+            c_count_many.argtypes = count_many_argtypes
+            c_count_many.restype = ctypes.c_int
+        else:
+            lock = threading.Lock()
+            c_count_one = c_count
+
+            def c_count(path):
+                with lock:
+                    return c_count_one(path)
+
+            def c_count_each(paths, cancel=None):
+                results = []
+                for path in paths:
+                    start = time.perf_counter_ns()
+                    if cancel is not None and cancel.value:
+                        results.append((-1, -1, 0))
+                        continue
+                    try:
+                        size = os.stat(path).st_size
+                    except OSError:
+                        results.append((-1, -1, 0))
+                        continue
+                    lines = c_count(path)
+                    results.append((lines, size,
+                                    time.perf_counter_ns() - start))
+                return results
+
+        # Shared objects built before `lines_count_text_many` sniff in
+        # Python
+        c_count_text_many = getattr(module, 'lines_count_text_many', None)
+        if c_count_text_many is not None:
+            c_count_text_many.argtypes = count_many_argtypes
+            c_count_text_many.restype = ctypes.c_int
+
+        def c_batch(paths, cancel=None, sniff=False):
+            if sniff and c_count_text_many is None:
+                return py_count_many(paths, cancel, sniff)
+            if c_count_many is None:
+                return c_count_each(paths, cancel)
+            n = len(paths)
+            lines = (ctypes.c_longlong * n)()
+            sizes = (ctypes.c_longlong * n)()
+            nanos = (ctypes.c_longlong * n)()
+            counter = c_count_text_many if sniff else c_count_many
+            counter((ctypes.c_char_p * n)(*paths), n, lines, sizes,
+                    cancel if cancel is None else ctypes.byref(cancel),
+                    nanos)
+            return list(zip(lines, sizes, nanos))
+
+        # Shared objects built before `lines_classify_many` still count,
+        # it takes `sniff` since `lines_count_text_many` exists
+        c_classify_many = getattr(module, 'lines_classify_many', None)
+        if c_classify_many is None or c_count_text_many is None:
+            classify = py_classify_many
+        else:
+            c_classify_many.argtypes = (
+                ctypes.POINTER(ctypes.c_char_p),
+                ctypes.c_int,
+                ctypes.POINTER(ctypes.POINTER(NativeSyntax)),
+                ctypes.c_int,
+                ctypes.POINTER(ctypes.c_longlong),
+                ctypes.POINTER(ctypes.c_longlong),
+                ctypes.POINTER(ctypes.c_longlong),
+                ctypes.POINTER(ctypes.c_int),
+                ctypes.POINTER(ctypes.c_longlong))
+            c_classify_many.restype = ctypes.c_int
+
+            def classify(paths, syntaxes, cancel=None, sniff=False):
+                n = len(paths)
+                lines = (ctypes.c_longlong * n)()
+                sizes = (ctypes.c_longlong * n)()
+                kinds = (ctypes.c_longlong * (3 * n))()
+                nanos = (ctypes.c_longlong * n)()
+                pointers = {None: ctypes.POINTER(NativeSyntax)()}
+                for syntax in syntaxes:
+                    if syntax not in pointers:
+                        pointers[syntax] = ctypes.pointer(syntax.to_native())
+                natives = (ctypes.POINTER(NativeSyntax) * n)(
+                    *map(pointers.__getitem__, syntaxes))
+                c_classify_many(
+                    (ctypes.c_char_p * n)(*paths), n, natives, int(sniff),
+                    lines, sizes, kinds,
+                    cancel if cancel is None else ctypes.byref(cancel), nanos)
+                kinds = iter(kinds)
+                return list(zip(lines, sizes, nanos, zip(kinds, kinds, kinds)))
+        make_counter(function=c_count, batch=c_batch, classify=classify)
+    except:
+        module = shared_object = None
+        make_counter(
+            function=lambda path: py_count_file(path)[0],
+            batch=py_count_many, classify=py_classify_many)
+
+
+def unload_shared_object():
+    if module:
+        try:
+            _dlclose(module._handle)
+        except Exception:
+            raise IOError("Could not unload shared object library.")
@@ -0,0 +1,306 @@
+import os
+import heapq
+from array import array
+
+from .utils import strsize
+
+
+# The files counted under `rootdir`, stored by columns instead of one
+# object per file. The language and the type of the i-th file are codes
+# into `langs` and `types`, its size and lines are in `file_sizes` and
+# `file_lines`, and its path, relative to `rootdir`, is the utf-8 slice
+# of `path_buffer` ending at `path_ends[i]`.
+# The totals of each language and of each type are kept up to date on
+# each insertion, so that partial results can be reported while counting.
+# With `sloc`, the code, comment and blank lines of each file are stored
+# in `file_kinds`, three by file, and reported in three more columns.
+# The binary files skipped are only tallied, with their total size.
+# With several `roots` under `rootdir`, the lines of each language are also
+# summed by root, and reported in one more column for each root.
+class Results:
+    __slots__ = ['rootdir', 'sloc', 'prefix', 'langs', 'lang_codes',
+                 'types', 'type_codes', 'file_langs', 'file_types',
+                 'file_sizes', 'file_lines', 'file_kinds', 'path_buffer',
+                 'path_ends', 'lang_totals', 'type_totals', 'size', 'files',
+                 'lines', 'kinds', 'binaries', 'binary_size', 'roots',
+                 'root_prefixes', 'root_lines', 'root_totals']
+
+    captions = ('Languages', 'Size', 'Files', 'Lines')
+    type_captions = ('Types', 'Size', 'Files', 'Lines')
+    kind_captions = ('Code', 'Comment', 'Blank')
+
+    def __init__(self, rootdir, sloc=False, roots=()):
+        self.rootdir = rootdir
+        self.sloc = sloc
+        # The paths counted are those of `engine.Engine.walk`, under
+        # `rootdir` normalized
+        self.prefix = rootdir and os.path.join(os.path.normpath(rootdir), '')
+        self.langs = []
+        self.lang_codes = {}
+        self.types = []
+        self.type_codes = {}
+        self.file_langs = array('H')
+        self.file_types = array('L')
+        self.file_sizes = array('q')
+        self.file_lines = array('q')
+        self.file_kinds = array('q')
+        self.path_buffer = bytearray()
+        self.path_ends = array('Q')
+        # `[size, files, lines]` of each language, by language code,
+        # followed by `[code, comments, blanks]` with `sloc`
+        self.lang_totals = []
+        # The same totals of each type, by `(lang code, type code)`
+        self.type_totals = {}
+        self.size = 0
+        self.files = 0
+        self.lines = 0
+        self.kinds = [0, 0, 0]
+        self.binaries = 0
+        self.binary_size = 0
+        # A single root has no column of its own
+        self.roots = list(roots) if len(roots) > 1 else []
+        self.root_prefixes = [os.path.join(os.path.normpath(root), '')
+                              for root in self.roots]
+        # The lines of each root, by language code
+        self.root_lines = []
+        self.root_totals = [0] * len(self.roots)
+
+    def __len__(self):
+        return self.files
+
+    # `kinds` is the `(code, comments, blanks)` of the file with `sloc`
+    def insert(self, lang, type, path, size, lines, kinds=None):
+        lang_code = self.lang_codes.get(lang)
+        if lang_code is None:
+            lang_code = self.lang_codes[lang] = len(self.langs)
+            self.langs.append(lang)
+            self.lang_totals.append([0] * (6 if self.sloc else 3))
+            self.root_lines.append([0] * len(self.roots))
+        type_code = self.type_codes.get(type)
+        if type_code is None:
+            type_code = self.type_codes[type] = len(self.types)
+            self.types.append(type)
+        if self.roots:
+            root = self.root_of(path)
+            self.root_lines[lang_code][root] += lines
+            self.root_totals[root] += lines
+        prefix = self.prefix
+        if path.startswith(prefix):
+            path = path[len(prefix):]
+        else:
+            path = os.path.relpath(path, self.rootdir)
+        self.file_langs.append(lang_code)
+        self.file_types.append(type_code)
+        self.file_sizes.append(size)
+        self.file_lines.append(lines)
+        buffer = self.path_buffer
+        buffer += path.encode('utf-8', 'surrogateescape')
+        self.path_ends.append(len(buffer))
+        totals = self.lang_totals[lang_code]
+        totals[0] += size
+        totals[1] += 1
+        totals[2] += lines
+        lang_totals = totals
+        totals = self.type_totals.get((lang_code, type_code))
+        if totals is None:
+            totals = self.type_totals[lang_code, type_code] = [0] * len(
+                lang_totals)
+        totals[0] += size
+        totals[1] += 1
+        totals[2] += lines
+        self.size += size
+        self.files += 1
+        self.lines += lines
+        if self.sloc:
+            code, comments, blanks = kinds
+            self.file_kinds.extend(kinds)
+            for totals in (lang_totals, totals):
+                totals[3] += code
+                totals[4] += comments
+                totals[5] += blanks
+            totals = self.kinds
+            totals[0] += code
+            totals[1] += comments
+            totals[2] += blanks
+
+    # Return the index of the root holding `path`, the roots never overlap
+    def root_of(self, path):
+        for i, prefix in enumerate(self.root_prefixes):
+            if path.startswith(prefix):
+                return i
+        return 0
+
+    # The name of each root in the header of its column, its base name
+    # unless another root has the same
+    def root_captions(self):
+        names = [os.path.basename(root) or root for root in self.roots]
+        return tuple(name if names.count(name) == 1 else root
+                     for name, root in zip(names, self.roots))
+
+    def insert_binary(self, size):
+        self.binaries += 1
+        self.binary_size += size
+
+    def path(self, i):
+        begin = self.path_ends[i - 1] if i else 0
+        return self.path_buffer[begin:self.path_ends[i]].decode(
+            'utf-8', 'surrogateescape')
+
+    def report(self):
+        captions = self.with_kinds(self.captions)
+        n = len(captions) - 1
+        totals = {lang: self.lang_totals[code][:n] + self.root_lines[code]
+                  for code, lang in enumerate(self.langs)}
+        total = [self.size, self.files, self.lines] + self.kinds
+        report = self.table(captions + self.root_captions(), totals,
+                            total[:n] + self.root_totals)
+        if self.binaries:
+            report += (f'Skipped: {self.binaries} binary files, '
+                       f'{strsize(self.binary_size)}\n')
+        return report
+
+    def with_kinds(self, captions):
+        return captions + self.kind_captions if self.sloc else captions
+
+    # Return the report of the types and files of `lang`, the files of the
+    # same type are listed in counting order
+    def report_language(self, lang, normalize=lambda path: path):
+        return Pages(self, lang, 0).report(normalize)
+
+    # `totals` maps the name of each row to its `[size, files, lines]`,
+    # followed by as many more counts as there are more `captions`
+    @staticmethod
+    def table(captions, totals, total):
+        m = max(19, max(map(len, totals), default=0))
+        widths = [max(width, len(caption)) for width, caption in
+                  zip([15] + [12] * (len(captions) - 2), captions[1:])]
+        row = "%{}s".format(m) + ''.join(f'│%{w}s' for w in widths)
+
+        def rule(line, cross):
+            return m * line + ''.join(cross + w * line for w in widths)
+
+        entries = []
+        for key in sorted(totals):
+            size, *counts = totals[key][:len(captions) - 1]
+            entries.append(row % (key, strsize(size), *counts))
+        caption = row % captions
+        content = '\n'.join(entries)
+        summary = ''
+        if len(entries) > 1:
+            size, *counts = total[:len(captions) - 1]
+            summary = f"""
+{rule('─', '┼')}
+{row % ("Total", strsize(size), *counts)}"""
+        return f"""
+{rule('═', '╤')}
+{caption}
+{rule('─', '┼')}
+{content}{summary}
+{rule('═', '╧')}
+"""
+
+
+# The files of the language `lang` of `results`, shown `size` files at a
+# time, or all at once if `size` is 0. With the 'type' order, the files are
+# grouped by type, in counting order, the other orders list them from the
+# most lines, from the largest size, or by path.
+# The orders are computed once, a page is then rendered in time
+# proportional to its size. The first page of an order not computed yet is
+# selected with a heap instead, so that sorting is only paid for if more
+# pages are shown.
+class Pages:
+    __slots__ = ['results', 'lang', 'size', 'sort', 'page', 'orders',
+                 'type_starts']
+
+    sorts = ('type', 'lines', 'size', 'path')
+
+    def __init__(self, results, lang, size):
+        self.results = results
+        self.lang = lang
+        self.sort = 'type'
+        self.page = 0
+        lang_code = results.lang_codes[lang]
+        members = {}
+        file_types = results.file_types
+        for i, code in enumerate(results.file_langs):
+            if code == lang_code:
+                indexes = members.get(file_types[i])
+                if indexes is None:
+                    indexes = members[file_types[i]] = array('L')
+                indexes.append(i)
+        by_type = array('L')
+        # Index in the 'type' order of the first file of each type
+        self.type_starts = {}
+        for type, type_code in sorted((results.types[code], code)
+                                      for code in members):
+            self.type_starts[type] = len(by_type)
+            by_type += members[type_code]
+        self.orders = {'type': by_type}
+        self.size = size or max(len(by_type), 1)
+
+    @property
+    def count(self):
+        return len(self.orders['type'])
+
+    @property
+    def pages(self):
+        return max(1, -(-self.count // self.size))
+
+    # Return whether the page changed
+    def turn(self, delta):
+        page = min(max(self.page + delta, 0), self.pages - 1)
+        changed, self.page = page != self.page, page
+        return changed
+
+    def sort_by(self, sort):
+        self.sort, self.page = sort, 0
+
+    def goto_type(self, type):
+        self.sort = 'type'
+        self.page = self.type_starts[type] // self.size
+
+    def key(self, sort):
+        if sort == 'lines':
+            return self.results.file_lines.__getitem__
+        if sort == 'size':
+            return self.results.file_sizes.__getitem__
+        return self.results.path
+
+    def rows(self):
+        begin = self.page * self.size
+        order = self.orders.get(self.sort)
+        if order is None:
+            key, rows = self.key(self.sort), self.orders['type']
+            reverse = self.sort != 'path'
+            if self.page == 0:
+                select = heapq.nlargest if reverse else heapq.nsmallest
+                return select(self.size, rows, key=key)
+            order = self.orders[self.sort] = array(
+                'L', sorted(rows, key=key, reverse=reverse))
+        return order[begin:begin + self.size]
+
+    def report(self, normalize=lambda path: path):
+        results = self.results
+        lang_code = results.lang_codes[self.lang]
+        sizes, lines = results.file_sizes, results.file_lines
+        paths = '\n'.join(f'{strsize(sizes[i]):>10}│{lines[i]:>8}│'
+                          f'  {normalize(results.path(i))}'
+                          for i in self.rows())
+        table = results.table(
+            results.with_kinds(results.type_captions),
+            {type: results.type_totals[lang_code, results.type_codes[type]]
+             for type in self.type_starts},
+            results.lang_totals[lang_code])
+        page = ''
+        if self.pages > 1 or self.sort != 'type':
+            begin = self.page * self.size
+            end = min(begin + self.size, self.count)
+            page = (f'Page {self.page + 1}/{self.pages}, files {begin + 1}-'
+                    f'{end} of {self.count}, sorted by {self.sort}\n')
+        return table + '\n\n\n' + page + f"""
+══════════╤════════╤══════════════════════════════════════════
+      Size│   Lines│  Path
+──────────┼────────┼──────────────────────────────────────────
+{paths}
+══════════╧════════╧══════════════════════════════════════════
+"""
@@ -0,0 +1,250 @@
+import os
+import time
+import heapq
+import queue
+
+from .utils import strsize
+
+
+# The listing of one directory: the total size of its files linked once,
+# its number of files, the `(dev, inode, size)` of its files linked more
+# than once, its `top` largest files as `(size, name)`, and the names of
+# its subdirectories. Symbolic links are files of their own size, the
+# directories they point to are never entered.
+# Return `(mtime_ns, listing, cached)`, where `cached` tells whether the
+# listing is the `known` one, a former `(mtime_ns, listing)` of `path`,
+# still valid as the mtime of the directory is the same. The listing is
+# None if the directory can not be listed.
+def list_folder(path, known, top, cancel):
+    if cancel.is_set():
+        return None, None, False
+    try:
+        # Taken before the listing, so that a change made while listing
+        # makes the listing stale
+        mtime_ns = os.stat(path, follow_symlinks=False).st_mtime_ns
+        if known is not None and known[0] == mtime_ns:
+            return mtime_ns, known[1], True
+        with os.scandir(path) as entries:
+            entries = list(entries)
+    except OSError:
+        return None, None, False
+    size = files = 0
+    links, largest, folders = [], [], []
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                folders.append(entry.name)
+                continue
+            stat = entry.stat(follow_symlinks=False)
+        except OSError:
+            files += 1
+            continue
+        files += 1
+        # `st_nlink` is 0 for the entries of a directory on Windows, where
+        # hard links are not told apart
+        if stat.st_nlink > 1:
+            links.append((stat.st_dev, stat.st_ino, stat.st_size))
+        else:
+            size += stat.st_size
+        largest.append((stat.st_size, entry.name))
+    largest = heapq.nlargest(top, largest)
+    return mtime_ns, (size, files, links, largest, folders), False
+
+
+# A directory under measure, `size`, `files` and `folders` are those of its
+# whole subtree, they grow as its subdirectories are listed
+class Folder:
+    __slots__ = ['path', 'name', 'parent', 'size', 'files', 'folders']
+
+    def __init__(self, path, name, parent):
+        self.path = path
+        self.name = name
+        self.parent = parent
+        self.size = 0
+        self.files = 0
+        self.folders = 0
+
+
+# The sizes of the subtrees of `rootdir`, in the manner of `du`, but with
+# the apparent size of the files. A file with several hard links is only
+# counted once, in the first directory where it is met. The totals of the
+# immediate subdirectories of `rootdir` and the `top` largest files of the
+# whole tree are kept up to date on each listing added, so that partial
+# results can be reported while measuring.
+class FolderSizes:
+    __slots__ = ['rootdir', 'top', 'root', 'children', 'largest', 'inodes',
+                 'errors']
+
+    def __init__(self, rootdir, top):
+        self.rootdir = rootdir
+        self.top = top
+        self.root = Folder(rootdir, '', None)
+        # The immediate subdirectories of `rootdir`
+        self.children = []
+        # A heap of the `top` largest files, as `(size, path)`
+        self.largest = []
+        # `(dev, inode)` of the files with several hard links met so far
+        self.inodes = set()
+        # Number of directories that could not be listed
+        self.errors = 0
+
+    def __len__(self):
+        return self.root.files
+
+    @property
+    def size(self):
+        return self.root.size
+
+    @property
+    def files(self):
+        return self.root.files
+
+    @property
+    def folders(self):
+        return self.root.folders
+
+    # Add the `listing` of `folder`, and return the folders of its
+    # subdirectories
+    def add(self, folder, listing):
+        size, files, links, largest, names = listing
+        inodes = self.inodes
+        for dev, inode, link_size in links:
+            if (dev, inode) not in inodes:
+                inodes.add((dev, inode))
+                size += link_size
+        parent = folder
+        while parent is not None:
+            parent.size += size
+            parent.files += files
+            parent.folders += len(names)
+            parent = parent.parent
+        heap, top = self.largest, self.top
+        for file_size, name in largest:
+            if len(heap) < top:
+                heapq.heappush(heap, (file_size, os.path.join(folder.path,
+                                                              name)))
+            elif file_size > heap[0][0]:
+                heapq.heapreplace(heap, (file_size, os.path.join(folder.path,
+                                                                 name)))
+            else:
+                # The largest files of a listing come first
+                break
+        folders = [Folder(os.path.join(folder.path, name), name, folder)
+                   for name in names]
+        if folder is self.root:
+            self.children.extend(folders)
+        return folders
+
+    def report(self):
+        def share(size):
+            return f'{size / total:.1%}' if total else '-'
+
+        total = self.root.size
+        report = (f'TotalSize:\t{strsize(total)}({total} Bytes)\n'
+                  f'Contains:\tFiles: {self.files}, Folders: {self.folders}\n')
+        if self.errors:
+            report += f'Unreadable:\t{self.errors} folders\n'
+        folders = heapq.nlargest(self.top, self.children,
+                                 key=lambda folder: folder.size)
+        if folders:
+            rows = '\n'.join(f'{strsize(folder.size):>10}│'
+                             f'{share(folder.size):>7}│{folder.files:>9}│'
+                             f'  {folder.name}{os.sep}'
+                             for folder in folders)
+            more = len(self.children) - len(folders)
+            if more:
+                rows += f'\n{"":>10}│{"":>7}│{"":>9}│  ({more} more)'
+            report += f"""
+══════════╤═══════╤═════════╤═════════════════════════════════
+      Size│  Share│    Files│  Folders
+──────────┼───────┼─────────┼─────────────────────────────────
+{rows}
+══════════╧═══════╧═════════╧═════════════════════════════════
+"""
+        if self.largest:
+            prefix = os.path.join(self.rootdir, '')
+            rows = '\n'.join(f'{strsize(size):>10}│{share(size):>7}│'
+                             f'  {path[len(prefix):]}'
+                             for size, path in sorted(self.largest,
+                                                      reverse=True))
+            report += f"""
+══════════╤═══════╤═══════════════════════════════════════════
+      Size│  Share│  Largest files
+──────────┼───────┼───────────────────────────────────────────
+{rows}
+══════════╧═══════╧═══════════════════════════════════════════
+"""
+        return report
+
+
+# List the directory `path`, then its subdirectories depth first, until
+# about `budget` entries are listed, for the small directories not to be
+# listed by a job each. Return the `(path, mtime_ns, listing, cached)` of
+# each directory, see `list_folder`, and the subdirectories left to list.
+# `cache` is only read here.
+def list_folders(path, cache, top, cancel, budget):
+    listed, stack = [], [path]
+    entries = 0
+    while stack and entries < budget:
+        path = stack.pop()
+        known = cache.get(path) if cache is not None else None
+        mtime_ns, listing, cached = list_folder(path, known, top, cancel)
+        listed.append((path, mtime_ns, listing, cached))
+        if listing is not None:
+            names = listing[4]
+            # A listing cached only costs a stat
+            entries += 1 if cached else listing[1] + len(names)
+            stack.extend(os.path.join(path, name) for name in reversed(names))
+    return listed, stack
+
+
+# Measure the subtrees of `rootdir` with `executor`, where each job lists
+# a few directories, and gives back the subdirectories it did not list to
+# be listed by other jobs, so that sibling subtrees are listed at the same
+# time. The listings are added in the calling thread as they come.
+# With a `cache.SizeCache`, a directory whose mtime has not changed since
+# its last listing is not listed again, only its subdirectories are.
+# `on_update` is called with the partial `FolderSizes` after each job.
+# The measure stops early once `task` is stopped.
+def measure(task, rootdir, executor, cache=None, top=10, on_update=None,
+            budget=256):
+    sizes = FolderSizes(rootdir, top)
+    done = queue.SimpleQueue()
+    # The directories modified this recently may still change within the
+    # resolution of their mtime, their listings are not cached
+    recent_ns = time.time_ns() - 2 * 10**9
+    # The folders met but not listed yet, by path
+    waiting = {rootdir: sizes.root}
+
+    def submit(path):
+        future = executor.submit(list_folders, path, cache, top,
+                                 task.cancelled, budget)
+        future.add_done_callback(done.put)
+
+    submit(rootdir)
+    pending = 1
+    while pending:
+        listed, unlisted = done.get().result()
+        pending -= 1
+        if task.stopped is not None:
+            continue
+        for path, mtime_ns, listing, cached in listed:
+            folder = waiting.pop(path)
+            if listing is None:
+                sizes.errors += 1
+                continue
+            if cache is not None:
+                if cached:
+                    cache.hit(path)
+                else:
+                    cache.misses += 1
+                    if mtime_ns < recent_ns:
+                        cache.put(path, mtime_ns, listing)
+            for child in sizes.add(folder, listing):
+                waiting[child.path] = child
+        for path in unlisted:
+            submit(path)
+            pending += 1
+        if on_update:
+            on_update(sizes)
+    return sizes
@@ -0,0 +1,260 @@
+import os
+import glob
+import time
+import heapq
+import pickle
+import hashlib
+import tempfile
+from array import array
+
+
+# A count saved in a file of the snapshots directory, to be compared with
+# later counts of the same root directory without reading its files again.
+# The file holds two pickles: a header, read alone to list the snapshots,
+# then the columns of the files, sorted by path. The paths are relative to
+# `rootdir`, utf-8 encoded and joined with NUL bytes, the language of each
+# file is a code into `langs`.
+class Snapshot:
+    __slots__ = ['path', 'rootdir', 'time', 'files', 'lines', 'langs',
+                 'lang_totals', 'file_langs', 'file_sizes', 'file_lines',
+                 'paths']
+
+    version = 1
+    suffix = '.snapshot'
+
+    def __init__(self, path, rootdir, time, files, lines):
+        self.path = path
+        self.rootdir = rootdir
+        self.time = time
+        self.files = files
+        self.lines = lines
+        self.langs = None
+        # `[files, lines]` of each language, by language code
+        self.lang_totals = None
+        self.file_langs = None
+        self.file_sizes = None
+        self.file_lines = None
+        self.paths = None
+
+    @staticmethod
+    def folder(directory, rootdir):
+        name = hashlib.sha1(rootdir.encode('utf-8', 'surrogateescape'))
+        return os.path.join(directory, name.hexdigest())
+
+    # Save `results`, a `results.Results`, as the latest snapshot of its
+    # root directory, and remove the oldest ones beyond `keep`
+    @classmethod
+    def save(cls, directory, results, keep):
+        buffer, ends = bytes(results.path_buffer), results.path_ends
+        paths = [buffer[begin:end]
+                 for begin, end in zip([0] + ends[:-1].tolist(), ends)]
+        order = sorted(range(len(paths)), key=paths.__getitem__)
+        columns = (
+            results.langs,
+            [[totals[1], totals[2]] for totals in results.lang_totals],
+            array('H', [results.file_langs[i] for i in order]),
+            array('q', [results.file_sizes[i] for i in order]),
+            array('q', [results.file_lines[i] for i in order]),
+            b'\0'.join([paths[i] for i in order]))
+        header = (cls.version, results.rootdir, time.time(), results.files,
+                  results.lines)
+        folder = cls.folder(directory, results.rootdir)
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f'{time.time_ns()}{cls.suffix}')
+        # The temporary file is unique even to the threads of a process,
+        # for two counts of the same directory not to write the same file
+        fd, temp = tempfile.mkstemp(suffix='.tmp', dir=folder)
+        try:
+            with os.fdopen(fd, 'wb') as fd:
+                pickle.dump(header, fd, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(columns, fd, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp, path)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+        snapshots = sorted(glob.glob(os.path.join(folder, '*' + cls.suffix)))
+        for snapshot in snapshots[:-keep]:
+            try:
+                os.remove(snapshot)
+            except FileNotFoundError:
+                # Removed by another save
+                pass
+        return path
+
+    # Return the `Snapshot` of the file `path` without its columns, or None
+    # if it can not be read
+    @classmethod
+    def open(cls, path):
+        try:
+            with open(path, 'rb') as fd:
+                version, *header = pickle.load(fd)
+        except Exception:
+            return None
+        if version != cls.version:
+            return None
+        return cls(path, *header)
+
+    def strftime(self):
+        return time.strftime('%Y/%m/%d/%H:%M', time.localtime(self.time))
+
+    def load(self):
+        with open(self.path, 'rb') as fd:
+            pickle.load(fd)
+            (self.langs, self.lang_totals, self.file_langs, self.file_sizes,
+             self.file_lines, paths) = pickle.load(fd)
+        self.paths = paths.split(b'\0') if paths else []
+        return self
+
+    # Return the snapshots of all the root directories, from the latest
+    @classmethod
+    def list(cls, directory):
+        paths = glob.glob(os.path.join(directory, '*', '*' + cls.suffix))
+        snapshots = filter(None, map(cls.open, paths))
+        return sorted(snapshots, key=lambda snapshot: snapshot.time,
+                      reverse=True)
+
+
+# The differences between two snapshots of a root directory, by language
+# and by file. The files of the same path are found with a merge of the two
+# lists of paths, both sorted, which skips whole blocks of files unchanged
+# at once. A file whose language changed is removed from its former
+# language and added to the new one.
+class SnapshotDiff:
+    __slots__ = ['old', 'new', 'langs', 'files']
+
+    # Number of files compared at once in the runs of unchanged files
+    block = 32
+    captions = ('Languages', 'Files', '+Files', '-Files', '~Files',
+                'Lines', '+Lines', '-Lines')
+
+    def __init__(self, old, new):
+        self.old = old
+        self.new = new
+        # `[files, added, removed, changed, lines, +lines, -lines]` of
+        # each language
+        self.langs = {}
+        # `(path, old lines, new lines)` of each file added, removed or
+        # changed, -1 stands for the lines of a file missing
+        self.files = []
+        self.compare()
+
+    def compare(self):
+        old, new = self.old, self.new
+        old_paths, new_paths = old.paths, new.paths
+        old_lines, new_lines = old.file_lines, new.file_lines
+        # The codes of the new snapshot, translated to those of the old one
+        codes = {lang: code for code, lang in enumerate(old.langs)}
+        langs = list(old.langs)
+        for lang in new.langs:
+            if lang not in codes:
+                codes[lang] = len(langs)
+                langs.append(lang)
+        translate = [codes[lang] for lang in new.langs]
+        old_langs, new_langs = old.file_langs, new.file_langs
+        if translate != list(range(len(translate))):
+            new_langs = array('H', [translate[code] for code in new_langs])
+        self.langs = {lang: [0] * 7 for lang in langs}
+        for lang, (files, lines) in zip(new.langs, new.lang_totals):
+            totals = self.langs[lang]
+            totals[0] = files
+            totals[4] = lines
+        files = self.files
+        n, m, block = len(old_paths), len(new_paths), self.block
+
+        def removed(i):
+            totals = self.langs[langs[old_langs[i]]]
+            totals[2] += 1
+            totals[6] += old_lines[i]
+            files.append((old_paths[i], old_lines[i], -1))
+
+        def added(j):
+            totals = self.langs[langs[new_langs[j]]]
+            totals[1] += 1
+            totals[5] += new_lines[j]
+            files.append((new_paths[j], -1, new_lines[j]))
+
+        i = j = 0
+        while i < n and j < m:
+            if (old_paths[i:i + block] == new_paths[j:j + block]
+                    and old_lines[i:i + block] == new_lines[j:j + block]
+                    and old_langs[i:i + block] == new_langs[j:j + block]):
+                i += block
+                j += block
+                continue
+            end = i + block
+            while i < end and i < n and j < m:
+                path = old_paths[i]
+                if path == new_paths[j]:
+                    if old_langs[i] != new_langs[j]:
+                        removed(i)
+                        added(j)
+                    elif old_lines[i] != new_lines[j]:
+                        totals = self.langs[langs[old_langs[i]]]
+                        totals[3] += 1
+                        delta = new_lines[j] - old_lines[i]
+                        totals[5 if delta > 0 else 6] += abs(delta)
+                        files.append((path, old_lines[i], new_lines[j]))
+                    i += 1
+                    j += 1
+                elif path < new_paths[j]:
+                    removed(i)
+                    i += 1
+                else:
+                    added(j)
+                    j += 1
+        for i in range(i, n):
+            removed(i)
+        for j in range(j, m):
+            added(j)
+        # The languages that were and are still empty
+        for lang in [lang for lang, totals in self.langs.items()
+                     if not any(totals)]:
+            del self.langs[lang]
+
+    # Return the table of the languages, and the `top` files of the most
+    # lines added or removed
+    def report(self, top=1000):
+        def change(file):
+            return abs(max(file[2], 0) - max(file[1], 0))
+
+        m = max([19] + [len(lang) for lang in self.langs])
+        row = f'%{m}s' + '│%10s' * 4 + '│%12s' * 3
+        rule = lambda line, cross: m * line + (cross + 10 * line) * 4 + (
+            cross + 12 * line) * 3
+        totals = [sum(column) for column in zip(*self.langs.values())]
+        rows = '\n'.join(row % (lang, *self.langs[lang])
+                         for lang in sorted(self.langs))
+        report = ''.join(
+            f'{caption}: {snapshot.strftime()}, {snapshot.files} files, '
+            f'{snapshot.lines} lines\n'
+            for caption, snapshot in (('From', self.old), ('To', self.new)))
+        report += f"""
+{rule('═', '╤')}
+{row % self.captions}
+{rule('─', '┼')}
+{rows}
+{rule('─', '┼')}
+{row % ('Total', *totals) if totals else ''}
+{rule('═', '╧')}
+"""
+        files = heapq.nlargest(top, self.files, key=change)
+        if not files:
+            return report
+        statuses = {(True, False): 'added', (False, True): 'removed'}
+        rows = '\n'.join(
+            f'{statuses.get((old < 0, new < 0), "changed"):>10}│'
+            f'{max(old, 0):>8}│{max(new, 0):>8}│'
+            f'  {path.decode("utf-8", "surrogateescape")}'
+            for path, old, new in files)
+        more = len(self.files) - len(files)
+        more = f', the {top} of the most lines changed' if more else ''
+        return report + f"""
+
+{len(self.files)} files added, removed or changed{more}
+
+══════════╤════════╤════════╤════════════════════════════════════
+    Status│     Old│     New│  Path
+──────────┼────────┼────────┼────────────────────────────────────
+{rows}
+══════════╧════════╧════════╧════════════════════════════════════
+"""
@@ -0,0 +1,405 @@
+import os
+import time
+import heapq
+import queue
+import threading
+from contextlib import contextmanager
+
+
+def try_or_zero(thunk):
+    try:
+       return thunk()
+    except:
+       return 0
+
+
+@contextmanager
+def cd(path):
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+
+
+def strsize(bytesize):
+    k = 0
+    while bytesize >> (k + 10):
+        k += 10
+    units = ("B", "KB", "MB", "GB")
+    size_by_unit = round(bytesize / (1 << k), 2) if k else bytesize
+    return str(size_by_unit) + units[k // 10]
+
+
+# `inode` and `dev` are 0 when unknown, as for the entries of a directory
+# on Windows
+class FileEntry:
+    __slots__ = ['path', 'name', 'size', 'mtime_ns', 'inode', 'dev']
+
+    def __init__(self, path, name, size, mtime_ns, inode, dev=0):
+        self.path = path
+        self.name = name
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.inode = inode
+        self.dev = dev
+
+
+# Walk the files under `top` in the order of `os.walk`, yielding one
+# `FileEntry` for each file, with the data of its only stat call.
+# Directories that can not be listed are counted in `errors` and skipped,
+# files that can not be stat'ed have a size of 0 and a `mtime_ns` of None.
+# The files of a directory are stat'ed together once it is listed, and
+# `stat_seconds` is the time spent doing so.
+# With an `ignore.Ignore` as `ignore`, the files and directories it ignores
+# are skipped, and the directories ignored are never listed.
+# The walk ends before listing another directory once `cancel`, a
+# `lc.CancelFlag`, is set, even if no file was yielded for long, as when
+# `match` or `ignore` drop them all.
+class Walker:
+    __slots__ = ['top', 'exclude_hidden', 'match', 'follow_symlinks',
+                 'ignore', 'cancel', 'files', 'folders', 'errors',
+                 'stat_seconds']
+
+    def __init__(self, top, exclude_hidden=False, match=None,
+                 follow_symlinks=False, ignore=None, cancel=None):
+        self.top = top
+        self.exclude_hidden = exclude_hidden
+        self.match = match
+        self.follow_symlinks = follow_symlinks
+        self.ignore = ignore
+        self.cancel = cancel
+        self.files = 0
+        self.folders = 0
+        self.errors = 0
+        self.stat_seconds = 0.0
+
+    def __iter__(self):
+        exclude_hidden = self.exclude_hidden
+        match = self.match
+        follow_symlinks = self.follow_symlinks
+        # Identities of the directories entered, to break symlink loops
+        visited = set()
+        if follow_symlinks:
+            try:
+                stat = os.stat(self.top)
+                visited.add((stat.st_dev, stat.st_ino))
+            except OSError:
+                pass
+        stack = [(self.top, self.ignore)]
+        while stack:
+            if self.cancel is not None and self.cancel.is_set():
+                return
+            top, ignore = stack.pop()
+            dirs, files = [], []
+            try:
+                with os.scandir(top) as entries:
+                    entries = list(entries)
+            except OSError:
+                self.errors += 1
+                entries = []
+            if ignore is not None:
+                ignore = ignore.enter(top, [entry.name for entry in entries])
+            for entry in entries:
+                name = entry.name
+                if exclude_hidden and name[0] == '.':
+                    continue
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if ignore is not None and ignore.ignored(entry.path, is_dir):
+                    continue
+                if is_dir:
+                    dirs.append(entry)
+                    continue
+                self.files += 1
+                if match and not match(entry.path):
+                    continue
+                files.append(entry)
+            start = time.perf_counter()
+            for i, entry in enumerate(files):
+                try:
+                    stat = entry.stat()
+                    files[i] = FileEntry(entry.path, entry.name, stat.st_size,
+                                         stat.st_mtime_ns, stat.st_ino,
+                                         stat.st_dev)
+                except OSError:
+                    files[i] = FileEntry(entry.path, entry.name, 0, None, 0)
+            self.stat_seconds += time.perf_counter() - start
+            yield from files
+            self.folders += len(dirs)
+            for entry in reversed(dirs):
+                try:
+                    if follow_symlinks:
+                        stat = entry.stat()
+                        if (stat.st_dev, stat.st_ino) in visited:
+                            continue
+                        visited.add((stat.st_dev, stat.st_ino))
+                    elif entry.is_symlink():
+                        continue
+                except OSError:
+                    self.errors += 1
+                    continue
+                stack.append((entry.path, ignore))
+
+    # Return whether the walk yields `path`, a file under `top`, looking
+    # only at the directories between them, and not at the others
+    def walks(self, path):
+        relpath = os.path.relpath(path, self.top)
+        names = relpath.split(os.sep)
+        if names[0] == os.pardir or relpath == os.curdir:
+            return False
+        if self.exclude_hidden and any(name[0] == '.' for name in names):
+            return False
+        ignore, directory = self.ignore, self.top
+        for i, name in enumerate(names):
+            is_dir = i < len(names) - 1
+            if ignore is not None:
+                ignore = ignore.enter(directory, [
+                    name for name in ignore.names
+                    if os.path.lexists(os.path.join(directory, name))])
+            path = os.path.join(directory, name)
+            if ignore is not None and ignore.ignored(path, is_dir):
+                return False
+            if is_dir:
+                if not self.follow_symlinks and os.path.islink(path):
+                    return False
+                directory = path
+        if self.match and not self.match(path):
+            return False
+        return os.path.lexists(path) and not os.path.isdir(path)
+
+
+# Return the `roots` that are neither the same as, nor under, another one
+# of them once their symbolic links are resolved, in their order
+def distinct_roots(roots):
+    real = [os.path.join(os.path.normcase(os.path.realpath(root)), '')
+            for root in roots]
+    distinct = []
+    for i, root in enumerate(roots):
+        if not any(real[i].startswith(other) and (real[i] != other or j < i)
+                   for j, other in enumerate(real) if j != i):
+            distinct.append(root)
+    return distinct
+
+
+# Walk the `walkers` of several roots at the same time, each in a thread of
+# its own, and yield their files root after root, so that they come in the
+# same order as walking the roots one by one. Each walker runs ahead by at
+# most `maxsize` batches of `size` files. A file met again, through a hard
+# link or a symbolic link, under the same root or another one, is only
+# yielded the first time, and counted in `duplicates`. The counters are
+# the sums of those of the walkers. `cancel` is given to the walkers.
+class RootsWalker:
+    __slots__ = ['walkers', 'size', 'maxsize', 'cancel', 'duplicates']
+
+    def __init__(self, walkers, size=256, maxsize=64, cancel=None):
+        self.walkers = walkers
+        self.size = size
+        self.maxsize = maxsize
+        self.cancel = cancel
+        self.duplicates = 0
+
+    def __iter__(self):
+        for walker in self.walkers:
+            walker.cancel = self.cancel
+        batches = [ThreadedBatches(walker, self.size, self.maxsize,
+                                   self.cancel)
+                   for walker in self.walkers]
+        for batch in batches:
+            batch.start()
+        seen = set()
+        try:
+            for walker in batches:
+                for batch in walker:
+                    for entry in batch:
+                        # The identity of a file is unknown without inode
+                        if entry.inode:
+                            key = (entry.dev, entry.inode)
+                            if key in seen:
+                                self.duplicates += 1
+                                continue
+                            seen.add(key)
+                        yield entry
+        finally:
+            for batch in batches:
+                batch.stop()
+
+    @property
+    def files(self):
+        return sum(walker.files for walker in self.walkers)
+
+    @property
+    def folders(self):
+        return sum(walker.folders for walker in self.walkers)
+
+    @property
+    def errors(self):
+        return sum(walker.errors for walker in self.walkers)
+
+    @property
+    def stat_seconds(self):
+        return sum(walker.stat_seconds for walker in self.walkers)
+
+
+# Iterate `iterable` in a thread of its own, and yield its items in lists of
+# at most `size` items, through a queue holding at most `maxsize` lists.
+# `produced` is the number of items taken from `iterable` so far, and
+# `done` tells whether `iterable` is exhausted, and `busy_seconds` is the
+# time spent iterating it, not counting the waits for room in the queue.
+# The iteration stops once `cancel`, a `lc.CancelFlag`, is set. With a
+# `timeout`, an empty list is yielded whenever no batch came for that many
+# seconds, for the consumer to notice a cancel while the iterable is slow
+# to give items.
+class ThreadedBatches:
+    __slots__ = ['iterable', 'size', 'cancel', 'timeout', 'queue',
+                 'produced', 'done', 'error', 'stopped', 'busy_seconds',
+                 'thread']
+
+    def __init__(self, iterable, size, maxsize, cancel=None, timeout=None):
+        self.iterable = iterable
+        self.size = size
+        self.cancel = cancel
+        self.timeout = timeout
+        self.queue = queue.Queue(maxsize)
+        self.produced = 0
+        self.done = False
+        self.error = None
+        self.stopped = False
+        self.busy_seconds = 0.0
+        self.thread = None
+
+    # Start iterating `iterable`, before the batches are asked for
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.produce, daemon=True)
+            self.thread.start()
+
+    def __iter__(self):
+        self.start()
+        try:
+            while True:
+                try:
+                    batch = self.queue.get(timeout=self.timeout)
+                except queue.Empty:
+                    yield []
+                    continue
+                if batch is None:
+                    break
+                yield batch
+        finally:
+            # Let the producer go, if it is waiting for room in the queue
+            self.stopped = True
+        if self.error is not None:
+            raise self.error
+
+    def stop(self):
+        self.stopped = True
+
+    def produce(self):
+        start = time.perf_counter()
+        try:
+            batch = []
+            cancel = self.cancel
+            for item in self.iterable:
+                if self.stopped or cancel is not None and cancel.is_set():
+                    return
+                batch.append(item)
+                self.produced += 1
+                if len(batch) == self.size:
+                    self.busy_seconds += time.perf_counter() - start
+                    if not self.put(batch):
+                        return
+                    start = time.perf_counter()
+                    batch = []
+            self.busy_seconds += time.perf_counter() - start
+            self.done = True
+            if batch:
+                self.put(batch)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.put(None)
+
+    def put(self, item):
+        while not self.stopped:
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+
+# Time and items spent in each stage of a count, with the bytes read and
+# the slowest files counted. Stages are timed once per batch of files, and
+# a file is compared with the fastest of the slowest ones only, so that the
+# profiling is cheap enough to be always on. Stages may be timed from
+# several threads at once, in which case their times add up.
+class Profiler:
+    __slots__ = ['stages', 'bytes', 'slowest', 'max_slowest', 'lock']
+
+    stage_names = ('walk', 'stat', 'classify', 'count', 'summarize',
+                   'export', 'render', 'insert')
+
+    def __init__(self, max_slowest=10):
+        self.stages = {name: [0.0, 0] for name in self.stage_names}
+        self.bytes = 0
+        # Min-heap of `(nanoseconds, path)`
+        self.slowest = []
+        self.max_slowest = max_slowest
+        self.lock = threading.Lock()
+
+    def add(self, stage, seconds, items=1):
+        with self.lock:
+            record = self.stages[stage]
+            record[0] += seconds
+            record[1] += items
+
+    @contextmanager
+    def measure(self, stage, items=1):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start, items)
+
+    # Record the `(lines, size, nanoseconds)` results of a counter
+    def add_files(self, paths, results):
+        slowest, max_slowest = self.slowest, self.max_slowest
+        with self.lock:
+            for path, (_, size, nanos, *_) in zip(paths, results):
+                if size > 0:
+                    self.bytes += size
+                if len(slowest) < max_slowest:
+                    heapq.heappush(slowest, (nanos, path))
+                elif nanos > slowest[0][0]:
+                    heapq.heapreplace(slowest, (nanos, path))
+
+    def summary(self):
+        return {
+            'stages': {
+                name: {'seconds': round(seconds, 6), 'items': items}
+                for name, (seconds, items) in self.stages.items()
+            },
+            'bytes_read': self.bytes,
+            'slowest_files': [
+                {'path': path, 'seconds': round(nanos / 1e9, 6)}
+                for nanos, path in sorted(self.slowest, reverse=True)
+            ]
+        }
+
+    def report(self, normalize=lambda path: path):
+        row = "%9s│%12s│%12s"
+        lines = [row % ('Stage', 'Seconds', 'Items'),
+                 '─────────┼────────────┼────────────']
+        for name, (seconds, items) in self.stages.items():
+            lines.append(row % (name, f'{seconds:.3f}', items))
+        lines.append(f'\nBytes read: {strsize(self.bytes)}')
+        if self.slowest:
+            lines.append('Slowest files:')
+            for nanos, path in sorted(self.slowest, reverse=True):
+                lines.append(f'{nanos / 1e6:>10.3f}ms  {normalize(path)}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,154 @@
+import os
+import threading
+
+from . import lc
+from .utils import FileEntry
+
+
+# The counts of the files under `roots`, kept after a first count for the
+# totals to stay current as the files change, without counting again those
+# that did not. Each file is indexed by its path, with the mtime and the
+# size it was counted at, and the totals of its language are updated by
+# difference when it is counted again, added or removed, so that an update
+# costs the files it touches only, whatever the size of the roots.
+# The files in no language and the binary files are indexed too, with a
+# language of None, for the sweeps not to count them again.
+# The index is updated from several threads, under `lock`.
+class WatchIndex:
+    __slots__ = ['roots', 'sloc', 'prefixes', 'entries', 'lang_totals',
+                 'totals', 'baseline', 'lock']
+
+    def __init__(self, roots, sloc=False):
+        self.roots = list(roots)
+        self.sloc = sloc
+        self.prefixes = tuple(os.path.join(os.path.normpath(root), '')
+                              for root in self.roots)
+        # `(mtime_ns, size, lang, lines, kinds)` of each file, by path
+        self.entries = {}
+        # `[size, files, lines]` of each language, followed by
+        # `[code, comments, blanks]` with `sloc`
+        self.lang_totals = {}
+        # The same totals, of all the languages
+        self.totals = [0] * (6 if sloc else 3)
+        # The lines once the first count is over
+        self.baseline = 0
+        self.lock = threading.RLock()
+
+    def watches(self, path):
+        return path.startswith(self.prefixes)
+
+    # Index `entry`, a `utils.FileEntry`, as a file of `lang` with `lines`,
+    # as given by `engine.classify_and_count`
+    def put(self, entry, lang, lines, kinds=None):
+        if lines == lc.BINARY:
+            lang = None
+        with self.lock:
+            self.add(self.entries.get(entry.path), -1)
+            value = (entry.mtime_ns, entry.size, lang, lines, kinds)
+            self.entries[entry.path] = value
+            self.add(value, 1)
+
+    def remove(self, path):
+        with self.lock:
+            self.add(self.entries.pop(path, None), -1)
+
+    # Remove the files under `directory`, this is the only update that
+    # goes through the whole index
+    def remove_tree(self, directory):
+        prefix = os.path.join(directory, '')
+        with self.lock:
+            for path in [path for path in self.entries
+                         if path.startswith(prefix)]:
+                self.remove(path)
+
+    # Add the counts of an entry of the index to the totals, or subtract
+    # them with a `sign` of -1
+    def add(self, value, sign):
+        if value is None or value[2] is None:
+            return
+        _, size, lang, lines, kinds = value
+        totals = self.lang_totals.get(lang)
+        if totals is None:
+            totals = self.lang_totals[lang] = [0] * len(self.totals)
+        for totals in (totals, self.totals):
+            totals[0] += sign * size
+            totals[1] += sign
+            totals[2] += sign * lines
+            if self.sloc:
+                totals[3] += sign * kinds[0]
+                totals[4] += sign * kinds[1]
+                totals[5] += sign * kinds[2]
+        if not self.lang_totals[lang][1]:
+            del self.lang_totals[lang]
+
+    # Whether `entry` is not indexed, or has changed since it was. The
+    # files that could not be stat'ed are always counted again
+    def changed(self, entry):
+        value = self.entries.get(entry.path)
+        return (value is None or entry.mtime_ns is None
+                or value[0] != entry.mtime_ns or value[1] != entry.size)
+
+    # Count again those of `entries` that changed with `engine`, in the
+    # calling thread, and return their number
+    def refresh(self, engine, entries):
+        changed = [entry for entry in entries if self.changed(entry)]
+        for begin in range(0, len(changed), engine.batch_size):
+            batch = changed[begin:begin + engine.batch_size]
+            for entry, (lang, _, lines, kinds) in zip(
+                    batch, engine.count_entries(batch)):
+                if lines is not None:
+                    self.put(entry, lang, lines, kinds)
+        return len(changed)
+
+    # Count `path` again once it is saved, or count it if it is new and
+    # the walk of its root yields it. Either way, this only looks at the
+    # file and at the directories above it, up to its root
+    def saved(self, engine, path):
+        if path not in self.entries:
+            root = next((root for root, prefix in zip(self.roots,
+                                                      self.prefixes)
+                         if path.startswith(prefix)), None)
+            if root is None or not engine.walks(root, path):
+                return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.remove(path)
+            return
+        self.refresh(engine, [FileEntry(path, os.path.basename(path),
+                                        stat.st_size, stat.st_mtime_ns,
+                                        stat.st_ino, stat.st_dev)])
+
+    # Walk the roots again with `engine`, count the files added or changed
+    # since they were indexed, and remove those gone. Return the number of
+    # files added, changed or removed.
+    # This is the only way to find the files changed outside of the editor,
+    # a walk only stats the files, but it goes through all of them.
+    def sweep(self, engine):
+        _, _, walker = engine.walk_roots(self.roots)
+        seen, batch = set(), []
+        changed = 0
+        for entry in walker:
+            seen.add(entry.path)
+            if self.changed(entry):
+                batch.append(entry)
+                if len(batch) == engine.batch_size:
+                    changed += self.refresh(engine, batch)
+                    batch = []
+        changed += self.refresh(engine, batch)
+        with self.lock:
+            gone = [path for path in self.entries if path not in seen]
+            for path in gone:
+                self.remove(path)
+        return changed + len(gone)
+
+    # The totals in a line, with the lines added or removed since the first
+    # count
+    def status(self):
+        size, files, lines, *kinds = self.totals
+        status = f'{files} files, {lines} lines'
+        if kinds:
+            status += f', {kinds[0]} code'
+        if lines != self.baseline:
+            status += f' ({lines - self.baseline:+})'
+        return status
@@ -1,17 +1,20 @@
 import re
 import os
+import json
 import time
 import threading
-from contextlib import contextmanager
-from functools import partial, reduce
+from functools import partial
 from os.path import relpath
 
 import sublime
 import sublime_plugin
 
-from . import utils
-from .src import lc
-from .utils import cd, strsize, try_or_zero
+from .codelines import lc, utils
+from .codelines.cache import ResultCache, SizeCache
+from .codelines.engine import Engine, Task
+from .codelines.results import Pages
+from .codelines.snapshots import Snapshot, SnapshotDiff
+from .codelines.utils import Profiler
 
 
 class Debug:
@@ -51,6 +54,14 @@ class SideBarCodeLinesCommand(SideBarFileSizeCommand):
     command = 'code_lines_in_directory'
 
 
+class SideBarCodeLinesInFoldersCommand(sublime_plugin.WindowCommand):
+    def run(self, paths):
+        self.window.run_command('code_lines_in_folders', {'paths': paths})
+
+    def is_visible(self, paths):
+        return len(paths) > 1 and all(map(os.path.isdir, paths))
+
+
 class SideBarCodeLinesWithPatternCommand(SideBarFileSizeCommand):
     command = 'code_lines_in_directory_with_pattern'
 
@@ -60,11 +71,76 @@ class SideBarCodeLinesWithPatternCommand(SideBarFileSizeCommand):
 
 class CodeLinesShowTypesCommand(sublime_plugin.TextCommand):
     def run(self, edit):
-        if self.view.settings().has("cl_languages"):
+        if self.view.settings().has("cl_results"):
             pt = self.view.sel()[0].a
             CodeLinesViewsManager.show_types_at(self.view, pt)
 
 
+class CodeLinesPagesCommand(sublime_plugin.TextCommand):
+    def pages(self):
+        pages = CodeLinesViewsManager.registry.get(self.view.id())
+        return pages if isinstance(pages, Pages) else None
+
+    def is_enabled(self, **args):
+        return self.pages() is not None
+
+
+class CodeLinesTurnPageCommand(CodeLinesPagesCommand):
+    def run(self, edit, delta=1):
+        pages = self.pages()
+        if pages.turn(delta):
+            CodeLinesViewsManager.show_page(self.view, pages)
+
+
+class CodeLinesSortFilesCommand(CodeLinesPagesCommand):
+    def run(self, edit, sort):
+        pages = self.pages()
+        pages.sort_by(sort)
+        CodeLinesViewsManager.show_page(self.view, pages)
+
+    def input(self, args):
+        if 'sort' not in args:
+            return SortInputHandler()
+
+
+class SortInputHandler(sublime_plugin.ListInputHandler):
+    def placeholder(self):
+        return 'Sort by'
+
+    def list_items(self):
+        return [(sort.capitalize(), sort) for sort in Pages.sorts]
+
+
+class CodeLinesGotoTypeCommand(CodeLinesPagesCommand):
+    def run(self, edit, type):
+        pages = self.pages()
+        pages.goto_type(type)
+        CodeLinesViewsManager.show_page(self.view, pages)
+
+    def input(self, args):
+        if 'type' not in args:
+            return TypeInputHandler(self.pages())
+
+
+class TypeInputHandler(sublime_plugin.ListInputHandler):
+    def __init__(self, pages):
+        self.pages = pages
+
+    def placeholder(self):
+        return 'Type'
+
+    def list_items(self):
+        return list(self.pages.type_starts)
+
+
+class CodeLinesReplaceCommand(sublime_plugin.TextCommand):
+    def run(self, edit, begin, text):
+        region = sublime.Region(begin, self.view.size())
+        self.view.set_read_only(False)
+        self.view.replace(edit, region, text)
+        self.view.set_read_only(True)
+
+
 class CodeLinesOpenFileCommand(sublime_plugin.TextCommand):
     def run(self, edit):
         if self.view.settings().has("cl_language"):
@@ -94,45 +170,136 @@ class PathInputHandler(sublime_plugin.TextInputHandler):
 
 class CodeLinesFileSizeCommand(sublime_plugin.WindowCommand):
     def run(self, path):
-        task = StatusBarTask(lambda: self.show_size(path),
-            'Counting...', 'Succeed.')
+        task = StatusBarTask(None, 'Measuring...', 'Succeed.')
+        task.function = lambda: self.show_size(task, path)
         StatusBarThread(task, self.window)
 
     def input(self, args):
         return PathInputHandler()
 
-    def show_size(self, path):
-        def strsize(bytes):
-            return f'{utils.strsize(bytes)}({bytes} Bytes)'
-
-        if os.path.isfile(path):
-            output = (
-                f'PATH: {path}\n'
-                f'Size: {strsize(os.path.getsize(path))}')
-        else:
-            info = self.FolderInfo(path)
-            output = (
-                f'ROOTDIR: {path}\n'
-                f'TotalSize:\t{strsize(info.size)}\n'
-                f'Contains:\tFiles: {info.files}, Folders: {info.folders}')
-
+    # The sizes of a folder are shown as they are measured, in the same
+    # way as the lines of a count
+    def show_size(self, task, path):
         panel = self.window.create_output_panel('FileSize')
         panel.assign_syntax('FileSize.sublime-syntax')
-        panel.run_command('append', {'characters': output})
+        if os.path.isfile(path):
+            size = os.path.getsize(path)
+            head = f'PATH: {path}\nSize: {utils.strsize(size)}({size} Bytes)'
+        else:
+            head = f'ROOTDIR: {path}\n'
+        panel.run_command('append', {'characters': head})
         self.window.run_command('show_panel', {'panel': 'output.FileSize'})
+        if os.path.isfile(path):
+            return
+        manager = CodeLinesViewsManager
+        report = LiveReport(panel, len(head), manager.refresh_interval,
+                            Profiler())
+        sizes = manager.engine.measure_sizes(task, path, report.update)
+        body = sizes.report()
+        if task.stopped is not None:
+            body = f'Stopped: {task.stopped}, the sizes are partial\n' + body
+        report.show(body)
+
 
-    class FolderInfo:
-        __slots__ = ['size', 'files', 'folders']
+class CodeLinesCancelCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        for thread in self.running_threads():
+            thread.task.cancel()
+
+    def is_enabled(self):
+        return bool(self.running_threads())
+
+    def running_threads(self):
+        return [thread for thread in StatusBarThread.running
+                if thread.window == self.window]
 
-        def __init__(self, path):
-            self.size = 0
-            self.files = 0
-            self.folders = 0
-            for path, dirs, files in os.walk(path):
-                for file in files:
-                    self.size += os.path.getsize(os.path.join(path, file))
-                self.files += len(files)
-                self.folders += len(dirs)
+
+class CodeLinesClearCacheCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        cache_dir = CodeLinesViewsManager.engine.cache_dir
+        cleared = ResultCache.clear(cache_dir) + SizeCache.clear(cache_dir)
+        self.window.status_message(
+            f'{__package__}: {cleared} cached results cleared')
+
+
+# Compare two snapshots, the paths of their files, or else a snapshot
+# picked from a list with the latest one of the same directory
+class CodeLinesDiffSnapshotsCommand(sublime_plugin.WindowCommand):
+    def run(self, old=None, new=None):
+        if old and new:
+            self.diff(old, new)
+            return
+        snapshots = Snapshot.list(CodeLinesViewsManager.engine.snapshots_dir)
+        latest = {}
+        for snapshot in snapshots:
+            latest.setdefault(snapshot.rootdir, snapshot)
+        older = [snapshot for snapshot in snapshots
+                 if latest[snapshot.rootdir] is not snapshot]
+        if not older:
+            self.window.status_message(
+                f'{__package__}: no two counts of a directory to compare')
+            return
+        items = [[snapshot.rootdir,
+                  f'{snapshot.strftime()} → '
+                  f'{latest[snapshot.rootdir].strftime()}, '
+                  f'{snapshot.files} → {latest[snapshot.rootdir].files} files']
+                 for snapshot in older]
+
+        def on_done(index):
+            if index >= 0:
+                snapshot = older[index]
+                self.diff(snapshot.path, latest[snapshot.rootdir].path)
+        self.window.show_quick_panel(items, on_done)
+
+    def diff(self, old, new):
+        task = StatusBarTask(lambda: self.show_diff(old, new),
+                             'Comparing...', 'Succeed.')
+        StatusBarThread(task, self.window)
+
+    def show_diff(self, old, new):
+        old, new = Snapshot.open(old), Snapshot.open(new)
+        if old is None or new is None:
+            error('CodeLines: The snapshot can not be read')
+            return
+        diff = SnapshotDiff(old.load(), new.load())
+        manager = CodeLinesViewsManager
+        text = f'ROOTDIR: {manager.normalize(new.rootdir)}\n' + diff.report(
+            manager.page_size or len(diff.files))
+
+        def show():
+            view = manager.create_view(self.window,
+                                       settings={'rootdir': new.rootdir},
+                                       text=text, name=f'{__package__} - Diff')
+            view.assign_syntax('CodeLinesDiff.sublime-syntax')
+        sublime.set_timeout(show)
+
+
+# Count `path` without opening a report, only to write its files and its
+# languages in `format`, by default the "export_format" of the settings or
+# else JSON Lines, into `output`, by default a new file of the export
+# directory
+class CodeLinesExportCommand(sublime_plugin.WindowCommand):
+    def run(self, path, format=None, output=None):
+        if not os.path.isdir(path):
+            error(f'CodeLines: No such directory: {path}')
+            return
+        engine = CodeLinesViewsManager.engine
+        rootdir = CodeLinesViewsManager.normalize(path)
+        try:
+            exporter = engine.open_exporter(
+                rootdir, format or engine.export_format or 'jsonl', output)
+        except (ValueError, OSError) as e:
+            error(f'CodeLines: Can not export the count: {e}')
+            return
+        task = StatusBarTask(None, 'Exporting', f'Exported to {exporter.path}')
+        task.function = lambda: engine.count_lines(
+            task, rootdir, engine.walk(rootdir), Profiler(), exporter=exporter)
+        StatusBarThread(task, self.window)
+
+    def input(self, args):
+        if 'path' not in args:
+            return PathInputHandler(is_wanted=os.path.isdir,
+                                    path_type='Directory Path')
 
 
 class CodeLinesInDefaultPathCommand(sublime_plugin.WindowCommand):
@@ -165,20 +332,7 @@ class CodeLinesInDirectoryCommand(sublime_plugin.WindowCommand):
         CodeLinesViewsManager.run_task(self.window, path, self.get_filepaths)
 
     def get_filepaths(self, top):
-        filepaths = []
-        if CodeLinesViewsManager.exclude_hidden_files:
-            for root, dirs, files in os.walk(top):
-                for file in files:
-                    if not file[0] == '.':
-                        path = os.path.join(root, file)
-                        filepaths.append((path, file))
-                dirs[:] = [d for d in dirs if not d[0] == '.']
-        else:
-            for root, dirs, files in os.walk(top):
-                for file in files:
-                    path = os.path.join(root, file)
-                    filepaths.append((path, file))
-        return filepaths
+        return CodeLinesViewsManager.engine.walk(top)
 
 
 class CodeLinesInDirectoryWithPatternCommand(CodeLinesInDirectoryCommand):
@@ -191,7 +345,10 @@ class CodeLinesInDirectoryWithPatternCommand(CodeLinesInDirectoryCommand):
         def count_directory_with_pattern(path, pattern):
             Debug.print(f'pattern: {pattern}')
             self.regex = re.compile(pattern)
-            super(self.__class__, self).count_directory(path)
+            # Only the counts of all the files are saved as snapshots
+            CodeLinesViewsManager.run_task(
+                self.window, path, self.get_filepaths,
+                snapshot=pattern in ('', '.*'))
 
         default_pattern = CodeLinesViewsManager.default_pattern
         if from_settings:
@@ -206,27 +363,62 @@ class CodeLinesInDirectoryWithPatternCommand(CodeLinesInDirectoryCommand):
             panel.assign_syntax('RegExp.sublime-syntax')
 
     def get_filepaths(self, top):
-        filepaths = []
-        if CodeLinesViewsManager.exclude_hidden_files:
-            for root, dirs, files in os.walk(top):
-                for file in files:
-                    if not file[0] == '.':
-                        path = os.path.join(root, file)
-                        if self.regex.match(path):
-                            filepaths.append((path, file))
-                dirs[:] = [d for d in dirs if not d[0] == '.']
-        else:
-            for root, dirs, files in os.walk(top):
-                for file in files:
-                    path = os.path.join(root, file)
-                    if self.regex.match(path):
-                        filepaths.append((path, file))
-        return filepaths
+        return CodeLinesViewsManager.engine.walk(top, match=self.regex.match)
+
+
+# Count the folders of the window, or `paths`, into a single report with a
+# column of lines for each folder. Folders under another one are only
+# counted with it, and a file reached from several folders is read once
+class CodeLinesInFoldersCommand(sublime_plugin.WindowCommand):
+    def run(self, paths=None):
+        roots = [path for path in paths or self.window.folders()
+                 if os.path.isdir(path)]
+        if not roots:
+            error('CodeLines: No folder to count')
+            return
+        manager = CodeLinesViewsManager
+        rootdir, roots, walker = manager.engine.walk_roots(
+            [manager.normalize(root) for root in roots])
+        # A single report of several folders is not a count of their
+        # common directory, to be compared with its snapshots
+        manager.run_task(self.window, rootdir, lambda rootdir: walker, roots,
+                         snapshot=len(roots) == 1)
+
+    def is_enabled(self, paths=None):
+        return bool(paths or self.window.folders())
+
+
+# Count the folders of the window, or `paths`, then keep their totals in
+# the status bar, as the files are saved, deleted from the side bar, or
+# found changed by a sweep of the folders every "watch_interval" seconds
+class CodeLinesWatchCommand(sublime_plugin.WindowCommand):
+    def run(self, paths=None):
+        roots = [path for path in paths or self.window.folders()
+                 if os.path.isdir(path)]
+        if not roots:
+            error('CodeLines: No folder to watch')
+            return
+        CodeLinesWatcher.start(self.window, roots)
+
+    def is_enabled(self, paths=None):
+        return (self.window.id() not in CodeLinesWatcher.watches
+                and bool(paths or self.window.folders()))
+
+
+class CodeLinesStopWatchingCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        CodeLinesWatcher.stop(self.window)
+
+    def is_enabled(self):
+        return self.window.id() in CodeLinesWatcher.watches
 
 
 class CodeLinesViewsManager(sublime_plugin.EventListener):
     syntax_path = f'{__package__}.sublime-syntax'
     settings_name = f'{__package__}.sublime-settings'
+    # The results of the reports opened, by view id, the views only hold
+    # their id in the `cl_results` setting
+    registry = {}
 
     @classmethod
     def init(cls):
@@ -237,126 +429,130 @@ class CodeLinesViewsManager(sublime_plugin.EventListener):
 
     @classmethod
     def reload(cls, settings):
-        lc.set_encoding(settings.get('encoding', 'utf-8'))
         Debug.set_debug(settings.get('debug', False))
         cls.font_face = settings.get('font_face', 'Lucida Console')
         cls.default_path = settings.get('default_path', '')
         cls.default_pattern = settings.get('default_pattern', '.*')
-        cls.exclude_hidden_files = settings.get('exclude_hidden_files', True)
-        syntaxes = settings.get('syntaxes', [])
-        ignored_syntaxes = settings.get('ignored_syntaxes', [])
-        aliases_ = settings.get('aliases', {})
-        aliases = {}
-        for syntax in aliases_:
-            for aliase in aliases_[syntax]:
-                aliases[aliase] = syntax
-        cls.language_decider = cls.create_language_decider(
-            syntaxes, ignored_syntaxes, aliases)
+        cls.refresh_interval = settings.get('refresh_interval', 1000) / 1000
+        cls.page_size = settings.get('page_size', 1000)
+        cls.profile_report = settings.get('profile_report', False)
+        cls.watch_interval = settings.get('watch_interval', 60)
+        cls.engine = Engine(
+            settings.to_dict(),
+            find_syntax=lambda file, first_line='':
+                sublime.find_syntax_for_file(file, first_line).name,
+            cache_dir=os.path.join(sublime.cache_path(), __package__),
+            log=Debug.print)
         if is_windows and settings.get('use_unix_style_path', True):
             cls.normalize = lambda path: path.replace('\\', '/')
         else:
             cls.normalize = lambda path: path
 
     @classmethod
-    def create_language_decider(cls, syntaxes, ignored_syntaxes, aliases):
-        def get_first_line(file):
-            try:
-                # We use UTF-8 encoding to read the first line
-                with open(file, 'r', encoding='UTF-8') as fd:
-                    return fd.readline(1024)
-            except:
-                return ''
-
-        if syntaxes:
-            def get_language_with_syntaxes(file):
-                first_line = get_first_line(file)
-                lang = sublime.find_syntax_for_file(file, first_line).name
-                if lang in aliases:
-                    lang = aliases[lang]
-                if lang in syntaxes:
-                    return lang
-                return None
-            return get_language_with_syntaxes
-        else:
-            def get_language_with_ignored_syntaxes(file):
-                first_line = get_first_line(file)
-                lang = sublime.find_syntax_for_file(file, first_line).name
-                if lang in ignored_syntaxes:
-                    return None
-                if lang in aliases:
-                    lang = aliases[lang]
-                    if lang in ignored_syntaxes:
-                        return None
-                return lang
-            return get_language_with_ignored_syntaxes
-
-    @classmethod
-    def run_task(cls, window, rootdir, get_filepaths):
+    def run_task(cls, window, rootdir, get_filepaths, roots=(),
+                 snapshot=True):
         rootdir = cls.normalize(rootdir)
         cl_time = time.strftime("%Y/%m/%d/%H:%M")
-        compose = lambda fs: reduce(lambda f, g: lambda x: f(g(x)), fs)
-        task = StatusBarTask(None, 'Counting files', 'Succeed')
-        task.function = lambda: compose([
-            partial(cls.show_languages, window, rootdir, cl_time),
-            partial(cls.count_lines, task, rootdir),
-            get_filepaths,
-        ])(rootdir)
-        StatusBarThread(task, window)
-
-    @classmethod
-    def count_lines(cls, task, rootdir, filepaths):
-        task.message = 'Counting lines'
-        status_message = task.status_message
-        show_status_message = task.status_bar.show_status_message
-        decide_language = cls.language_decider
-        languages = Languages()
-        counted, total = 0, len(filepaths)
-        with task.status_bar.pause():
-            for path, file in filepaths:
-                lang = decide_language(path)
-                if lang:
-                    ext = os.path.splitext(file)[1].lstrip('.')
-                    type = ext if ext else file
-                    languages.insert(lang, type, path)
-                counted += 1
-                show_status_message(f'{status_message()}({counted}/{total})')
-        languages.summarize()
-        return languages
-
-    @classmethod
-    def show_languages(cls, window, rootdir, cl_time, languages):
-        if not languages.entries:
-            window.status_message(f'{__package__}: No matching files')
-            return
-        cl_languages = {}
-        with cd(rootdir):
-            for lang, types in languages.entries.items():
-                cl_languages[lang] = types.report()
-        head = f'ROOTDIR: {rootdir}\nTime: {cl_time}\n\n\n'
-        body = languages.report()
-        cls.create_view(
+        head = cls.head(rootdir, cl_time)
+        view = cls.create_view(
             window,
             settings={
                 'rootdir': rootdir,
                 'cl_time': cl_time,
-                'cl_languages': cl_languages
             },
-            text=head + body)
+            text=head)
+        profiler = Profiler()
+        report = LiveReport(view, len(head), cls.refresh_interval, profiler)
+        task = StatusBarTask(None, 'Counting lines', 'Succeed')
+        try:
+            exporter = cls.engine.open_exporter(rootdir)
+        except (ValueError, OSError) as e:
+            error(f'CodeLines: Can not export the count: {e}')
+            exporter = None
+        if exporter is not None:
+            task.success = f'Succeed, exported to {exporter.path}'
+        task.function = lambda: cls.show_languages(
+            report, rootdir,
+            cls.engine.count_lines(task, rootdir, get_filepaths(rootdir),
+                                   profiler, report.update, roots, exporter),
+            task.stopped, snapshot)
+        StatusBarThread(task, window)
 
     @classmethod
-    def show_types(cls, view, rootdir, cl_time, lang, types_report):
+    def show_languages(cls, report, rootdir, results, stopped=None,
+                       snapshot=False):
+        if not results:
+            report.close()
+            message = 'No matching files'
+            if stopped is not None:
+                message = f'Stopped: {stopped}, no file counted'
+            report.view.window().status_message(f'{__package__}: {message}')
+            cls.show_profile(report, rootdir, False)
+            return
+        profiler = report.profiler
+        with profiler.measure('render', results.files):
+            body = results.report()
+        if stopped is not None:
+            body = f'Stopped: {stopped}, the results are partial\n' + body
+        view = report.view
+
+        # Registered on the main thread, so that `on_close` can not run
+        # before, for the results to be freed with the view
+        def register():
+            if view.is_valid():
+                cls.registry[view.id()] = results
+        sublime.set_timeout(register)
+        report.show(body, settings={'cl_results': view.id()})
+        cls.show_profile(report, rootdir, cls.profile_report)
+        if snapshot and stopped is None:
+            cls.engine.save_snapshot(results)
+
+    # Once the report is in the view, print the profile of the count, and
+    # append it to the report if `footer` is true
+    @classmethod
+    def show_profile(cls, report, rootdir, footer):
+        profiler = report.profiler
+
+        def show():
+            Debug.print('profile:', json.dumps(profiler.summary()))
+            if footer and report.view.is_valid():
+                text = '\n' + profiler.report(
+                    lambda path: cls.normalize(relpath(path, rootdir)))
+                report.view.run_command('code_lines_replace', {
+                    'begin': report.view.size(), 'text': text})
+        sublime.set_timeout(show)
+
+    @staticmethod
+    def head(rootdir, cl_time):
+        return f'ROOTDIR: {rootdir}\nTime: {cl_time}\n\n\n'
+
+    @classmethod
+    def show_types(cls, view, rootdir, cl_time, lang, pages):
         Debug.print(f'open language {lang}')
-        head = f'ROOTDIR: {rootdir}\nTime: {cl_time}\n\n\n'
-        body = types_report
-        cls.create_view(
+        head = cls.head(rootdir, cl_time)
+        body = pages.report(cls.normalize)
+        view = cls.create_view(
             view.window(),
             settings={
                 'rootdir': rootdir,
                 'cl_time': cl_time,
                 'cl_language': lang,
+                'cl_paginated': True,
             },
             text=head + body,
             name=f'{__package__} - {lang}')
+        cls.registry[view.id()] = pages
+
+    # Render the page of the files shown in `view` again
+    @classmethod
+    def show_page(cls, view, pages):
+        settings = view.settings()
+        begin = len(cls.head(settings.get('rootdir'), settings.get('cl_time')))
+        view.run_command('code_lines_replace', {
+            'begin': begin, 'text': pages.report(cls.normalize)})
+        view.sel().clear()
+        view.sel().add(sublime.Region(begin))
+        view.show(begin)
 
     @classmethod
     def create_view(cls, window, settings={}, text='', name=__package__):
@@ -372,15 +568,22 @@ class CodeLinesViewsManager(sublime_plugin.EventListener):
         view.set_name(name)
         view.set_scratch(True)
         view.set_read_only(True)
+        return view
 
     @classmethod
     def show_types_at(cls, view, pt):
-        cl_languages = view.settings().get("cl_languages")
+        results = cls.registry.get(view.settings().get("cl_results"))
         lang = view.substr(view.extract_scope(pt))
-        if lang in cl_languages:
+        if results is None:
+            # The view outlived the plugin, after a restart or a reload
+            view.window().status_message(
+                f'{__package__}: the results are gone, please count again')
+            return False
+        if lang in results.lang_codes:
             rootdir = view.settings().get("rootdir")
             cl_time = view.settings().get("cl_time")
-            cls.show_types(view, rootdir, cl_time, lang, cl_languages[lang])
+            pages = Pages(results, lang, cls.page_size)
+            cls.show_types(view, rootdir, cl_time, lang, pages)
             return True
         return False
 
@@ -404,139 +607,198 @@ class CodeLinesViewsManager(sublime_plugin.EventListener):
             if view.settings().has("cl_language"):
                 if CodeLinesViewsManager.open_file_at(view, pt):
                     return (name, args)
-            elif view.settings().has("cl_languages"):
+            elif view.settings().has("cl_results"):
                 if CodeLinesViewsManager.show_types_at(view, pt):
                     return (name, args)
 
+    def on_close(self, view):
+        self.registry.pop(view.id(), None)
+
+
+# The report view of a count in progress, its text after `begin` is
+# replaced by the partial results at most once per `interval` seconds
+class LiveReport:
+    __slots__ = ['view', 'begin', 'interval', 'last_update', 'profiler']
+
+    def __init__(self, view, begin, interval, profiler):
+        self.view = view
+        self.begin = begin
+        self.interval = interval
+        self.last_update = time.perf_counter()
+        self.profiler = profiler
+
+    # Nothing is shown until the first file is counted, or measured
+    def update(self, results):
+        now = time.perf_counter()
+        if results and now - self.last_update >= self.interval:
+            self.last_update = now
+            with self.profiler.measure('render', results.files):
+                text = results.report()
+            self.show(text)
+
+    # Callbacks of `set_timeout` run in order, so a partial report never
+    # replaces the final one
+    def show(self, text, settings=None):
+        def replace():
+            if self.view.is_valid():
+                if settings:
+                    self.view.settings().update(settings)
+                with self.profiler.measure('insert'):
+                    self.view.run_command('code_lines_replace', {
+                        'begin': self.begin, 'text': text})
+        sublime.set_timeout(replace)
+
+    def close(self):
+        sublime.set_timeout(self.view.close)
+
+
+# The index of the folders watched in a window, swept in a thread of its
+# own every `interval` seconds, or never if it is 0. The index is only
+# updated with the `engine` it was counted with, the changes of the
+# settings apply to the next watch. The totals are shown in the status bar
+# of all the views of the window.
+class Watch:
+    __slots__ = ['window', 'index', 'engine', 'interval', 'wake', 'stopped']
+
+    key = 'code_lines_watch'
+
+    def __init__(self, window, index, engine, interval):
+        self.window = window
+        self.index = index
+        self.engine = engine
+        self.interval = interval
+        self.wake = threading.Event()
+        self.stopped = False
+        threading.Thread(target=self.run, daemon=True).start()
 
-class File:
-    __slots__ = ['path', 'size', 'lines']
-
-    def __init__(self, path, size, lines):
-        self.path = path
-        self.size = size
-        self.lines = lines
-
-    def report(self):
-        path = CodeLinesViewsManager.normalize(relpath(self.path))
-        return f'{strsize(self.size):>10}│{self.lines:>8}│  {path}'
-
-
-class Type:
-    __slots__ = ['size', 'files', 'lines', 'entries']
-
-    def __init__(self, size, files, lines, entries):
-        self.size = size
-        self.files = files
-        self.lines = lines
-        self.entries = entries
-
-    def insert(self, file):
-        self.entries.append(file)
-
-    def summarize(self):
-        for entry in self.entries:
-            self.size += entry.size
-            self.lines += entry.lines
-        self.files = len(self.entries)
-
+    def run(self):
+        while True:
+            self.wake.wait(self.interval or None)
+            self.wake.clear()
+            if self.stopped:
+                return
+            if self.index.sweep(self.engine):
+                self.show()
+
+    def stop(self):
+        self.stopped = True
+        self.wake.set()
+        for view in self.window.views():
+            view.erase_status(self.key)
+
+    def show(self, views=None):
+        status = f'{__package__}: {self.index.status()}'
+        for view in views or self.window.views():
+            view.set_status(self.key, status)
+
+
+# The watches, by window id, they are only added and removed on the main
+# thread. A file saved is counted again at once, or counted if it is new
+# and not excluded from the walk of its folder. The deletions of the side
+# bar update the index at once, the other changes, such as renames, are
+# left to the sweeps.
+# The paths are kept native, to be compared with those of the views.
+class CodeLinesWatcher(sublime_plugin.EventListener):
+    watches = {}
 
-class Types(Type):
-    __slots__ = []
+    @classmethod
+    def start(cls, window, roots):
+        manager = CodeLinesViewsManager
+        engine = manager.engine
+        task = StatusBarTask(None, 'Indexing', 'Watching')
+        # The budgets do not apply to the index, only a cancel stops it
+        task.stopped_message = 'Stopped: {}, not watching'
+
+        def watch():
+            index = engine.watch(task, roots, Profiler())
+            if task.stopped is not None:
+                return
+
+            def register():
+                if window.is_valid() and window.id() not in cls.watches:
+                    watch = cls.watches[window.id()] = Watch(
+                        window, index, engine, manager.watch_interval)
+                    watch.show()
+            sublime.set_timeout(register)
+        task.function = watch
+        StatusBarThread(task, window)
 
-    captions = ('Types', 'Size', 'Files', 'Lines')
-
-    def __init__(self):
-        super().__init__(0, 0, 0, {})
-
-    def insert(self, type, file):
-        if type not in self.entries:
-            self.entries[type] = Type(0, 0, 0, [])
-        self.entries[type].insert(file)
-
-    def summarize(self):
-        for entry in self.entries.values():
-            entry.summarize()
-            self.size += entry.size
-            self.files += entry.files
-            self.lines += entry.lines
-
-    def report(self):
-        types = Languages.report(self)
-        paths = []
-        for type in sorted(self.entries):
-            data = self.entries[type]
-            for file in data.entries:
-                paths.append(file.report())
-        paths = '\n'.join(paths)
-        return types + '\n\n\n' + f"""
-══════════╤════════╤══════════════════════════════════════════
-      Size│   Lines│  Path
-──────────┼────────┼──────────────────────────────────────────
-{paths}
-══════════╧════════╧══════════════════════════════════════════
-"""
-
-
-class Languages(Types):
-    __slots__ = []
+    @classmethod
+    def stop(cls, window):
+        watch = cls.watches.pop(window.id(), None)
+        if watch is not None:
+            watch.stop()
 
-    captions = ('Languages', 'Size', 'Files', 'Lines')
-
-    def insert(self, lang, type, path):
-        if lang not in self.entries:
-            self.entries[lang] = Types()
-        size = try_or_zero(lambda: os.path.getsize(path))
-        lines = try_or_zero(lambda: size and lc.count(path))
-        file = File(path=path, size=size, lines=lines)
-        self.entries[lang].insert(type, file)
-
-    def report(self):
-        m = max(19, max(map(len, self.entries)))
-        row = "%{}s│%15s│%12s│%12s".format(m)
-        entries = []
-        for key in sorted(self.entries):
-            data = self.entries[key]
-            text = row % (key, strsize(data.size), data.files, data.lines)
-            entries.append(text)
-        caption = row % self.captions
-        content = '\n'.join(entries)
-        summary = ''
-        if len(entries) > 1:
-            summary = f"""
-{m * '─'}┼───────────────┼────────────┼────────────
-{row % ("Total", strsize(self.size), self.files, self.lines)}"""
-        return f"""
-{m * '═'}╤═══════════════╤════════════╤════════════
-{caption}
-{m * '─'}┼───────────────┼────────────┼────────────
-{content}{summary}
-{m * '═'}╧═══════════════╧════════════╧════════════
-"""
-
-
-class StatusBarTask:
+    @classmethod
+    def stop_all(cls):
+        for watch in cls.watches.values():
+            watch.stop()
+        cls.watches.clear()
+
+    def on_post_save_async(self, view):
+        path = view.file_name()
+        for watch in list(self.watches.values()):
+            if path and watch.index.watches(path):
+                watch.index.saved(watch.engine, path)
+                watch.show()
+
+    def on_activated_async(self, view):
+        window = view.window()
+        watch = window and self.watches.get(window.id())
+        if watch is not None:
+            watch.show([view])
+
+    def on_post_window_command(self, window, command, args):
+        watch = self.watches.get(window.id())
+        if watch is None or args is None:
+            return
+        if command == 'delete_file':
+            for path in args.get('files', []):
+                if not os.path.exists(path):
+                    watch.index.remove(path)
+            watch.show()
+        elif command == 'delete_folder':
+            for path in args.get('dirs', []):
+                if not os.path.exists(path):
+                    watch.index.remove_tree(path)
+            watch.show()
+
+    def on_pre_close_window(self, window):
+        self.stop(window)
+
+
+class StatusBarTask(Task):
     def __init__(self, function, message, success):
+        super().__init__()
         self.function = function
         self.message = message
         self.success = success
+        # The message once stopped, of the reason
+        self.stopped_message = 'Stopped: {}'
 
     def attach(self, status_bar):
         self.status_bar = status_bar
 
     def status_message(self):
-        return f'{self.message} {self.status_bar.status}'
+        message = f'{self.message} {self.status_bar.status}'
+        if self.progress is not None:
+            message += f' {self.progress.report()}'
+        return message
 
     def finish_message(self):
+        if self.stopped is not None:
+            return self.stopped_message.format(self.stopped)
         return self.success
 
 
 class StatusBarThread:
+    # The threads running, for the tasks to be cancelled
+    running = set()
+
     def __init__(self, task, window, key='__z{|}~__'):
         self.state = 7
         self.step = 1
         self.last_view = None
-        self.need_refresh = True
         self.window = window
         self.key = key
         self.status = ''
@@ -544,19 +806,16 @@ class StatusBarThread:
         self.task.attach(self)
         self.thread = threading.Thread(target=task.function)
         self.thread.start()
+        self.running.add(self)
         self.update_status_message()
 
-    @contextmanager
-    def pause(self):
-        self.need_refresh = False
-        yield
-        self.need_refresh = True
-
+    # Runs on the main thread every 100ms, this is the only place where
+    # the status bar is updated while the task is running
     def update_status_message(self):
         self.update_status_bar()
-        if self.need_refresh:
-            self.show_status_message(self.task.status_message())
+        self.show_status_message(self.task.status_message())
         if not self.thread.is_alive():
+            self.running.discard(self)
             cleanup = self.last_view.erase_status
             self.last_view.set_status(self.key, self.task.finish_message())
             sublime.set_timeout(lambda: cleanup(self.key), 2000)
@@ -596,4 +855,5 @@ def plugin_loaded():
 
 
 def plugin_unloaded():
+    CodeLinesWatcher.stop_all()
     lc.unload_shared_object()
@@ -1,61 +1,860 @@
 #include <stdio.h>
+#include <stdlib.h>
 #include <string.h>
+#include <stdint.h>
 #include <fcntl.h>
 #include <errno.h>
 
 #ifndef _WIN32
     #include <unistd.h>
+    #include <time.h>
+#else
+    #include <windows.h>
+#endif
+
+#if defined(__SSE2__) || defined(_M_X64)
+    #include <emmintrin.h>
+    #define LC_SSE2
 #endif
 
 #ifndef O_BINARY
     #define O_BINARY 0
 #endif
 
-#define IO_BUF_SIZE 8192
+#define IO_BUF_SIZE (1 << 18)
+/* Number of bytes at the start of a file sniffed for binary content */
+#define LC_SNIFF_SIZE 8192
+/* The lines of a binary file skipped by sniffing */
+#define LC_BINARY -2
 
-static char buffer[IO_BUF_SIZE] = {EOF};
-static char *bufend = &buffer[IO_BUF_SIZE];
-static char *bufptr = &buffer[2];
-static char last;
+#define ONES    ((uint64_t)-1 / 0xFF)   /* 0x0101010101010101 */
+#define LOW7    (ONES * 0x7F)           /* 0x7F7F7F7F7F7F7F7F */
+#define NEWLINE (ONES * '\n')           /* 0x0A0A0A0A0A0A0A0A */
 
-static char peek() { return *bufptr++; }
-static void flush_buffer(int fd)
+static long long now_ns(void)
 {
-    last = bufptr[-2];
-    int len = read(fd, buffer, IO_BUF_SIZE - 1);
-    if (len < 0) len = 0;
-    buffer[len] = EOF;
-    bufptr = buffer;
+#ifdef _WIN32
+    LARGE_INTEGER frequency, counter;
+    QueryPerformanceFrequency(&frequency);
+    QueryPerformanceCounter(&counter);
+    return counter.QuadPart / frequency.QuadPart * 1000000000LL
+        + counter.QuadPart % frequency.QuadPart * 1000000000LL
+        / frequency.QuadPart;
+#else
+    struct timespec now;
+    clock_gettime(CLOCK_MONOTONIC, &now);
+    return now.tv_sec * 1000000000LL + now.tv_nsec;
+#endif
+}
+
+/*
+ * Count the '\n' bytes of `buf`, eight bytes at a time.
+ * For each word, the high bit of a byte of `~t` is set if and only if
+ * the byte equals '\n', the per-byte hits are accumulated for at most
+ * 255 words before being summed up, so that no byte lane overflows.
+ */
+static size_t count_newlines(const char *buf, size_t len)
+{
+    const char *p = buf, *end = buf + len;
+    size_t count = 0;
+
+    while (p < end && ((uintptr_t)p & 7))
+        count += *p++ == '\n';
+
+    while (end - p >= 8) {
+        uint64_t acc = 0;
+        size_t words = (end - p) / 8;
+        if (words > 255) words = 255;
+        for (; words; --words, p += 8) {
+            uint64_t x, t;
+            memcpy(&x, p, 8);
+            x ^= NEWLINE;
+            t = ((x & LOW7) + LOW7) | x;
+            acc += (~t >> 7) & ONES;
+        }
+        acc = (acc & 0x00FF00FF00FF00FFULL) + ((acc >> 8) & 0x00FF00FF00FF00FFULL);
+        count += (acc * 0x0001000100010001ULL) >> 48;
+    }
+
+    while (p < end)
+        count += *p++ == '\n';
+
+    return count;
+}
+
+/*
+ * Return the number of invalid sequences in the UTF-8 of `p`, each
+ * maximal prefix of a valid sequence followed by an unexpected byte, or
+ * by the end, counts once, as a replacement character when decoding.
+ */
+static size_t count_invalid_utf8(const unsigned char *p, size_t len)
+{
+    size_t i = 0, invalid = 0;
+
+    while (i < len) {
+        unsigned char c, low = 0x80, high = 0xBF;
+        int follow;
+        uint64_t x;
+        /* Skip the ASCII eight bytes at a time */
+        if (len - i >= 8 && (memcpy(&x, p + i, 8), !(x & (ONES * 0x80)))) {
+            i += 8;
+            continue;
+        }
+        c = p[i++];
+        if (c < 0x80)
+            continue;
+        if (c >= 0xC2 && c <= 0xDF)
+            follow = 1;
+        else if (c >= 0xE0 && c <= 0xEF) {
+            follow = 2;
+            if (c == 0xE0)
+                low = 0xA0;
+            else if (c == 0xED)
+                high = 0x9F;    /* no surrogates */
+        }
+        else if (c >= 0xF0 && c <= 0xF4) {
+            follow = 3;
+            if (c == 0xF0)
+                low = 0x90;
+            else if (c == 0xF4)
+                high = 0x8F;    /* up to U+10FFFF */
+        }
+        else {
+            ++invalid;
+            continue;
+        }
+        for (; follow; --follow, ++i) {
+            if (i == len || p[i] < low || p[i] > high)
+                break;
+            low = 0x80, high = 0xBF;
+        }
+        invalid += follow != 0;
+    }
+    return invalid;
+}
+
+/*
+ * Whether the first block of a file, up to `LC_SNIFF_SIZE` bytes of it,
+ * looks binary: it has a NUL byte, or more than one byte in eight is
+ * invalid UTF-8.
+ */
+static int is_binary(const char *block, size_t len)
+{
+    if (len > LC_SNIFF_SIZE)
+        len = LC_SNIFF_SIZE;
+    return memchr(block, 0, len) != NULL
+        || count_invalid_utf8((const unsigned char *)block, len) * 8 > len;
+}
+
+/*
+ * Count the lines of an opened file, a last line without '\n' counts.
+ * All the state lives in `buffer` and on the stack, so this can be
+ * called from several threads at the same time.
+ * Give up as soon as `*cancel` becomes nonzero, if `cancel` is not NULL.
+ */
+static int count_fd(int fd, char *buffer, int sniff,
+                    const volatile int *cancel,
+                    long long *out_lines, long long *out_size)
+{
+    long long nlines = 0, size = 0;
+    char last = '\n';
+
+    for (; ;) {
+        int len;
+        if (cancel && *cancel)
+            return -1;
+        len = read(fd, buffer, IO_BUF_SIZE);
+        if (len < 0)
+            return -1;
+        if (len == 0)
+            break;
+        /* A binary file is given up after its first block */
+        if (sniff && size == 0 && is_binary(buffer, len)) {
+            *out_lines = LC_BINARY;
+            *out_size = len;
+            return 0;
+        }
+        nlines += count_newlines(buffer, len);
+        size += len;
+        last = buffer[len - 1];
+    }
+    *out_lines = nlines + (last != '\n');
+    *out_size = size;
+    return 0;
+}
+
+static int count_file(const char *filename, char *buffer, int sniff,
+                      const volatile int *cancel,
+                      long long *out_lines, long long *out_size)
+{
+    int result;
+    int fd = open(filename, O_RDONLY | O_BINARY);
+    if (fd < 0)
+        return -1;
+    result = count_fd(fd, buffer, sniff, cancel, out_lines, out_size);
+    close(fd);
+    return result;
 }
 
 int lines_count(const char *filename)
+{
+    long long nlines = 0, size = 0;
+    char *buffer = malloc(IO_BUF_SIZE);
+    if (buffer == NULL)
+        return 0;
+    if (count_file(filename, buffer, 0, NULL, &nlines, &size) < 0) {
+        fprintf(stderr, "Can not open file: %s, %s\n",
+                filename, strerror(errno));
+        nlines = 0;
+    }
+    free(buffer);
+    return (int)nlines;
+}
+
+/*
+ * Count `n` files with one call, the lines and sizes of `paths[i]` are
+ * stored into `out_lines[i]` and `out_sizes[i]`, or -1 if the file can
+ * not be read. Return the number of files that can not be read.
+ * If `cancel` is not NULL, setting `*cancel` to nonzero from another
+ * thread stops the counting within one buffer, the files left are -1.
+ * If `out_nanos` is not NULL, the time spent on `paths[i]`, in
+ * nanoseconds, is stored into `out_nanos[i]`.
+ */
+static int count_many(const char **paths, int n, int sniff,
+                      long long *out_lines, long long *out_sizes,
+                      const volatile int *cancel, long long *out_nanos)
+{
+    int i, failed = 0;
+    long long start = 0;
+    char *buffer = malloc(IO_BUF_SIZE);
+    if (buffer == NULL)
+        return -1;
+    if (out_nanos)
+        start = now_ns();
+    for (i = 0; i < n; ++i) {
+        if (count_file(paths[i], buffer, sniff, cancel,
+                       &out_lines[i], &out_sizes[i]) < 0) {
+            out_lines[i] = out_sizes[i] = -1;
+            ++failed;
+        }
+        if (out_nanos) {
+            long long end = now_ns();
+            out_nanos[i] = end - start;
+            start = end;
+        }
+    }
+    free(buffer);
+    return failed;
+}
+
+int lines_count_many(const char **paths, int n,
+                     long long *out_lines, long long *out_sizes,
+                     const volatile int *cancel, long long *out_nanos)
+{
+    return count_many(paths, n, 0, out_lines, out_sizes, cancel, out_nanos);
+}
+
+/*
+ * Same as `lines_count_many`, but the files whose first block looks binary
+ * are not read further, their lines are `LC_BINARY` and their sizes the
+ * number of bytes sniffed.
+ */
+int lines_count_text_many(const char **paths, int n,
+                          long long *out_lines, long long *out_sizes,
+                          const volatile int *cancel, long long *out_nanos)
+{
+    return count_many(paths, n, 1, out_lines, out_sizes, cancel, out_nanos);
+}
+
+/* Max number of markers of each kind in a comment syntax */
+#define LC_MAX_MARKERS 4
+/*
+ * Markers are shorter than this, a buffer is classified up to this many
+ * bytes before its end, and the bytes left are moved to the next read
+ */
+#define LC_MAX_MARKER 16
+
+/*
+ * The comment syntax of a language, unused markers are NULL. Each byte of
+ * `quotes` opens a string closed by the same byte, or by the end of the
+ * line, in which a backslash escapes the next byte.
+ */
+struct lc_syntax {
+    const char *line_comments[LC_MAX_MARKERS];
+    const char *block_starts[LC_MAX_MARKERS];
+    const char *block_ends[LC_MAX_MARKERS];
+    const char *quotes;
+};
+
+enum { LC_CODE, LC_COMMENT, LC_BLANK };
+
+/* Kinds of bytes, a byte may be of several kinds */
+#define K_NEWLINE 1
+#define K_SPACE   2
+#define K_START   4     /* the first byte of a line or block start marker */
+#define K_END     8     /* the first byte of a block end marker */
+#define K_QUOTE   16
+#define K_ESCAPE  32
+
+#define HIGHS   (ONES * 0x80)           /* 0x8080808080808080 */
+/* Max number of bytes searched for a word at a time */
+#define MAX_STOPS 12
+
+/*
+ * The bytes of `stops` repeated over a vector, or over a word without
+ * SSE2, for `skip` to search several bytes at a time. `n` is -1 if there
+ * are too many of them.
+ */
+struct stop_set {
+    int n;
+    int kinds;
+#ifdef LC_SSE2
+    __m128i words[MAX_STOPS];
+#else
+    uint64_t words[MAX_STOPS];
+#endif
+};
+
+struct classifier {
+    const struct lc_syntax *syntax;
+    unsigned char kinds[256];
+    size_t line_lens[LC_MAX_MARKERS];
+    size_t start_lens[LC_MAX_MARKERS];
+    size_t end_lens[LC_MAX_MARKERS];
+    struct stop_set in_code, in_block, in_string;
+    /*
+     * The bytes `scan_lines` stops on, out of comments, those that start a
+     * marker or a string, and in block comments, those that end them
+     */
+    struct stop_set code_marks, block_marks;
+};
+
+/* The state of a file being classified, only `block` outlives a line */
+struct sloc_state {
+    int block;          /* the block comment open, or -1 */
+    int quote;          /* the quote of the string open, or 0 */
+    int line_comment;
+    int code, comment, pending;
+    long long counts[3];
+};
+
+static size_t marker_len(const char *marker)
+{
+    size_t len = marker ? strlen(marker) : 0;
+    return len < LC_MAX_MARKER ? len : 0;
+}
+
+static void prepare_stops(struct stop_set *stops,
+                          const unsigned char *kinds, int mask)
+{
+    int c;
+
+    stops->n = 0;
+    stops->kinds = mask;
+    for (c = 0; c < 256; ++c) {
+        if (!(kinds[c] & mask))
+            continue;
+        if (stops->n == MAX_STOPS) {
+            stops->n = -1;
+            return;
+        }
+#ifdef LC_SSE2
+        stops->words[stops->n++] = _mm_set1_epi8((char)c);
+#else
+        stops->words[stops->n++] = ONES * c;
+#endif
+    }
+}
+
+static void prepare_classifier(struct classifier *cls,
+                               const struct lc_syntax *syntax)
+{
+    int i;
+    const char *q;
+
+    memset(cls, 0, sizeof(*cls));
+    cls->syntax = syntax;
+    /* The spaces are the bytes up to ' ', control bytes included */
+    for (i = 0; i <= ' '; ++i)
+        cls->kinds[i] = K_SPACE;
+    cls->kinds['\n'] = K_NEWLINE;
+    if (syntax == NULL) {
+        prepare_stops(&cls->in_code, cls->kinds, K_NEWLINE);
+        prepare_stops(&cls->code_marks, cls->kinds, K_START | K_QUOTE);
+        return;
+    }
+    for (i = 0; i < LC_MAX_MARKERS; ++i) {
+        cls->line_lens[i] = marker_len(syntax->line_comments[i]);
+        if (cls->line_lens[i])
+            cls->kinds[(unsigned char)syntax->line_comments[i][0]] |= K_START;
+        cls->start_lens[i] = marker_len(syntax->block_starts[i]);
+        cls->end_lens[i] = marker_len(syntax->block_ends[i]);
+        if (!cls->start_lens[i] || !cls->end_lens[i]) {
+            cls->start_lens[i] = cls->end_lens[i] = 0;
+            continue;
+        }
+        cls->kinds[(unsigned char)syntax->block_starts[i][0]] |= K_START;
+        cls->kinds[(unsigned char)syntax->block_ends[i][0]] |= K_END;
+    }
+    for (q = syntax->quotes; q && *q; ++q)
+        cls->kinds[(unsigned char)*q] |= K_QUOTE;
+    cls->kinds['\\'] |= K_ESCAPE;
+    prepare_stops(&cls->in_code, cls->kinds, K_NEWLINE | K_START | K_QUOTE);
+    prepare_stops(&cls->in_block, cls->kinds, K_NEWLINE | K_END);
+    prepare_stops(&cls->in_string, cls->kinds,
+                  K_NEWLINE | K_QUOTE | K_ESCAPE);
+    prepare_stops(&cls->code_marks, cls->kinds, K_START | K_QUOTE);
+    prepare_stops(&cls->block_marks, cls->kinds, K_END);
+}
+
+static int lowest_bit(uint64_t x)
+{
+#if defined(__GNUC__)
+    return __builtin_ctzll(x);
+#else
+    int i = 0;
+    for (; !(x & 1); x >>= 1)
+        ++i;
+    return i;
+#endif
+}
+
+static int count_bits(uint64_t x)
+{
+    x -= (x >> 1) & 0x5555555555555555ULL;
+    x = (x & 0x3333333333333333ULL) + ((x >> 2) & 0x3333333333333333ULL);
+    x = (x + (x >> 4)) & 0x0F0F0F0F0F0F0F0FULL;
+    return (int)((x * ONES) >> 56);
+}
+
+#ifdef LC_SSE2
+/*
+ * Bit i of `masks[0]`, `[1]` and `[2]` is set if `p[i]` is a '\n', one of
+ * the `n` `specials`, or a byte other than a space, for 64 bytes.
+ */
+static void block_masks(const __m128i *specials, int n, const char *p,
+                        uint64_t masks[3])
+{
+    const __m128i newline = _mm_set1_epi8('\n');
+    const __m128i space = _mm_set1_epi8(' ');
+    const __m128i zero = _mm_setzero_si128();
+    __m128i x0 = _mm_loadu_si128((const __m128i *)p);
+    __m128i x1 = _mm_loadu_si128((const __m128i *)(p + 16));
+    __m128i x2 = _mm_loadu_si128((const __m128i *)(p + 32));
+    __m128i x3 = _mm_loadu_si128((const __m128i *)(p + 48));
+    __m128i h0 = zero, h1 = zero, h2 = zero, h3 = zero;
+    int i;
+
+#define MOVEMASK(x, j) ((uint64_t)(unsigned)_mm_movemask_epi8(x) << (j))
+/* The bytes up to ' ' saturate to 0 */
+#define SPACES(x, j) MOVEMASK(_mm_cmpeq_epi8(_mm_subs_epu8(x, space), zero), j)
+    for (i = 0; i < n; ++i) {
+        h0 = _mm_or_si128(h0, _mm_cmpeq_epi8(x0, specials[i]));
+        h1 = _mm_or_si128(h1, _mm_cmpeq_epi8(x1, specials[i]));
+        h2 = _mm_or_si128(h2, _mm_cmpeq_epi8(x2, specials[i]));
+        h3 = _mm_or_si128(h3, _mm_cmpeq_epi8(x3, specials[i]));
+    }
+    masks[0] = MOVEMASK(_mm_cmpeq_epi8(x0, newline), 0)
+        | MOVEMASK(_mm_cmpeq_epi8(x1, newline), 16)
+        | MOVEMASK(_mm_cmpeq_epi8(x2, newline), 32)
+        | MOVEMASK(_mm_cmpeq_epi8(x3, newline), 48);
+    masks[1] = MOVEMASK(h0, 0) | MOVEMASK(h1, 16)
+        | MOVEMASK(h2, 32) | MOVEMASK(h3, 48);
+    masks[2] = ~(SPACES(x0, 0) | SPACES(x1, 16)
+                 | SPACES(x2, 32) | SPACES(x3, 48));
+#undef SPACES
+#undef MOVEMASK
+}
+#else
+/*
+ * Same as above, eight bytes at a time: the high bit of a byte of
+ * `~(((y & LOW7) + LOW7) | y)` is set if and only if the byte of `y` is 0,
+ * and the high bits are gathered into the top byte by the multiplication.
+ */
+#define GATHER(h) ((((h) >> 7) * 0x0102040810204080ULL) >> 56)
+
+static void block_masks(const uint64_t *specials, int n, const char *p,
+                        uint64_t masks[3])
+{
+    int i, j;
+
+    masks[0] = masks[1] = masks[2] = 0;
+    for (j = 0; j < 64; j += 8) {
+        uint64_t x, y, hits = 0;
+        memcpy(&x, p + j, 8);
+        for (i = 0; i < n; ++i) {
+            y = x ^ specials[i];
+            hits |= ~(((y & LOW7) + LOW7) | y);
+        }
+        y = x ^ NEWLINE;
+        masks[0] |= GATHER(~(((y & LOW7) + LOW7) | y) & HIGHS) << j;
+        masks[1] |= GATHER(hits & HIGHS) << j;
+        masks[2] |= GATHER((((x & LOW7) + ONES * (0x80 - '!')) | x)
+                           & HIGHS) << j;
+    }
+}
+#endif
+
+/*
+ * Return the first byte of `p` before `limit` of one of the kinds of
+ * `stops`, sixteen bytes at a time with SSE2, else eight bytes at a time
+ * as in `count_newlines`: a word has a zero byte if and only if
+ * `(y - ONES) & ~y & HIGHS` is not 0.
+ */
+static const char *skip(const struct stop_set *stops,
+                        const unsigned char *kinds, const char *p,
+                        const char *limit)
+{
+    int i;
+
+#ifdef LC_SSE2
+    while (stops->n > 0 && limit - p >= 16) {
+        __m128i x = _mm_loadu_si128((const __m128i *)p);
+        __m128i hits = _mm_cmpeq_epi8(x, stops->words[0]);
+        unsigned mask;
+        for (i = 1; i < stops->n; ++i)
+            hits = _mm_or_si128(hits, _mm_cmpeq_epi8(x, stops->words[i]));
+        mask = (unsigned)_mm_movemask_epi8(hits);
+        if (mask)
+            return p + lowest_bit(mask);
+        p += 16;
+    }
+#else
+    while (stops->n > 0 && limit - p >= 8) {
+        uint64_t x, hits = 0;
+        memcpy(&x, p, 8);
+        for (i = 0; i < stops->n; ++i) {
+            uint64_t y = x ^ stops->words[i];
+            hits |= (y - ONES) & ~y & HIGHS;
+        }
+        if (hits)
+            break;
+        p += 8;
+    }
+#endif
+    while (p < limit && !(kinds[(unsigned char)*p] & stops->kinds))
+        ++p;
+    return p;
+}
+
+/*
+ * Classify the lines from `p`, the start of a line, up to the first byte
+ * of `stops`, 64 bytes at a time. Such a line is of the `kind` if it has
+ * a byte other than a space, and blank otherwise: adding these bytes to
+ * the bytes other than '\n' carries into the '\n' of their line.
+ * Return where it stopped, on the byte of `stops` or at the end of the
+ * last block, with the state of the line started before it.
+ */
+static const char *scan_lines(const struct stop_set *stops, int kind,
+                              struct sloc_state *s, const char *p,
+                              const char *limit)
+{
+    int i, n = stops->n, open = 0;
+    long long solids = 0, blanks = 0;
+    uint64_t solid = 0;     /* whether the open line has such a byte */
+
+    if (n < 0)
+        return p;
+    for (; limit - p >= 64; p += 64) {
+        uint64_t masks[3], newlines, before, lines, sum, carry;
+        int lines_solid, total;
+        block_masks(stops->words, n, p, masks);
+        newlines = masks[0];
+        /* The bytes before the first byte of `stops` */
+        before = masks[1] ? (masks[1] & -masks[1]) - 1 : ~(uint64_t)0;
+        lines = ~newlines & before;
+        sum = lines + (masks[2] & before);
+        carry = sum < lines;
+        sum += solid;
+        carry |= sum < solid;
+        /* The carry out of the block is that of the line left open */
+        lines_solid = count_bits(sum & newlines & before);
+        total = count_bits(newlines & before);
+        solids += lines_solid;
+        blanks += total - lines_solid;
+        if (masks[1]) {
+            i = lowest_bit(masks[1]);
+            open = 1;
+            solid = (sum >> i) & 1;
+            p += i;
+            break;
+        }
+        solid = carry;
+        open = !(newlines >> 63);
+    }
+    s->counts[kind] += solids;
+    s->counts[LC_BLANK] += blanks;
+    if (open) {
+        s->pending = 1;
+        if (kind == LC_CODE)
+            s->code = (int)solid;
+        else
+            s->comment = (int)solid;
+    }
+    return p;
+}
+
+static int matches(const char *p, const char *end, const char *marker,
+                   size_t len)
+{
+    return len && (size_t)(end - p) >= len && memcmp(p, marker, len) == 0;
+}
+
+static void end_line(struct sloc_state *s)
+{
+    s->counts[s->code ? LC_CODE : s->comment ? LC_COMMENT : LC_BLANK] += 1;
+    s->quote = s->line_comment = s->code = s->comment = s->pending = 0;
+}
+
+/*
+ * Classify the lines of `p` up to `limit`, and return where it stopped.
+ * The markers starting before `limit` are matched up to `end`.
+ * A line is code if it has a byte other than a space out of comments,
+ * else a comment if it has one in comments, and blank otherwise.
+ */
+static const char *classify(const struct classifier *cls,
+                            struct sloc_state *s, const char *p,
+                            const char *limit, const char *end)
+{
+    const struct lc_syntax *syntax = cls->syntax;
+    const unsigned char *kinds = cls->kinds;
+
+    while (p < limit) {
+        unsigned char c, kind;
+        int i, line = -1, block = -1;
+        size_t len = 0;
+
+        /* Most lines are scanned at once, the others byte by byte */
+        if (!s->pending && limit - p >= 64) {
+            const char *next = s->block < 0
+                ? scan_lines(&cls->code_marks, LC_CODE, s, p, limit)
+                : scan_lines(&cls->block_marks, LC_COMMENT, s, p, limit);
+            if (next != p) {
+                p = next;
+                continue;
+            }
+        }
+        c = *p, kind = kinds[c];
+
+        if (kind & K_NEWLINE) {
+            end_line(s);
+            ++p;
+            continue;
+        }
+        s->pending = 1;
+        if (s->line_comment) {
+            const char *newline = memchr(p, '\n', limit - p);
+            p = newline ? newline : limit;
+            continue;
+        }
+        if (s->block >= 0) {
+            i = s->block;
+            if ((kind & K_END) && matches(p, end, syntax->block_ends[i],
+                                          cls->end_lens[i])) {
+                s->block = -1;
+                s->comment = 1;
+                p += cls->end_lens[i];
+                continue;
+            }
+            if (!(kind & K_SPACE))
+                s->comment = 1;
+            ++p;
+            /* Only the end of the comment or of the line matter now */
+            if (s->comment)
+                p = skip(&cls->in_block, kinds, p, limit);
+            continue;
+        }
+        if (s->quote) {
+            if (c == '\\' && p + 1 < end && p[1] != '\n')
+                p += 2;
+            else {
+                if (c == s->quote)
+                    s->quote = 0;
+                ++p;
+            }
+            if (s->quote)
+                p = skip(&cls->in_string, kinds, p, limit);
+            continue;
+        }
+        if (kind & K_SPACE) {
+            ++p;
+            continue;
+        }
+        if (kind & K_START) {
+            /* The longest marker wins, as "--[[" over "--" in Lua */
+            for (i = 0; i < LC_MAX_MARKERS; ++i) {
+                if (cls->line_lens[i] > len && matches(
+                        p, end, syntax->line_comments[i], cls->line_lens[i]))
+                    line = i, block = -1, len = cls->line_lens[i];
+                if (cls->start_lens[i] > len && matches(
+                        p, end, syntax->block_starts[i], cls->start_lens[i]))
+                    block = i, line = -1, len = cls->start_lens[i];
+            }
+            if (line >= 0) {
+                s->line_comment = s->comment = 1;
+                p += len;
+                continue;
+            }
+            if (block >= 0) {
+                s->block = block;
+                s->comment = 1;
+                p += len;
+                continue;
+            }
+        }
+        s->code = 1;
+        if (kind & K_QUOTE)
+            s->quote = c;
+        ++p;
+        /* The line is code, only the markers and the quotes matter now */
+        if (!s->quote)
+            p = skip(&cls->in_code, kinds, p, limit);
+    }
+    return p;
+}
+
+/*
+ * Classify the lines of an opened file, the code, comment and blank lines
+ * are stored into `out_kinds[LC_CODE]`, `[LC_COMMENT]` and `[LC_BLANK]`.
+ * Their sum is the number of lines counted by `count_fd`.
+ */
+static int classify_fd(int fd, char *buffer, const struct classifier *cls,
+                       int sniff, const volatile int *cancel,
+                       long long *out_lines, long long *out_size,
+                       long long *out_kinds)
+{
+    struct sloc_state s = {-1, 0, 0, 0, 0, 0, {0, 0, 0}};
+    long long size = 0;
+    size_t kept = 0;
+
+    for (; ;) {
+        int len;
+        const char *p, *end, *limit;
+        if (cancel && *cancel)
+            return -1;
+        len = read(fd, buffer + kept, IO_BUF_SIZE - kept);
+        if (len < 0)
+            return -1;
+        if (sniff && size == 0 && len && is_binary(buffer, len)) {
+            out_kinds[LC_CODE] = out_kinds[LC_COMMENT] = 0;
+            out_kinds[LC_BLANK] = 0;
+            *out_lines = LC_BINARY;
+            *out_size = len;
+            return 0;
+        }
+        size += len;
+        end = buffer + kept + len;
+        limit = end;
+        if (len && end - buffer >= LC_MAX_MARKER)
+            limit = end - (LC_MAX_MARKER - 1);
+        else if (len)
+            limit = buffer;
+        p = classify(cls, &s, buffer, limit, end);
+        if (len == 0)
+            break;
+        kept = end - p;
+        memmove(buffer, p, kept);
+    }
+    if (s.pending)
+        end_line(&s);
+    out_kinds[LC_CODE] = s.counts[LC_CODE];
+    out_kinds[LC_COMMENT] = s.counts[LC_COMMENT];
+    out_kinds[LC_BLANK] = s.counts[LC_BLANK];
+    *out_lines = s.counts[LC_CODE] + s.counts[LC_COMMENT]
+        + s.counts[LC_BLANK];
+    *out_size = size;
+    return 0;
+}
+
+/*
+ * Same as `lines_count_many`, and in the same pass, the code, comment and
+ * blank lines of `paths[i]` are stored into `out_kinds[3 * i]`,
+ * `[3 * i + 1]` and `[3 * i + 2]`, with the comment syntax `syntaxes[i]`.
+ * A NULL syntax has no comments, nor strings. With `sniff`, the binary
+ * files are skipped as by `lines_count_text_many`.
+ */
+int lines_classify_many(const char **paths, int n,
+                        const struct lc_syntax **syntaxes, int sniff,
+                        long long *out_lines, long long *out_sizes,
+                        long long *out_kinds, const volatile int *cancel,
+                        long long *out_nanos)
+{
+    int i, fd, failed = 0;
+    long long start = 0;
+    struct classifier cls;
+    char *buffer = malloc(IO_BUF_SIZE);
+    if (buffer == NULL)
+        return -1;
+    prepare_classifier(&cls, NULL);
+    if (out_nanos)
+        start = now_ns();
+    for (i = 0; i < n; ++i) {
+        long long *kinds = &out_kinds[3 * i];
+        if (syntaxes[i] != cls.syntax)
+            prepare_classifier(&cls, syntaxes[i]);
+        fd = open(paths[i], O_RDONLY | O_BINARY);
+        if (fd < 0 || classify_fd(fd, buffer, &cls, sniff, cancel,
+                                  &out_lines[i], &out_sizes[i], kinds) < 0) {
+            out_lines[i] = out_sizes[i] = -1;
+            kinds[LC_CODE] = kinds[LC_COMMENT] = kinds[LC_BLANK] = 0;
+            ++failed;
+        }
+        if (fd >= 0)
+            close(fd);
+        if (out_nanos) {
+            long long end = now_ns();
+            out_nanos[i] = end - start;
+            start = end;
+        }
+    }
+    free(buffer);
+    return failed;
+}
+
+#ifndef BUILD_SHARED_OBJECT
+
+/* The byte-by-byte implementation used before, kept to benchmark against */
+#define LEGACY_BUF_SIZE 8192
+
+static char legacy_buffer[LEGACY_BUF_SIZE] = {EOF};
+static char *legacy_bufend = &legacy_buffer[LEGACY_BUF_SIZE];
+static char *legacy_bufptr = &legacy_buffer[2];
+static char legacy_last;
+
+static void legacy_flush_buffer(int fd)
+{
+    legacy_last = legacy_bufptr[-2];
+    int len = read(fd, legacy_buffer, LEGACY_BUF_SIZE - 1);
+    if (len < 0) len = 0;
+    legacy_buffer[len] = EOF;
+    legacy_bufptr = legacy_buffer;
+}
+
+static int legacy_lines_count(const char *filename)
 {
     char ch;
     int nlines = 0;
     int fd = open(filename, O_RDONLY | O_BINARY);
-    if (fd < 0) {
-        fprintf(stderr, "Can not open file: %s, %s\n",
-                filename, strerror(errno));
+    if (fd < 0)
         return 0;
-    }
 
-    flush_buffer(fd);
+    legacy_flush_buffer(fd);
     for (; ;) {
-        ch = peek();
+        ch = *legacy_bufptr++;
         switch (ch) {
             case '\n':
                 ++nlines;
                 break;
 
             case EOF:
-                if (bufptr < bufend) {
+                if (legacy_bufptr < legacy_bufend) {
                     close(fd);
-                    if (bufptr >= &buffer[2]) {
-                        last = bufptr[-2];
+                    if (legacy_bufptr >= &legacy_buffer[2]) {
+                        legacy_last = legacy_bufptr[-2];
                     }
-                    return nlines + (last != EOF && last != '\n');
+                    return nlines + (legacy_last != EOF && legacy_last != '\n');
                 }
-                flush_buffer(fd);
+                legacy_flush_buffer(fd);
                 break;
 
             default:
@@ -64,13 +863,64 @@ int lines_count(const char *filename)
     }
 }
 
-#ifndef BUILD_SHARED_OBJECT
-int main()
+static double benchmark(int (*count)(const char *), const char *filename,
+                        long long size)
 {
-    printf("%d\n", lines_count("lc.c"));            // 71
+    int i, rounds = 1;
+    clock_t start, elapsed;
+
+    /* Double the rounds until the measure lasts for at least 0.5s */
+    for (; ;) {
+        start = clock();
+        for (i = 0; i < rounds; ++i)
+            count(filename);
+        elapsed = clock() - start;
+        if (elapsed >= CLOCKS_PER_SEC / 2)
+            break;
+        rounds *= 2;
+    }
+    return (double)size * rounds / 1e9 / ((double)elapsed / CLOCKS_PER_SEC);
+}
+
+/*
+ * Usage: gcc -O2 lc.c -o lc && ./lc [FILE]...
+ * Count the test files, then benchmark the throughput of both
+ * implementations on the given files.
+ */
+int main(int argc, char *argv[])
+{
+    int i;
+    const char *tests[] = {"lc.c", "test/12.txt", "test/12345.txt"};
+    const char *defaults[] = {"test/12345.txt"};
+    const char **files = defaults;
+    int nfiles = 1;
+    long long lines[3], sizes[3];
+
     printf("%d\n", lines_count("test/12.txt"));     // 12
     printf("%d\n", lines_count("test/12345.txt"));  // 12345
 
+    lines_count_many(tests, 3, lines, sizes, NULL, NULL);
+    for (i = 0; i < 3; ++i)
+        printf("%-16s %8lld lines %10lld bytes\n", tests[i], lines[i], sizes[i]);
+
+    if (argc > 1) {
+        files = (const char **)&argv[1];
+        nfiles = argc - 1;
+    }
+    printf("%-24s %10s %10s %10s %10s\n",
+           "file", "lines", "legacy", "current", "speedup");
+    for (i = 0; i < nfiles; ++i) {
+        long long nlines, size;
+        double legacy, current;
+        if (lines_count_many(&files[i], 1, &nlines, &size, NULL, NULL)
+                || size == 0)
+            continue;
+        legacy = benchmark(legacy_lines_count, files[i], size);
+        current = benchmark(lines_count, files[i], size);
+        printf("%-24s %10lld %7.2fGB/s %7.2fGB/s %9.1fx\n",
+               files[i], nlines, legacy, current, current / legacy);
+    }
+
     return 0;
 }
 #endif
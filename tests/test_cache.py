@@ -0,0 +1,52 @@
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from codelines.cache import ResultCache
+from codelines.utils import FileEntry
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    # Two counts of the same directory, in two threads of the plugin host
+    def test_concurrent_saves(self):
+        errors = []
+
+        def save(n):
+            try:
+                for i in range(50):
+                    cache = ResultCache(self.directory, '/root', 'f', 1000)
+                    for j in range(200):
+                        cache.put(f'/root/{n}/{j}', FileEntry(
+                            f'/root/{n}/{j}', str(j), j, i, 0),
+                            'Python', 'py', j)
+                    cache.save()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=save, args=(n,))
+                   for n in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual([name for name in os.listdir(self.directory)
+                          if not name.endswith(ResultCache.suffix)], [])
+        cache = ResultCache(self.directory, '/root', 'f', 1000)
+        # Each count also keeps the entries of the other, once saved
+        self.assertIn(len(cache.entries), (200, 400))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from codelines import lc
+from codelines.engine import Engine, Task
+from codelines.export import Exporter, open_exporter
+from codelines.utils import FileEntry, Profiler
+
+
+# The Python counter, without the shared object
+def setUpModule():
+    lc.load_shared_object('')
+
+
+# Files that can not be walked past the first batch
+def failing_walk(top):
+    for i in range(300):
+        path = os.path.join(top, f'f{i}.py')
+        yield FileEntry(path, f'f{i}.py', 0, None, 0)
+    raise OSError('walk failed')
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.top = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.top)
+
+    def test_exporter_is_abstract(self):
+        with self.assertRaises(TypeError):
+            Exporter(os.path.join(self.top, 'out'), self.top)
+
+    def count(self, format, filepaths):
+        engine = Engine({'cache': False, 'max_workers': 1})
+        path = os.path.join(self.top, f'out.{format}')
+        exporter = open_exporter(format, self.top, path)
+        results = engine.count_lines(Task(), self.top, filepaths,
+                                     Profiler(), exporter=exporter)
+        return path, results
+
+    def test_sqlite_is_released_when_the_count_fails(self):
+        with self.assertRaises(OSError):
+            self.count('sqlite', failing_walk(self.top))
+        path = os.path.join(self.top, 'out.sqlite')
+        connection = sqlite3.connect(path, timeout=0)
+        with connection:
+            connection.execute('INSERT INTO count VALUES (?, ?, ?)',
+                               (self.top, '', None))
+        connection.close()
+        os.remove(path)
+
+    def test_file_is_closed_when_the_count_fails(self):
+        for format in ('jsonl', 'csv'):
+            engine = Engine({'cache': False, 'max_workers': 1})
+            exporter = open_exporter(format, self.top,
+                                     os.path.join(self.top, 'out'))
+            with self.assertRaises(OSError):
+                engine.count_lines(Task(), self.top, failing_walk(self.top),
+                                   Profiler(), exporter=exporter)
+            self.assertTrue(exporter.fd.closed)
+
+    def test_sqlite_totals(self):
+        with open(os.path.join(self.top, 'a.py'), 'w') as fd:
+            fd.write('a\nb\n')
+        path, results = self.count('sqlite', [FileEntry(
+            os.path.join(self.top, 'a.py'), 'a.py', 4, None, 0)])
+        connection = sqlite3.connect(path)
+        self.assertEqual(connection.execute(
+            'SELECT files, lines FROM languages WHERE language IS NULL'
+        ).fetchall(), [(1, 2)])
+        connection.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
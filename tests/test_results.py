@@ -0,0 +1,38 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from codelines.results import Results
+from codelines.sizes import FolderSizes
+
+
+class TestEmptyResults(unittest.TestCase):
+    # The first batches of a count may hold only files ignored, in no
+    # language or binary, and be reported before any language is inserted
+    def test_report_without_languages(self):
+        results = Results('/root')
+        for _ in range(600):
+            results.insert_binary(10)
+        self.assertFalse(results)
+        self.assertIn('Languages', results.report())
+
+    def test_table_without_rows(self):
+        table = Results.table(Results.captions, {}, [0, 0, 0])
+        self.assertIn('Languages', table)
+
+    def test_report_after_first_language(self):
+        results = Results('/root')
+        results.insert('Python', 'py', '/root/a.py', 10, 2)
+        self.assertTrue(results)
+        self.assertIn('Python', results.report())
+
+    def test_sizes_without_files(self):
+        sizes = FolderSizes('/root', 10)
+        self.assertFalse(sizes)
+        self.assertIn('TotalSize', sizes.report())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from codelines.results import Results
+from codelines.snapshots import Snapshot
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    # Two counts of the same directory, in two threads of the plugin host
+    def test_concurrent_saves(self):
+        results = Results('/root')
+        for i in range(200):
+            results.insert('Python', 'py', f'/root/{i}.py', i, i)
+        errors = []
+
+        def save():
+            try:
+                for _ in range(50):
+                    Snapshot.save(self.directory, results, 3)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=save) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        folder = Snapshot.folder(self.directory, '/root')
+        self.assertEqual([name for name in os.listdir(folder)
+                          if not name.endswith(Snapshot.suffix)], [])
+        snapshots = Snapshot.list(self.directory)
+        self.assertTrue(1 <= len(snapshots) <= 3)
+        self.assertEqual(snapshots[0].lines, results.lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from codelines import lc
+from codelines.engine import Engine, Task
+from codelines.ignore import Rules
+from codelines.utils import Profiler, Walker
+
+
+class TestCancelWalk(unittest.TestCase):
+    folders = 400
+
+    @classmethod
+    def setUpClass(cls):
+        cls.top = tempfile.mkdtemp()
+        for i in range(cls.folders):
+            folder = os.path.join(cls.top, f'd{i}')
+            os.mkdir(folder)
+            for j in range(5):
+                with open(os.path.join(folder, f'f{j}.py'), 'w') as fd:
+                    fd.write('x = 1\n')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.top)
+
+    # No file matches, and each file takes 1ms to be refused, so that the
+    # walk takes about 2s and never fills a batch
+    def slow_walker(self):
+        def match(path):
+            time.sleep(0.001)
+            return False
+        return Walker(self.top, match=match)
+
+    def test_walker_stops_once_cancelled(self):
+        cancel = lc.CancelFlag()
+        cancel.set()
+        walker = Walker(self.top, cancel=cancel)
+        self.assertEqual(list(walker), [])
+        self.assertEqual(walker.folders, 0)
+
+    def test_cancel_while_nothing_matches(self):
+        engine = Engine({'cache': False, 'max_workers': 1})
+        task = Task()
+        walker = self.slow_walker()
+        timer = threading.Timer(0.2, task.cancel)
+        timer.start()
+        start = time.perf_counter()
+        results = engine.count_lines(task, self.top, walker, Profiler())
+        elapsed = time.perf_counter() - start
+        timer.join()
+        self.assertEqual(task.stopped, 'cancelled')
+        self.assertFalse(results)
+        self.assertLess(elapsed, 0.2 + 0.5)
+        self.assertLess(walker.files, 5 * self.folders)
+
+    def test_deadline_while_nothing_matches(self):
+        engine = Engine({'cache': False, 'max_workers': 1,
+                         'max_seconds': 0.2})
+        task = Task()
+        start = time.perf_counter()
+        engine.count_lines(task, self.top, self.slow_walker(), Profiler())
+        self.assertEqual(task.stopped, '0.2s elapsed')
+        self.assertLess(time.perf_counter() - start, 0.2 + 0.5)
+
+
+class TestIgnoreTop(unittest.TestCase):
+    def setUp(self):
+        self.repository = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.repository, '.git'))
+        with open(os.path.join(self.repository, '.gitignore'), 'w') as fd:
+            fd.write('sub/*.log\n')
+        self.top = os.path.join(self.repository, 'sub')
+        os.mkdir(self.top)
+        for name in ('a.py', 'a.log'):
+            with open(os.path.join(self.top, name), 'w') as fd:
+                fd.write('x = 1\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.repository)
+
+    # The rules of the parents apply whatever the separators of the root
+    def test_root_not_normalized(self):
+        engine = Engine({'cache': False, 'use_ignore_files': True,
+                         'use_git_index': False})
+        for top in (self.top + os.sep,
+                    self.repository + os.sep * 2 + 'sub'):
+            names = [entry.name for entry in engine.walk(top)]
+            self.assertEqual(names, ['a.py'], top)
+
+    def test_rules_do_not_match_outside_their_base(self):
+        rules = Rules(self.top, ['*.log'])
+        self.assertTrue(rules.match(os.path.join(self.top, 'a.log'), False))
+        self.assertIsNone(rules.match(
+            os.path.join(self.repository, 'a.log'), False))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from codelines import lc
+from codelines.engine import Engine, Task
+from codelines.utils import Profiler
+
+
+# The Python counter, without the shared object
+def setUpModule():
+    lc.load_shared_object('')
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as fd:
+        fd.write(text)
+
+
+class TestWatch(unittest.TestCase):
+    def setUp(self):
+        self.top = tempfile.mkdtemp()
+        write(os.path.join(self.top, 'a.py'), 'a\nb\n')
+        write(os.path.join(self.top, '.gitignore'), 'build/\n')
+        self.engine = Engine({'cache': False, 'max_workers': 1})
+        self.index = self.engine.watch(Task(), [self.top], Profiler())
+        # A save must not walk the folders
+        self.engine.walk_roots = None
+
+    def tearDown(self):
+        shutil.rmtree(self.top)
+
+    def lines(self):
+        return self.index.totals[2]
+
+    def test_save_counts_the_file_again(self):
+        path = os.path.join(self.top, 'a.py')
+        write(path, 'a\nb\nc\n')
+        self.index.saved(self.engine, path)
+        self.assertEqual(self.lines(), 3)
+        self.assertIn('(+1)', self.index.status())
+
+    def test_save_counts_a_new_file(self):
+        path = os.path.join(self.top, 'src', 'b.py')
+        write(path, 'a\n')
+        self.index.saved(self.engine, path)
+        self.assertEqual(self.lines(), 3)
+
+    def test_save_skips_the_files_excluded_from_the_walk(self):
+        for path in (os.path.join(self.top, 'build', 'b.py'),
+                     os.path.join(self.top, '.hidden', 'b.py'),
+                     os.path.join(self.top, '.b.py')):
+            write(path, 'a\n')
+            self.index.saved(self.engine, path)
+        self.assertEqual(self.lines(), 2)
+
+    def test_sweep_finds_the_changes(self):
+        del self.engine.walk_roots
+        write(os.path.join(self.top, 'c.py'), 'a\n')
+        os.remove(os.path.join(self.top, 'a.py'))
+        self.assertEqual(self.index.sweep(self.engine), 2)
+        self.assertEqual(self.lines(), 1)
+
+    # The budgets of the reports do not stop the indexing
+    def test_budgets_do_not_apply(self):
+        for i in range(20):
+            write(os.path.join(self.top, f'd{i}', 'b.py'), 'a\n')
+        engine = Engine({'cache': False, 'max_workers': 1, 'max_files': 5,
+                         'max_bytes': 1})
+        task = Task()
+        index = engine.watch(task, [self.top], Profiler())
+        self.assertIsNone(task.stopped)
+        self.assertEqual(index.totals[1:3], [21, 22])
+
+
+if __name__ == '__main__':
+    unittest.main()